@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""
+adaptive.py
+
+The adaptive 'auto' compression mode.
+
+A sample of the source tree is compressed with each available
+ADAPTIVE_CANDIDATES (mode, level) pair.  The measured time, cpu time and
+ratio are scaled up to the full tree size, then the candidate producing
+the smallest output while meeting the caller's target is chosen.
+
+Targets are dictionaries of any of:
+    max_time:   wall seconds the compression should finish within
+    max_cpu:    cpu seconds it may use
+    max_size:   bytes the archive should fit in
+    prefer:     'size' (default) picks the smallest fitting output,
+                'time' picks the fastest fitting candidate
+
+If no candidate meets the target, the fastest one is chosen and the
+decision is recorded as not met.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import os
+import random
+import shutil
+import stat
+import tempfile
+
+from DeComp.definitions import ADAPTIVE_TIME_FACTOR
+from DeComp.utils import run_command
+
+
+# Seed of the file sampling, the same tree is always sampled the same
+SEED = 0x5a3
+
+# The accepted target keys
+TARGET_KEYS = {"max_time", "max_cpu", "max_size", "prefer"}
+
+
+def _tree_files(path):
+    """Returns the (size, path) list of the tree's regular files,
+    hardlinked files once"""
+    files = []
+    seen = set()
+    for root, _dirs, names in os.walk(path):
+        for name in names:
+            filepath = os.path.join(root, name)
+            try:
+                info = os.lstat(filepath)
+            except OSError:
+                continue
+            if not stat.S_ISREG(info.st_mode):
+                continue
+            if info.st_nlink > 1:
+                if (info.st_dev, info.st_ino) in seen:
+                    continue
+                seen.add((info.st_dev, info.st_ino))
+            files.append((info.st_size, filepath))
+    return files
+
+
+def sample_tree(path, sample_size, destination):
+    """Copies a random sample of the tree's files into destination.
+    Files larger than a sample chunk only have a chunk copied,
+    read from a random offset.
+
+    :param path: the source tree
+    :type path: string
+    :param sample_size: the number of bytes to sample
+    :type sample_size: integer
+    :param destination: the existing directory to copy the sample to
+    :type destination: string
+    :returns: (total bytes, sampled bytes) tuple, sampled bytes is None
+              if the tree is no larger than the sample size
+    """
+    files = _tree_files(path)
+    total = sum(x[0] for x in files)
+    if total <= sample_size:
+        return total, None
+    rng = random.Random(SEED)
+    rng.shuffle(files)
+    chunk = max(65536, sample_size // 32)
+    sampled = 0
+    for index, (size, filepath) in enumerate(files):
+        if sampled >= sample_size:
+            break
+        try:
+            with open(filepath, 'rb') as source:
+                if size > chunk:
+                    source.seek(rng.randrange(0, size - chunk + 1, 4096))
+                data = source.read(chunk)
+        except (IOError, OSError):
+            continue
+        with open(os.path.join(destination, "%06d" % index), 'wb') as output:
+            output.write(data)
+        sampled += len(data)
+    return total, sampled
+
+
+def _measure(compressor, mode, level, infodict, logger):
+    """Compresses the sample with one candidate
+
+    :returns: dictionary of the candidate's measurements
+    """
+    candidate = {"mode": mode, "level": level, "success": False}
+    cmdinfo = compressor.create_infodict(
+        infodict['source'], None, infodict['basedir'], infodict['filename'],
+        mode, False, infodict['arch'], infodict['other_options'])
+    if level is not None:
+        cmdinfo['codec_options'] = {'level': level}
+    args, env = compressor.build_command(cmdinfo)
+    if not args:
+        return candidate
+    stats = run_command(args, "adaptive %s" % mode, env=env)
+    try:
+        size = os.path.getsize(cmdinfo['filename'])
+        os.unlink(cmdinfo['filename'])
+    except OSError:
+        size = None
+    if stats.returncode != 0 or size is None:
+        logger.warning("COMPRESS: adaptive; candidate %s level %s failed",
+                       mode, level)
+        return candidate
+    candidate.update(success=True, wall_time=stats.wall_time,
+                     cpu_time=(stats.user_time or 0) + (stats.sys_time or 0),
+                     size=size)
+    return candidate
+
+
+def _select(candidates, target):
+    """Returns the (candidate, met) choice of the measured candidates"""
+    usable = [x for x in candidates if x["success"]]
+    if not usable:
+        return None, False
+    fits = []
+    for candidate in usable:
+        if target.get("max_time") is not None and \
+                candidate["est_time"] > target["max_time"]:
+            continue
+        if target.get("max_cpu") is not None and \
+                candidate["est_cpu"] > target["max_cpu"]:
+            continue
+        if target.get("max_size") is not None and \
+                candidate["est_size"] > target["max_size"]:
+            continue
+        fits.append(candidate)
+    if not [x for x in TARGET_KEYS if x != "prefer" and
+            target.get(x) is not None]:
+        fastest = min(x["est_time"] for x in fits)
+        fits = [x for x in fits
+                if x["est_time"] <= fastest * ADAPTIVE_TIME_FACTOR]
+    if not fits:
+        return min(usable, key=lambda x: x["est_time"]), False
+    if target.get("prefer", "size") == "time":
+        return min(fits, key=lambda x: (x["est_time"], x["est_size"])), True
+    return min(fits, key=lambda x: (x["est_size"], x["est_time"])), True
+
+
+def choose_mode(compressor, infodict, target, candidates, sample_size,
+                logger):
+    """Measures the candidates on a sample of the infodict's source
+    and chooses the mode to compress it with
+
+    :param compressor: the compression definitions
+    :type compressor: CompressMap
+    :param infodict: dict as returned by the compressor's create_infodict()
+    :type infodict: dictionary
+    :param target: the target dictionary, see the module docstring
+    :type target: dictionary
+    :param candidates: the (mode, level) pairs to measure
+    :type candidates: list of tuples
+    :param sample_size: the number of bytes to sample
+    :type sample_size: integer
+    :param logger: logging module instance
+    :type logger: logging
+    :returns: dictionary of the decision or None if nothing could be run
+    """
+    target = dict(target or {})
+    unknown = set(target) - TARGET_KEYS
+    if unknown or target.get("prefer", "size") not in ("size", "time"):
+        logger.error("COMPRESS: adaptive; invalid target: %s", target)
+        return None
+    candidates = [x for x in candidates if compressor.is_enabled(x[0])]
+    if not candidates:
+        logger.error("COMPRESS: adaptive; none of the candidate modes "
+                     "are available")
+        return None
+    source = os.path.join(infodict['basedir'] or '.', infodict['source'])
+    workdir = tempfile.mkdtemp(prefix="decomp-adaptive-")
+    try:
+        sample_dir = os.path.join(workdir, "sample")
+        os.makedirs(sample_dir)
+        total, sampled = sample_tree(source, sample_size, sample_dir)
+        if sampled:
+            sample = {'basedir': workdir, 'source': "sample"}
+        else:
+            # small enough, measure the tree itself
+            sample = {'basedir': infodict['basedir'],
+                      'source': infodict['source']}
+            sampled = total
+        sample.update(filename=os.path.join(workdir, "candidate"),
+                      arch=infodict['arch'],
+                      other_options=infodict['other_options'])
+        measured = [_measure(compressor, mode, level, sample, logger)
+                    for mode, level in candidates]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    scale = float(total) / sampled if sampled else 1.0
+    for candidate in measured:
+        if candidate["success"]:
+            candidate["est_time"] = candidate["wall_time"] * scale
+            candidate["est_cpu"] = candidate["cpu_time"] * scale
+            candidate["est_size"] = int(candidate["size"] * scale)
+    choice, met = _select(measured, target)
+    if choice is None:
+        logger.error("COMPRESS: adaptive; all of the candidates failed")
+        return None
+    logger.info("COMPRESS: adaptive; chose %s level %s, target met: %s",
+                choice["mode"], choice["level"], met)
+    return {
+        "mode": choice["mode"],
+        "level": choice["level"],
+        "met": met,
+        "target": target,
+        "total_bytes": total,
+        "sample_bytes": sampled,
+        "candidates": measured,
+    }
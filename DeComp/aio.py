@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+"""
+aio.py
+
+asyncio versions of the CompressMap and ContentsMap classes.
+
+They add the acompress(), aextract(), arsync() and acontents() coroutines
+which use the same definitions and command building as the synchronous
+API, but run the utility with asyncio.create_subprocess_exec().
+The utility is started in its own process group, so cancelling the
+coroutine kills it and every process it started.
+
+Definitions using an external function, or an internal one without
+a command builder, are run in the loop's default executor instead.
+Those can not be killed on cancellation.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import asyncio
+import os
+import signal
+import time
+from asyncio.subprocess import PIPE
+
+from DeComp import log
+from DeComp.compress import CompressMap
+from DeComp.contents import ContentsMap
+from DeComp.results import OperationResult, ProcessStats
+from DeComp.utils import command_args
+
+
+def _kill_group(proc):
+    """Kills the process group of the subprocess"""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def _wait(proc):
+    """Waits for the subprocess to finish, killing its process group
+    if the waiting task is cancelled
+
+    :param proc: the started subprocess
+    :type proc: asyncio.subprocess.Process
+    :returns: integer, the process's return code
+    """
+    try:
+        return await proc.wait()
+    except asyncio.CancelledError:
+        _kill_group(proc)
+        await proc.wait()
+        raise
+
+
+async def asubcmd(command, exc="", env=None, debug=False):
+    """asyncio version of utils.subcmd()
+
+    :param command: argv list to run directly or
+                    a command string to run with bash
+    :type command: list or string
+    :param exc: command name being run (used for the log)
+    :type exc: string
+    :param env: the environment to run the command in
+    :type env: dictionary
+    :param debug: optional default: False
+    :type debug: boolean
+    :returns: boolean
+    """
+    stats = await arun_command(command, exc, env, debug)
+    return stats.returncode == 0
+
+
+async def arun_command(command, exc="", env=None, debug=False):
+    """asyncio version of utils.run_command().
+    The event loop reaps the child, so only the wall time is measured.
+
+    :param command: argv list to run directly or
+                    a command string to run with bash
+    :type command: list or string
+    :param exc: command name being run (used for the log)
+    :type exc: string
+    :param env: the environment to run the command in
+    :type env: dictionary
+    :param debug: optional default: False
+    :type debug: boolean
+    :returns: ProcessStats
+    """
+    env = env or {}
+    args = command_args(command, env, debug)
+    log.debug("asubcmd(); args = %s", args)
+    start = time.time()
+    proc = await asyncio.create_subprocess_exec(*args, env=env,
+                                                start_new_session=True)
+    returncode = await _wait(proc)
+    if returncode != 0:
+        log.debug("asubcmd() NON-zero return value from: %s", exc)
+    return ProcessStats(returncode, time.time() - start, None, None, None)
+
+
+class AsyncCompressMap(CompressMap):
+    """CompressMap with the asyncio coroutine versions of its functions"""
+
+    async def acompress(self, infodict=None, filename='', source=None,
+                        basedir='.', mode=None, auto_extension=False,
+                        arch=None, other_options=None, target=None,
+                        digests=None, digest_file=False, level=None,
+                        threads=None, memory_limit=None, window=None):
+        """Compression coroutine, see compress() for the parameters.
+        The infodict is prepared in the executor, as the adaptive 'auto'
+        mode and the archive cache walk the source tree.
+
+        :returns: OperationResult, false if it failed or could not be run
+        """
+        if not self.compress:
+            return False
+        loop = asyncio.get_running_loop()
+        infodict, result = await loop.run_in_executor(
+            None, self._compress_prepare, infodict, filename, source,
+            basedir, mode, auto_extension, arch, other_options, target,
+            digests, digest_file,
+            self._codec_request(level, threads, memory_limit, window))
+        if infodict is None:
+            return result
+        result = await self._arun_digested(infodict)
+        if self.cache is not None and result:
+            await loop.run_in_executor(None, self._cache_store, infodict)
+        return result
+
+
+    async def aextract(self, infodict=None, source=None, destination=None,
+                       mode=None, other_options=None, digests=None,
+                       verify=None, threads=None, memory_limit=None,
+                       window=None):
+        """De-compression coroutine, see extract() for the parameters.
+        The infodict is prepared in the executor, as the 'auto' mode
+        and the DIGESTS sidecar file read the disk.
+
+        :returns: OperationResult, false if it failed or could not be run
+        """
+        loop = asyncio.get_running_loop()
+        infodict = await loop.run_in_executor(
+            None, self._extract_prepare, infodict, source, destination, mode,
+            other_options, digests, verify,
+            self._codec_request(None, threads, memory_limit, window))
+        if not infodict:
+            return False
+        return await self._arun_digested(infodict)
+
+
+    async def arsync(self, infodict=None, source=None, destination=None,
+                     mode=None, native=True):
+        """rsync transfer coroutine, see rsync() for the parameters
+
+        :returns: OperationResult
+        """
+        if not infodict:
+            infodict = self.create_infodict(source, destination,
+                                            mode=mode or 'rsync')
+        start = time.time()
+        if native and self._native_copy(infodict):
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(None, self._tree_copy, infodict)
+            return self._finish(result, infodict, start)
+        args = self._common_command(infodict)
+        if not args:
+            return self._finish(False, infodict, start)
+        return self._finish(await self._aexec(args, infodict), infodict, start)
+
+
+    async def _arun_digested(self, infodict):
+        """Internal coroutine, the asyncio version of _run_digested().
+        The digesting relay is a thread, so the modes using it
+        are run in the executor.
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: OperationResult or False
+        """
+        stream = self._digest_stream(infodict)
+        if stream is False:
+            return False
+        if stream is None:
+            return await self._arun(infodict)
+        loop = asyncio.get_running_loop()
+        with stream:
+            return await loop.run_in_executor(None, self._run, infodict)
+
+
+    async def _arun(self, infodict):
+        """Internal coroutine that runs the designated function
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: OperationResult or False
+        """
+        if not self.is_supported(infodict['mode']):
+            self.logger.error("mode: %s is not supported in the current %s "
+                              "definitions", infodict['mode'],
+                              self.loaded_type[1]
+                             )
+            return False
+        if self._get_command_builder(infodict['mode']) is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._run, infodict)
+        start = time.time()
+        args = self._get_command(infodict)
+        if not args:
+            return False
+        return self._finish(await self._aexec(args, infodict), infodict, start)
+
+
+    async def _aexec(self, args, infodict):
+        """Runs the command built for the infodict
+
+        :param args: the command to run
+        :type args: list or string
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: OperationResult
+        """
+        stats = await arun_command(args, self._map[infodict['mode']].id,
+                                   env=self._run_env(infodict))
+        return OperationResult(None, infodict['mode'], stats.returncode == 0,
+                               stats)
+
+
+class AsyncContentsMap(ContentsMap):
+    """ContentsMap with the asyncio coroutine version of contents()"""
+
+    async def acontents(self, source, destination, mode="auto",
+                        verbose=False):
+        """Contents listing coroutine, see contents() for the parameters
+
+        :returns: string, list of the contents or the destination path
+        """
+        if mode in ['auto']:
+            mode = self.determine_mode(source)
+        if self._map[mode].func != "_common" or \
+                (self.index is not None and self._tar_format(mode)):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None, self.contents, source, destination, mode, verbose)
+        _cmd = self._command(source, destination, self._map[mode].cmd,
+                             self._map[mode].args)
+        start = time.time()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *_cmd, stdout=PIPE, stderr=PIPE, start_new_session=True)
+        except OSError as error:
+            self.logger.error("ContentsMap: acontents(); OSError: %s, %s",
+                              str(error), ' '.join(_cmd))
+            return ''
+        try:
+            if destination:
+                stdout, stderr = await asyncio.gather(
+                    self._awrite(proc.stdout, destination),
+                    proc.stderr.read())
+            else:
+                stdout, stderr = await proc.communicate()
+                stdout = stdout.decode('UTF-8')
+        except asyncio.CancelledError:
+            _kill_group(proc)
+            await proc.wait()
+            raise
+        returncode = await _wait(proc)
+        stats = ProcessStats(returncode, time.time() - start, None, None, None)
+        if destination:
+            output_bytes = os.path.getsize(stdout) if stdout else 0
+        else:
+            output_bytes = len(stdout)
+        self._finish(mode, source, start, output_bytes,
+                     returncode == 0 and stdout != '', stats)
+        stderr = stderr.decode('UTF-8')
+        if destination:
+            for line in stderr.splitlines():
+                self.logger.warning("ContentsMap: %s: %s", _cmd[0], line)
+            return stdout
+        result = "\n".join([stdout, stderr])
+        if verbose:
+            self.logger.info(result)
+        return result
+
+
+    async def _awrite(self, stream, destination):
+        """Streams the listing lines to the destination file
+
+        :param stream: the listing process's stdout
+        :type stream: asyncio.StreamReader
+        :param destination: file path to write the listing to
+        :type destination: string
+        :returns: string, the destination path or '' on failure
+        """
+        try:
+            with open(destination, 'wb') as output:
+                while True:
+                    line = await stream.readline()
+                    if not line:
+                        break
+                    output.write(line)
+        except (IOError, OSError) as error:
+            self.logger.error("ContentsMap: acontents(); failed to write: "
+                              "%s, %s", destination, str(error))
+            # drain the pipe so the listing process can finish
+            while await stream.read(65536):
+                pass
+            return ''
+        return destination
@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+
+"""
+bench.py
+
+Benchmark harness for the compression and decompression definitions.
+
+It builds reproducible synthetic source trees, then runs every available
+mode of the COMPRESS_DEFINITIONS over them, extracting each archive again
+with the matching DECOMPRESS_DEFINITIONS mode.  The resulting matrix of
+throughput, ratio, peak RSS and cpu seconds is written as JSON and printed
+as a table.  Two saved runs can be compared to catch regressions after a
+definition's args change.
+
+Usage:
+    python -m DeComp.bench [-o results.json] [-m xz,zstd] [-t small_text]
+                           [-s SCALE] [-r REPEAT] [-w WORKDIR]
+    python -m DeComp.bench --compare old.json new.json [--threshold 0.1]
+
+The trees are read from the page cache after being built, so the numbers
+are for warm caches.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from DeComp import __version__
+from DeComp import log
+from DeComp.compress import CompressMap
+from DeComp.definitions import (COMPRESS_DEFINITIONS, DECOMPRESS_DEFINITIONS)
+from DeComp.scheduler import cpu_count
+
+
+# Seed of the tree generators, the trees are identical across runs
+SEED = 0x5eed
+
+# Block size used to write the generated data
+BLOCK = 1 << 20
+
+# Modes not benchmarked, they do not compress
+SKIP_MODES = {"rsync"}
+
+# The result matrix columns: (key, table heading, format, higher is better)
+METRICS = [
+    ("ratio", "ratio", "%.3f", False),
+    ("compress_mbps", "comp MB/s", "%.1f", True),
+    ("extract_mbps", "extr MB/s", "%.1f", True),
+    ("compress_rss", "comp RSS KiB", "%d", False),
+    ("extract_rss", "extr RSS KiB", "%d", False),
+    ("compress_cpu", "comp cpu s", "%.2f", False),
+    ("extract_cpu", "extr cpu s", "%.2f", False),
+]
+
+
+def _words(rng, count=512):
+    """Returns a vocabulary of random lower case words"""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return [''.join(rng.choice(letters) for _x in range(rng.randint(2, 10)))
+            for _y in range(count)]
+
+
+def build_small_text(path, rng, scale=1.0):
+    """Many small text files spread over a directory hierarchy
+
+    :param path: the directory to create the files in
+    :type path: string
+    :param rng: seeded random number generator
+    :type rng: random.Random
+    :param scale: multiplier of the number of files
+    :type scale: float
+    """
+    words = _words(rng)
+    for index in range(int(2000 * scale)):
+        directory = os.path.join(path, "d%02d" % (index % 40),
+                                 "s%d" % (index % 7))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(os.path.join(directory, "f%05d.txt" % index), 'w',
+                  encoding='UTF-8') as output:
+            lines = []
+            for _line in range(rng.randint(10, 80)):
+                lines.append(' '.join(rng.choices(words, k=rng.randint(4, 14))))
+            output.write('\n'.join(lines) + '\n')
+
+
+def build_large_binary(path, rng, scale=1.0):
+    """A few large files alternating random and repetitive blocks,
+    like the typical mix of compressed and uncompressed data in binaries
+
+    :param path: the directory to create the files in
+    :type path: string
+    :param rng: seeded random number generator
+    :type rng: random.Random
+    :param scale: multiplier of the file sizes
+    :type scale: float
+    """
+    pattern = rng.randbytes(4096) * (BLOCK // 4096)
+    for index in range(3):
+        with open(os.path.join(path, "blob%d.bin" % index), 'wb') as output:
+            for block in range(max(1, int(8 * scale))):
+                if (block + index) % 2:
+                    output.write(rng.randbytes(BLOCK))
+                else:
+                    output.write(pattern)
+
+
+def build_sparse(path, rng, scale=1.0):
+    """Large sparse files holding only a few data blocks
+
+    :param path: the directory to create the files in
+    :type path: string
+    :param rng: seeded random number generator
+    :type rng: random.Random
+    :param scale: multiplier of the file sizes
+    :type scale: float
+    """
+    size = max(4, int(64 * scale)) * BLOCK
+    for index in range(4):
+        with open(os.path.join(path, "sparse%d.img" % index), 'wb') as output:
+            output.truncate(size)
+            for _block in range(4):
+                output.seek(rng.randrange(0, size - BLOCK, 4096))
+                output.write(rng.randbytes(BLOCK // 4))
+
+
+def build_hardlinks(path, rng, scale=1.0):
+    """A tree where most of the entries are hard links to a few files
+
+    :param path: the directory to create the files in
+    :type path: string
+    :param rng: seeded random number generator
+    :type rng: random.Random
+    :param scale: multiplier of the number of files
+    :type scale: float
+    """
+    words = _words(rng)
+    originals = os.path.join(path, "store")
+    os.makedirs(originals)
+    for index in range(int(200 * scale)):
+        source = os.path.join(originals, "o%04d" % index)
+        with open(source, 'w', encoding='UTF-8') as output:
+            output.write(' '.join(rng.choices(words, k=2048)))
+        for link in range(5):
+            directory = os.path.join(path, "links%d" % link)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            os.link(source, os.path.join(directory, "l%04d" % index))
+
+
+# The synthetic source trees by name
+TREE_BUILDERS = {
+    "small_text": build_small_text,
+    "large_binary": build_large_binary,
+    "sparse": build_sparse,
+    "hardlinks": build_hardlinks,
+}
+
+
+def build_tree(workdir, name, scale=1.0):
+    """Builds one of the TREE_BUILDERS trees in the workdir
+
+    :param workdir: the directory to build the tree in
+    :type workdir: string
+    :param name: the TREE_BUILDERS key
+    :type name: string
+    :param scale: the tree size multiplier
+    :type scale: float
+    :returns: string, the tree's path
+    """
+    path = os.path.join(workdir, name)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    TREE_BUILDERS[name](path, random.Random(SEED), scale)
+    return path
+
+
+def extract_mode(mode, decompressor):
+    """Returns the decompression mode able to extract the mode's archives
+
+    :param mode: the compression mode
+    :type mode: string
+    :param decompressor: the decompression definitions
+    :type decompressor: CompressMap
+    :returns: string
+    """
+    if decompressor.is_supported(mode):
+        return mode
+    if mode.startswith("squashfs"):
+        return "squashfs"
+    base = mode.split('_')[0]
+    if decompressor.is_supported(base):
+        return base
+    return "auto"
+
+
+def _best(results):
+    """Returns the fastest of the repeated results, or the first failure"""
+    for result in results:
+        if not result:
+            return result
+    return min(results, key=lambda x: x.wall_time)
+
+
+def _mbps(size, seconds):
+    """Returns the MB/s throughput or None"""
+    if not size or not seconds:
+        return None
+    return size / seconds / 1e6
+
+
+def bench_mode(compressor, decompressor, mode, tree, workdir, repeat=1):
+    """Compresses and extracts the tree with the mode
+
+    :param compressor: the compression definitions
+    :type compressor: CompressMap
+    :param decompressor: the decompression definitions
+    :type decompressor: CompressMap
+    :param mode: the compression mode
+    :type mode: string
+    :param tree: path of the source tree
+    :type tree: string
+    :param workdir: directory for the archives and extracted trees
+    :type workdir: string
+    :param repeat: the number of runs, the fastest one is kept
+    :type repeat: integer
+    :returns: dictionary, the result row
+    """
+    name = os.path.basename(tree)
+    row = {"tree": name, "mode": mode, "success": False}
+    filename = os.path.join(workdir, "%s-%s" % (name, mode))
+    archive = filename + compressor.extension_separator + \
+        compressor.extension(mode)
+    destination = os.path.join(workdir, "extract")
+    compressed = []
+    for _run in range(repeat):
+        if os.path.exists(archive):
+            os.unlink(archive)
+        compressed.append(compressor.compress(
+            filename=filename, source=name, basedir=os.path.dirname(tree),
+            mode=mode, auto_extension=True))
+    comp = _best(compressed)
+    row["compress"] = comp.as_dict() if comp else None
+    if not comp:
+        log.error("bench: compression failed: %s %s", name, mode)
+        return row
+    extracted = []
+    for _run in range(repeat):
+        if os.path.exists(destination):
+            shutil.rmtree(destination)
+        os.makedirs(destination)
+        extracted.append(decompressor.extract(
+            source=archive, destination=destination,
+            mode=extract_mode(mode, decompressor)))
+    extr = _best(extracted)
+    row["extract"] = extr.as_dict() if extr else None
+    shutil.rmtree(destination, ignore_errors=True)
+    if os.path.exists(archive):
+        os.unlink(archive)
+    row["ratio"] = comp.ratio
+    row["compress_mbps"] = _mbps(comp.input_bytes, comp.wall_time)
+    row["compress_rss"] = comp.max_rss
+    row["compress_cpu"] = comp.cpu_time
+    if not extr:
+        log.error("bench: extraction failed: %s %s", name, mode)
+        return row
+    row["extract_mbps"] = _mbps(extr.output_bytes, extr.wall_time)
+    row["extract_rss"] = extr.max_rss
+    row["extract_cpu"] = extr.cpu_time
+    row["success"] = True
+    return row
+
+
+def run(modes=None, trees=None, scale=1.0, repeat=1, workdir=None, env=None):
+    """Runs the benchmark matrix
+
+    :param modes: optional compression modes to run,
+                  default: all the available ones
+    :type modes: list of strings
+    :param trees: optional TREE_BUILDERS names, default: all of them
+    :type trees: list of strings
+    :param scale: the tree size multiplier
+    :type scale: float
+    :param repeat: the number of runs of each operation
+    :type repeat: integer
+    :param workdir: optional directory to work in, default: a temporary one
+    :type workdir: string
+    :param env: environment to run the utilities in,
+                default: a copy of the current one
+    :type env: dictionary
+    :returns: dictionary, the JSON serializable run report
+    """
+    if env is None:
+        env = dict(os.environ)
+    compressor = CompressMap(copy.deepcopy(COMPRESS_DEFINITIONS), env=env,
+                             measure_bytes=True)
+    decompressor = CompressMap(copy.deepcopy(DECOMPRESS_DEFINITIONS), env=env,
+                               measure_bytes=True)
+    if not modes:
+        modes = sorted(x for x in compressor.available_modes
+                       if x not in SKIP_MODES)
+    trees = trees or sorted(TREE_BUILDERS)
+    report = {
+        "version": __version__,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "host": os.uname()[1],
+        "cpus": cpu_count(),
+        "scale": scale,
+        "repeat": repeat,
+        "skipped": [],
+        "results": [],
+    }
+    tempdir = None
+    if workdir is None:
+        workdir = tempdir = tempfile.mkdtemp(prefix="decomp-bench-")
+    try:
+        for mode in modes:
+            if not compressor.is_enabled(mode):
+                report["skipped"].append(mode)
+        for name in trees:
+            tree = build_tree(workdir, name, scale)
+            for mode in modes:
+                if mode in report["skipped"]:
+                    continue
+                report["results"].append(bench_mode(
+                    compressor, decompressor, mode, tree, workdir, repeat))
+            shutil.rmtree(tree)
+    finally:
+        if tempdir:
+            shutil.rmtree(tempdir, ignore_errors=True)
+    return report
+
+
+def _cell(fmt, value):
+    """Formats a table cell"""
+    if value is None:
+        return '-'
+    return fmt % value
+
+
+def _table(headings, rows):
+    """Returns the rows as an aligned text table"""
+    widths = [max(len(str(x)) for x in column)
+              for column in zip(headings, *rows)]
+    lines = []
+    for row in [headings] + rows:
+        lines.append('  '.join(str(value).rjust(width) if pos > 1
+                               else str(value).ljust(width)
+                               for pos, (value, width)
+                               in enumerate(zip(row, widths))))
+    return '\n'.join(lines)
+
+
+def format_report(report):
+    """Formats the run report as a readable table
+
+    :param report: the run() report
+    :type report: dictionary
+    :returns: string
+    """
+    headings = ["tree", "mode"] + [x[1] for x in METRICS]
+    rows = []
+    for row in report["results"]:
+        rows.append([row["tree"], row["mode"] + ('' if row["success"] else '!')]
+                    + [_cell(x[2], row.get(x[0])) for x in METRICS])
+    lines = [_table(headings, rows)]
+    if report["skipped"]:
+        lines.append("skipped, not installed: %s"
+                     % ', '.join(report["skipped"]))
+    return '\n'.join(lines)
+
+
+def compare(old, new, threshold=0.1):
+    """Compares the results of two run reports
+
+    :param old: the baseline run() report
+    :type old: dictionary
+    :param new: the run() report to check
+    :type new: dictionary
+    :param threshold: the relative change of a metric to
+                      report as a regression or improvement
+    :type threshold: float
+    :returns: list of dictionaries: tree, mode, metric, old, new,
+              change, regression
+    """
+    baseline = dict(((x["tree"], x["mode"]), x) for x in old["results"])
+    changes = []
+    for row in new["results"]:
+        before = baseline.get((row["tree"], row["mode"]))
+        if before is None:
+            continue
+        if before["success"] and not row["success"]:
+            changes.append({"tree": row["tree"], "mode": row["mode"],
+                            "metric": "success", "old": True, "new": False,
+                            "change": None, "regression": True})
+            continue
+        for key, _heading, _fmt, higher in METRICS:
+            if not before.get(key) or row.get(key) is None:
+                continue
+            change = (row[key] - before[key]) / float(before[key])
+            if abs(change) < threshold:
+                continue
+            changes.append({"tree": row["tree"], "mode": row["mode"],
+                            "metric": key, "old": before[key],
+                            "new": row[key], "change": change,
+                            "regression": (change < 0) == higher})
+    return changes
+
+
+def format_comparison(changes):
+    """Formats the compare() changes as a readable table
+
+    :param changes: the compare() result
+    :type changes: list of dictionaries
+    :returns: string
+    """
+    if not changes:
+        return "no changes above the threshold"
+    formats = dict((x[0], x[2]) for x in METRICS)
+    rows = []
+    for change in changes:
+        fmt = formats.get(change["metric"], "%s")
+        rows.append([change["tree"], change["mode"], change["metric"],
+                     _cell(fmt, change["old"]), _cell(fmt, change["new"]),
+                     _cell("%+.1f%%", change["change"] and change["change"] * 100),
+                     "REGRESSION" if change["regression"] else "improved"])
+    return _table(["tree", "mode", "metric", "old", "new", "change", ""],
+                  rows)
+
+
+def main(argv=None):
+    """Command line entry point
+
+    :param argv: optional argument list, default: sys.argv[1:]
+    :type argv: list of strings
+    :returns: integer, the exit code. 1 if a comparison found regressions
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m DeComp.bench",
+        description="Benchmark the DeComp (de)compression definitions")
+    parser.add_argument("-o", "--output",
+                        help="file to write the JSON results to")
+    parser.add_argument("-m", "--modes",
+                        help="comma separated compression modes to run")
+    parser.add_argument("-t", "--trees",
+                        help="comma separated trees to build: %s"
+                        % ', '.join(sorted(TREE_BUILDERS)))
+    parser.add_argument("-s", "--scale", type=float, default=1.0,
+                        help="tree size multiplier, default: 1.0")
+    parser.add_argument("-r", "--repeat", type=int, default=1,
+                        help="runs of each operation, the fastest is kept")
+    parser.add_argument("-w", "--workdir",
+                        help="directory to work in, default: a temporary one")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two saved JSON results")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change reported by --compare, "
+                        "default: 0.1")
+    options = parser.parse_args(argv)
+
+    if options.compare:
+        reports = []
+        for path in options.compare:
+            with open(path, encoding='UTF-8') as source:
+                reports.append(json.load(source))
+        changes = compare(reports[0], reports[1], options.threshold)
+        print(format_comparison(changes))
+        return 1 if any(x["regression"] for x in changes) else 0
+
+    if options.trees:
+        unknown = set(options.trees.split(',')) - set(TREE_BUILDERS)
+        if unknown:
+            parser.error("unknown trees: %s" % ', '.join(sorted(unknown)))
+    report = run(options.modes and options.modes.split(','),
+                 options.trees and options.trees.split(','),
+                 options.scale, options.repeat, options.workdir)
+    if options.output:
+        with open(options.output, 'w', encoding='UTF-8') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    print(format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
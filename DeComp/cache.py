@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+
+"""
+cache.py
+
+Content addressed archive cache, so compressing an unchanged source tree
+again reuses the previous archive instead of running the compressor.
+
+The key of an archive is the fingerprint of the source tree (the path,
+type, size, mtime and inode of every entry and optionally the file
+contents), combined with the mode, its arguments and the other options.
+The metadata stored along with an archive, such as the mode chosen by
+the adaptive 'auto' mode, is returned by lookup().
+Cached archives are hardlinked to the requested filename when possible,
+copied otherwise.  The cache is limited in size, the least recently used
+archives are evicted first.
+
+Note: a cached archive shares its inode with the files it was linked to,
+they must be replaced, not modified in place.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from DeComp import log
+from DeComp.scheduler import cpu_count
+
+
+# The default maximum total size of the cached archives
+DEFAULT_CACHE_SIZE = 10 * 1024 * 1024 * 1024
+
+# Suffix of the archive's metadata file, its mtime records the
+# archive's last use
+META_SUFFIX = ".meta"
+
+# Read size used to hash the file contents
+HASH_BLOCK = 1 << 20
+
+
+def _hash_file(path):
+    """Returns the sha256 hex digest of the file's contents or ''"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as source:
+            while True:
+                block = source.read(HASH_BLOCK)
+                if not block:
+                    break
+                digest.update(block)
+    except (IOError, OSError):
+        return ''
+    return digest.hexdigest()
+
+
+def _entry_line(relpath, info, path, hash_content):
+    """Returns the fingerprint line of one tree entry"""
+    extra = ''
+    if stat.S_ISLNK(info.st_mode):
+        try:
+            extra = os.readlink(path)
+        except OSError:
+            pass
+    elif hash_content and stat.S_ISREG(info.st_mode):
+        extra = _hash_file(path)
+    return "%s\0%o\0%d\0%d\0%d\0%s\n" % (relpath, info.st_mode, info.st_size,
+                                        info.st_mtime_ns, info.st_ino, extra)
+
+
+def _walk_lines(top, relative, hash_content):
+    """Returns the sorted fingerprint lines of a directory tree"""
+    lines = []
+    for root, dirs, files in os.walk(top):
+        dirs.sort()
+        # symlinks to directories are listed in dirs, but not descended
+        for name in sorted(files) + dirs:
+            path = os.path.join(root, name)
+            try:
+                info = os.lstat(path)
+            except OSError:
+                continue
+            relpath = os.path.join(relative, os.path.relpath(path, top))
+            lines.append(_entry_line(relpath, info, path, hash_content))
+    return lines
+
+
+class ArchiveCache(object):
+    """Size limited cache of compressed archives keyed by their
+    source tree fingerprint and compression parameters"""
+
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE, hash_content=False,
+                 max_workers=None, logger=None):
+        """Class init
+
+        :param path: the cache directory, created if needed
+        :type path: string
+        :param max_size: the maximum total size of the cached archives
+        :type max_size: integer
+        :param hash_content: include the file contents in the fingerprint,
+                             not only the file metadata
+        :type hash_content: boolean
+        :param max_workers: the number of threads walking the tree,
+                            default: the number of usable cores
+        :type max_workers: integer
+        :param logger: optional logging module instance
+        :type logger: logging
+        """
+        self.path = path
+        self.max_size = max_size
+        self.hash_content = hash_content
+        self.max_workers = max_workers or cpu_count()
+        self.logger = logger or log
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+
+    def fingerprint(self, source):
+        """Fingerprints the source tree, walking its top level
+        directories in parallel
+
+        :param source: the file or directory path
+        :type source: string
+        :returns: string, hex digest or None if the source does not exist
+        """
+        try:
+            info = os.lstat(source)
+        except OSError:
+            return None
+        digest = hashlib.sha256()
+        digest.update(_entry_line('.', info, source,
+                                  self.hash_content).encode('UTF-8',
+                                                            'surrogateescape'))
+        if not stat.S_ISDIR(info.st_mode):
+            return digest.hexdigest()
+        with os.scandir(source) as entries:
+            entries = sorted(entries, key=lambda x: x.name)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            parts = []
+            for entry in entries:
+                try:
+                    info = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                lines = [_entry_line(entry.name, info, entry.path,
+                                     self.hash_content)]
+                parts.append(lines)
+                if stat.S_ISDIR(info.st_mode):
+                    parts.append(pool.submit(_walk_lines, entry.path,
+                                             entry.name, self.hash_content))
+            for part in parts:
+                if not isinstance(part, list):
+                    part = part.result()
+                for line in part:
+                    digest.update(line.encode('UTF-8', 'surrogateescape'))
+        return digest.hexdigest()
+
+
+    @staticmethod
+    def key(fingerprint, *parts):
+        """Combines the source fingerprint with the compression parameters
+
+        :param fingerprint: the fingerprint() of the source
+        :type fingerprint: string
+        :param parts: the parameters the archive depends on
+        :returns: string, hex digest
+        """
+        digest = hashlib.sha256(fingerprint.encode('UTF-8'))
+        for part in parts:
+            digest.update(b"\0" + repr(part).encode('UTF-8', 'surrogateescape'))
+        return digest.hexdigest()
+
+
+    def _entry(self, key):
+        """Returns the cached archive path of the key"""
+        return os.path.join(self.path, key[:2], key)
+
+
+    def lookup(self, key):
+        """Returns the metadata stored with the key's archive
+
+        :param key: the archive's key()
+        :type key: string
+        :returns: dictionary or None if the archive is not cached
+        """
+        entry = self._entry(key)
+        if not os.path.isfile(entry):
+            return None
+        try:
+            with open(entry + META_SUFFIX, encoding='UTF-8') as source:
+                return json.load(source)
+        except (IOError, OSError, ValueError):
+            return None
+
+
+    def fetch(self, key, filename):
+        """Links the cached archive of the key to the filename
+
+        :param key: the archive's key()
+        :type key: string
+        :param filename: the path to place the archive at
+        :type filename: string
+        :returns: boolean, True on a cache hit
+        """
+        entry = self._entry(key)
+        if not os.path.isfile(entry):
+            return False
+        try:
+            if os.path.lexists(filename):
+                os.unlink(filename)
+            try:
+                os.link(entry, filename)
+            except OSError as error:
+                if error.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                shutil.copyfile(entry, filename)
+            self._touch(entry)
+        except (IOError, OSError) as error:
+            self.logger.warning("ArchiveCache: fetch(); failed to reuse %s: %s",
+                                entry, str(error))
+            return False
+        self.logger.info("ArchiveCache: fetch(); reused %s for %s",
+                         key, filename)
+        return True
+
+
+    def store(self, key, filename, meta=None):
+        """Adds the archive to the cache, then evicts the least recently
+        used archives over the size limit
+
+        :param key: the archive's key()
+        :type key: string
+        :param filename: the archive to cache
+        :type filename: string
+        :param meta: optional JSON serializable metadata to store with it
+        :type meta: dictionary
+        :returns: boolean
+        """
+        entry = self._entry(key)
+        directory = os.path.dirname(entry)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            # write to temporary names, then rename them in place
+            # so concurrent fetches never see a partial archive
+            handle, temp = tempfile.mkstemp(dir=directory, prefix=".tmp")
+            with os.fdopen(handle, 'w', encoding='UTF-8') as output:
+                json.dump(meta or {}, output)
+            os.rename(temp, entry + META_SUFFIX)
+            handle, temp = tempfile.mkstemp(dir=directory, prefix=".tmp")
+            os.close(handle)
+            os.unlink(temp)
+            try:
+                os.link(filename, temp)
+            except OSError as error:
+                if error.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                shutil.copyfile(filename, temp)
+            os.rename(temp, entry)
+        except (IOError, OSError) as error:
+            self.logger.warning("ArchiveCache: store(); failed to cache %s: %s",
+                                filename, str(error))
+            return False
+        self.evict()
+        return True
+
+
+    @staticmethod
+    def _touch(entry):
+        """Records the use of the archive on its metadata file, since
+        the archive's own mtime is shared with the files linked to it."""
+        os.utime(entry + META_SUFFIX, None)
+
+
+    def _entries(self):
+        """Returns the (last use, size, path) list of the cached archives"""
+        entries = []
+        for root, _dirs, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(META_SUFFIX) or name.startswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    size = os.stat(path).st_size
+                except OSError:
+                    continue
+                try:
+                    used = os.stat(path + META_SUFFIX).st_mtime
+                except OSError:
+                    used = 0
+                entries.append((used, size, path))
+        return entries
+
+
+    def _remove(self, path):
+        """Removes a cached archive and its metadata"""
+        for name in (path, path + META_SUFFIX):
+            try:
+                os.unlink(name)
+            except OSError:
+                pass
+
+
+    def evict(self):
+        """Removes the least recently used archives until the cache
+        fits in its maximum size
+
+        :returns: integer, the number of bytes freed
+        """
+        entries = sorted(self._entries())
+        total = sum(x[1] for x in entries)
+        freed = 0
+        for _used, size, path in entries:
+            if total - freed <= self.max_size:
+                break
+            self._remove(path)
+            freed += size
+            self.logger.debug("ArchiveCache: evict(); removed %s", path)
+        return freed
+
+
+    def clear(self):
+        """Removes all of the cached archives"""
+        for _used, _size, path in self._entries():
+            self._remove(path)
@@ -16,12 +16,36 @@ Maintained in full by:
 """
 
 import os
-
-from DeComp.definitions import (DEFINITION_FIELDS, EXTENSION_SEPARATOR,
+import shlex
+import tarfile
+import time
+from contextlib import contextmanager
+from subprocess import Popen, PIPE, DEVNULL
+
+from DeComp.definitions import (DEFINITION_FIELDS, DEFINITION_DEFAULTS,
+    EXTENSION_SEPARATOR,
     COMPRESSOR_PROGRAM_OPTIONS, DECOMPRESSOR_PROGRAM_OPTIONS,
-    DEFAULT_TAR)
+    DEFAULT_TAR, MULTI_THREADED_MODES, ADAPTIVE_CANDIDATES,
+    ADAPTIVE_SAMPLE_SIZE, SEEKABLE_CODECS, SEEKABLE_FRAME_SIZE,
+    PARALLEL_SUBSTITUTES, MAGIC_FORMAT_IDS, SNIFF_SIZE, STREAM_TAR_OPTIONS,
+    TEST_COMMANDS, THREAD_ENV, MODE_CODECS, SEEKABLE_PARAMETERS,
+    COMPRESS_LEVEL_ENV)
 from DeComp import log
-from DeComp.utils import create_classes, subcmd, check_available
+from DeComp.adaptive import choose_mode
+from DeComp.digests import Digests, DigestWriter, read_digests, write_digests
+from DeComp.detect import format_mode, match_format, sniff_mode, SuffixIndex
+from DeComp.governor import thread_options
+from DeComp.options import add_codec_flags, codec_flags
+from DeComp.scheduler import cpu_count, run_jobs
+from DeComp.results import OperationResult, ProcessStats
+from DeComp.seekable import (read_frames, compress_stream, decompress_stream,
+    SeekableError, SeekableFile)
+from DeComp.streams import (open_pipe, read_header, stream_fileno,
+    stream_reader, stream_writer, Relay)
+from DeComp.treecopy import TreeCopy, is_remote, rsync_target, same_filesystem
+from DeComp.utils import (create_classes, run_command, run_pipeline,
+    check_available, command_args, cpu_times, wait_process, find_binary,
+    LazyAvailable, compile_args, render_args, tree_size, notify_hooks)
 
 
 class CompressMap(object):
@@ -35,7 +59,11 @@ class CompressMap(object):
     def __init__(self, definitions=None, env=None, default_mode=None,
                  separator=EXTENSION_SEPARATOR, search_order=None, logger=None,
                  comp_prog=COMPRESSOR_PROGRAM_OPTIONS[DEFAULT_TAR],
-                 decomp_opt=DECOMPRESSOR_PROGRAM_OPTIONS[DEFAULT_TAR]
+                 decomp_opt=DECOMPRESSOR_PROGRAM_OPTIONS[DEFAULT_TAR],
+                 sniff=False, lazy_probe=False, hooks=None, measure_bytes=False,
+                 adaptive_candidates=None, sample_size=ADAPTIVE_SAMPLE_SIZE,
+                 cache=None, frame_size=SEEKABLE_FRAME_SIZE, parallel=False,
+                 threads=None, governor=None
                 ):
         """Class init
 
@@ -58,6 +86,42 @@ class CompressMap(object):
         :type comp_prog: string
         :param decomp_opt: external decompressor module option
         :type decomp_opt: string
+        :param sniff: enables determine_mode() checking the file's content
+                      before falling back to the file extension matching,
+                      it reads the start of every file determined
+        :type sniff: boolean
+        :param lazy_probe: only probe for a binary the first time a mode
+                           needing it is resolved, instead of all at init
+        :type lazy_probe: boolean
+        :param hooks: optional callables, each is called with the
+                      OperationResult of every operation run
+        :type hooks: list
+        :param measure_bytes: also measure the uncompressed data sizes of
+                              each operation, requires walking the trees.
+                              The archive's size is always measured.
+        :type measure_bytes: boolean
+        :param adaptive_candidates: optional (mode, level) pairs measured by
+                                    the adaptive 'auto' compression mode,
+                                    default: ADAPTIVE_CANDIDATES
+        :type adaptive_candidates: list of tuples
+        :param sample_size: bytes of the source sampled by the adaptive
+                            'auto' compression mode
+        :type sample_size: integer
+        :param cache: optional archive cache, compressing an unchanged
+                      source again reuses its cached archive
+        :type cache: cache.ArchiveCache
+        :param frame_size: the uncompressed frame size of the seekable modes
+        :type frame_size: integer
+        :param parallel: run the available PARALLEL_SUBSTITUTES mode in
+                         place of the single threaded mode requested
+        :type parallel: boolean
+        :param threads: the number of threads of the parallel modes taking
+                        a thread count, default: the number of usable cores
+        :type threads: integer
+        :param governor: optional resource governor giving each job its
+            thread budget, priorities and cpus, it may be shared with
+            other maps to limit the threads of all of their jobs
+        :type governor: governor.ResourceGovernor
         """
         if definitions is None:
             definitions = {}
@@ -84,21 +148,51 @@ class CompressMap(object):
         self.logger = logger or log
         self.comp_prog = comp_prog
         self.decomp_opt = decomp_opt
+        self.sniff = sniff
+        self.hooks = list(hooks or [])
+        self.measure_bytes = measure_bytes
+        self.adaptive_candidates = adaptive_candidates or ADAPTIVE_CANDIDATES
+        self.sample_size = sample_size
+        self.cache = cache
+        self.frame_size = frame_size
+        self.parallel = parallel
+        self.governor = governor
+        self.threads = threads or (governor.job_threads if governor
+                                   else cpu_count())
         self.logger.info("COMPRESS: __init__(), search_order = %s",
                          str(self.search_order))
         # create the (de)compression definition namedtuple classes
-        self._map = create_classes(definitions, self.fields)
-        binaries = set()
-        for mode in self.search_order:
-            binaries.update(self._map[mode].binaries)
-        self.available = check_available(binaries)
+        self._map = create_classes(definitions, self.fields,
+                                   DEFINITION_DEFAULTS)
+        # compile the argv templates once, up front
+        for mode in self._map:
+            compile_args(self._map[mode].args)
+        if lazy_probe:
+            self.available = LazyAvailable()
+        else:
+            binaries = set()
+            for mode in self.search_order:
+                binaries.update(self._map[mode].binaries)
+                if parallel:
+                    for substitute in PARALLEL_SUBSTITUTES.get(mode, []):
+                        if substitute in self._map:
+                            binaries.update(self._map[substitute].binaries)
+            self.available = check_available(binaries)
+        self._suffix_index = SuffixIndex(self.search_order, self._map,
+                                         self.available, lazy=lazy_probe)
 
 
     def _compress(self, infodict=None, filename='', source=None,
                   basedir='.', mode=None, auto_extension=False,
-                  arch=None, other_options=None):
+                  arch=None, other_options=None, target=None, digests=None,
+                  digest_file=False, level=None, threads=None,
+                  memory_limit=None, window=None):
         """Compression function
 
+        With mode 'auto', a sample of the source is compressed with the
+        adaptive_candidates and the best one for the target is used.
+        The decision is recorded in the result's extra['adaptive'].
+
         :param infodict: optional dictionary of the next 4 parameters.
         :type infodict: dictionary
         :param filename: optional name of the file to make
@@ -113,7 +207,188 @@ class CompressMap(object):
             adding the normaL file extension defined by the mode used.
             defaults to False
         :type auto_extension: boolean
-        :returns: boolean
+        :param target: optional adaptive 'auto' mode target, dictionary of:
+            max_time, max_cpu (seconds), max_size (bytes) and
+            prefer ('size' or 'time'), see adaptive.py
+        :type target: dictionary
+        :param digests: optional hashlib algorithm names, eg: 'sha512',
+            the archive is digested while it is written.  The digests are
+            returned in the result's extra['digests'].
+        :type digests: list of strings
+        :param digest_file: also write the digests to the archive's
+                            DIGESTS sidecar file
+        :type digest_file: boolean
+        :param level: optional compression level of the codec
+        :type level: integer
+        :param threads: optional number of threads of the codec,
+                        0 is all of the cores for the codecs taking it
+        :type threads: integer
+        :param memory_limit: optional memory limit of the codec, in MiB
+        :type memory_limit: integer
+        :param window: optional log2 of the codec's match window size
+        :type window: integer
+        :returns: OperationResult, false if it failed or could not be run.
+                  The codec parameters not supported by the mode's codec,
+                  see CODEC_OPTIONS, fail the compression.
+        """
+        infodict, result = self._compress_prepare(
+            infodict, filename, source, basedir, mode, auto_extension, arch,
+            other_options, target, digests, digest_file,
+            self._codec_request(level, threads, memory_limit, window))
+        if infodict is None:
+            return result
+        result = self._run_digested(infodict)
+        if self.cache is not None and result:
+            self._cache_store(infodict)
+        return result
+
+
+    def _compress_prepare(self, infodict, filename, source, basedir, mode,
+                          auto_extension, arch, other_options, target,
+                          digests, digest_file, codec_options):
+        """Completes the compression's infodict up to running it,
+        fetching the archive from the cache and resolving the 'auto' mode,
+        see _compress() for the parameters.
+
+        :param codec_options: as returned by _codec_request()
+        :type codec_options: dictionary
+        :returns: tuple of the infodict to run and None, or of None and
+                  the result to return, a cache hit or False
+        """
+        infodict = self._compress_info(infodict, filename, source, basedir,
+                                       mode, auto_extension, arch,
+                                       other_options, target)
+        if not infodict or \
+                not self._digest_info(infodict, digests, digest_file=digest_file):
+            return None, False
+        infodict['codec_options'] = codec_options
+        if self.cache is not None:
+            result = self._cache_fetch(infodict)
+            if result:
+                return None, result
+        if not self._resolve_mode(infodict):
+            return None, False
+        self._parallelize(infodict)
+        if not self._codec_check(infodict, 'compress'):
+            return None, False
+        if self.cache is not None:
+            self._cache_unshare(infodict)
+        return infodict, None
+
+
+    def _resolve_mode(self, infodict):
+        """Resolves the adaptive 'auto' compression mode,
+        measuring the candidates for the infodict's target
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: boolean, False if no mode could be chosen
+        """
+        if infodict['mode'] not in ['auto']:
+            return True
+        decision = choose_mode(self, infodict, infodict.get('target'),
+                               self.adaptive_candidates, self.sample_size,
+                               self.logger)
+        if not decision:
+            self.logger.error(self.mode_error)
+            return False
+        infodict['mode'] = decision['mode']
+        if decision['level'] is not None:
+            infodict['codec_options'] = dict(
+                {'level': decision['level']},
+                **(infodict.get('codec_options') or {}))
+        infodict['adaptive'] = decision
+        return True
+
+
+    def _cache_key(self, infodict):
+        """Returns the archive cache key of the compression
+
+        :param infodict: dict as returned by this class's create_infodict(),
+                         before the 'auto' mode is resolved
+        :type infodict: dictionary
+        :returns: string or None if the source does not exist
+        """
+        fingerprint = self.cache.fingerprint(
+            os.path.join(infodict['basedir'] or '.', infodict['source']))
+        if fingerprint is None:
+            return None
+        parts = [infodict['mode'], infodict['source'], infodict['arch'],
+                 infodict['other_options'], sorted((infodict.get('env')
+                                                    or {}).items()),
+                 self.comp_prog,
+                 sorted((infodict.get('codec_options') or {}).items())]
+        if infodict['mode'] in ['auto']:
+            parts.append(sorted((infodict.get('target') or {}).items()))
+        elif self.is_supported(infodict['mode']):
+            definition = self._map[infodict['mode']]
+            parts.extend([definition.cmd, definition.args])
+            if definition.func == "_seekable":
+                parts.append(self.frame_size)
+        if self.parallel:
+            parts.append(('parallel', self.threads))
+        return self.cache.key(fingerprint, *parts)
+
+
+    def _cache_fetch(self, infodict):
+        """Reuses the cached archive of an unchanged source
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: OperationResult on a cache hit or None
+        """
+        start = time.time()
+        infodict['cache-key'] = key = self._cache_key(infodict)
+        infodict['cache'] = 'miss'
+        if key is None:
+            return None
+        meta = self.cache.lookup(key)
+        if meta is None or not self.is_supported(meta.get('mode')):
+            return None
+        cmdinfo = infodict.copy()
+        cmdinfo['mode'] = meta['mode']
+        if not self.cache.fetch(key, self._output_filename(cmdinfo)):
+            return None
+        cmdinfo['cache'] = 'hit'
+        return self._finish(OperationResult(None, meta['mode'], True,
+                                            wall_time=time.time() - start),
+                            cmdinfo, start)
+
+
+    def _cache_unshare(self, infodict):
+        """Removes an existing output file linked to a cached archive,
+        so the compressor does not overwrite the cached archive in place
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        """
+        filename = self._output_filename(infodict)
+        try:
+            if os.stat(filename).st_nlink > 1:
+                os.unlink(filename)
+        except OSError:
+            pass
+
+
+    def _cache_store(self, infodict):
+        """Adds the compressed archive to the cache
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        """
+        if infodict.get('cache-key'):
+            self.cache.store(infodict['cache-key'],
+                             self._output_filename(infodict),
+                             {'mode': infodict['mode']})
+
+
+    def _compress_info(self, infodict, filename, source, basedir, mode,
+                       auto_extension, arch, other_options, target=None):
+        """Validates and completes the compression parameters,
+        see _compress() for the parameters.
+        The adaptive 'auto' mode is resolved later by _resolve_mode().
+
+        :returns: the infodict to run or None
         """
         if not infodict:
             infodict = self.create_infodict(source, None, basedir, filename,
@@ -121,22 +396,24 @@ class CompressMap(object):
                                             arch, other_options)
         if not infodict['mode']:
             self.logger.error(self.mode_error)
-            return False
+            return None
         if infodict['mode'].endswith("_x"):
             self.logger.warning("Deprecation Warning, all (de)compressor modes "
                                 "ending with '_x'")
             self.logger.warning("Please use the 'other_options' capability in "
                                 "the non '*_x' modes")
         self.logger.debug("other_options: %s", infodict['other_options'])
+        infodict['target'] = target
         if auto_extension:
             infodict['auto-ext'] = True
         self.logger.debug("CompressMap, Running compression process: %s",
                           infodict['mode'])
-        return self._run(infodict)
+        return infodict
 
 
     def _extract(self, infodict=None, source=None, destination=None,
-                 mode=None, other_options=None):
+                 mode=None, other_options=None, digests=None, verify=None,
+                 threads=None, memory_limit=None, window=None):
         """De-compression function
 
         :param infodict: optional dictionary of the next 3 parameters.
@@ -147,10 +424,297 @@ class CompressMap(object):
         :type destination: string
         :param mode: optional mode to use to (de)compress with
         :type mode: string
+        :param digests: optional hashlib algorithm names, the archive is
+            digested while it is read.  The digests are returned in the
+            result's extra['digests'].
+        :type digests: list of strings
+        :param verify: the expected hex digests by algorithm name, or True
+            to read them from the archive's DIGESTS sidecar file.  The
+            extraction fails if any of them does not match.  The archive
+            is digested while it is extracted, so a mismatching archive
+            is already extracted to the destination, the caller has to
+            remove it.  Digest the archive with Digests.digest_file()
+            first to check it before anything is extracted.
+        :type verify: dictionary or boolean
+        :param threads: optional number of threads of the codec
+        :type threads: integer
+        :param memory_limit: optional memory limit of the codec, in MiB
+        :type memory_limit: integer
+        :param window: optional log2 of the archive's match window size,
+                       the zstd --long archives need it
+        :type window: integer
+        :returns: OperationResult, false if it failed or could not be run.
+                  The codec parameters not supported by the mode's codec,
+                  see CODEC_OPTIONS, fail the extraction.
+        """
+        infodict = self._extract_prepare(
+            infodict, source, destination, mode, other_options, digests,
+            verify, self._codec_request(None, threads, memory_limit, window))
+        if not infodict:
+            return False
+        return self._run_digested(infodict)
+
+
+    def _extract_prepare(self, infodict, source, destination, mode,
+                         other_options, digests, verify, codec_options):
+        """Completes the extraction's infodict up to running it,
+        see _extract() for the parameters.
+
+        :param codec_options: as returned by _codec_request()
+        :type codec_options: dictionary
+        :returns: the infodict to run or None
+        """
+        infodict = self._extract_info(infodict, source, destination, mode,
+                                      other_options)
+        if not infodict or not self._digest_info(infodict, digests, verify):
+            return None
+        infodict['codec_options'] = codec_options
+        if not self._codec_check(infodict, 'extract'):
+            return None
+        return infodict
+
+
+    @staticmethod
+    def _codec_request(level, threads, memory_limit, window):
+        """Returns the codec parameters given, by name
+
+        :returns: dictionary
+        """
+        request = {'level': level, 'threads': threads,
+                   'memory_limit': memory_limit, 'window': window}
+        return dict((x, y) for x, y in request.items() if y is not None)
+
+
+    def _codec(self, mode):
+        """Returns the codec of the mode, a CODEC_OPTIONS key
+
+        :param mode: the (de)compression mode
+        :type mode: string
+        :returns: string or None if the mode has no codec
+        """
+        definition = self._map[mode]
+        if definition.func == "_seekable":
+            return SEEKABLE_CODECS.get(definition.id)
+        if definition.cmd == "tar":
+            return MODE_CODECS.get(definition.id)
+        return definition.cmd
+
+
+    def _codec_check(self, infodict, operation):
+        """Validates the infodict's codec parameters for its mode, the
+        threads parameter then replaces the infodict's threads
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :param operation: 'compress' or 'extract'
+        :type operation: string
         :returns: boolean
         """
-        if self.loaded_type[0] not in ["Decompression"]:
+        options = infodict.get('codec_options')
+        if not options:
+            return True
+        codec = self._codec(infodict['mode'])
+        try:
+            if self._map[infodict['mode']].func == "_seekable":
+                unsupported = sorted(set(options) - set(SEEKABLE_PARAMETERS))
+                if unsupported:
+                    raise ValueError("the seekable modes do not support the "
+                                     "%s parameter" % ', '.join(unsupported))
+                if 'level' in options:
+                    codec_flags(codec, {'level': options['level']}, operation)
+                    if codec == "zstd" and options['level'] > 19:
+                        raise ValueError("the seekable zstd level must be "
+                                         "from 1 to 19")
+            else:
+                codec_flags(codec, options, operation)
+        except ValueError as error:
+            self.logger.error("COMPRESS: mode: %s; %s", infodict['mode'],
+                              str(error))
+            return False
+        if options.get('threads'):
+            infodict['threads'] = options['threads']
+            if infodict.get('parallel'):
+                infodict['parallel']['threads'] = options['threads']
+        return True
+
+
+    def _codec_args(self, args, infodict):
+        """Adds the options of the infodict's codec parameters
+
+        :param args: the command, argv list or string for shell definitions
+        :type args: list or string
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: the command
+        """
+        options = infodict.get('codec_options')
+        if not options or isinstance(args, str) or \
+                self._map[infodict['mode']].func == "_seekable":
+            return args
+        if options.get('threads'):
+            # the threads given by the governor
+            options = dict(options, threads=infodict.get('threads')
+                           or options['threads'])
+        if self.loaded_type[0] in ['Compression']:
+            operation = 'compress'
+        else:
+            operation = 'extract'
+        codec = self._codec(infodict['mode'])
+        try:
+            flags = codec_flags(codec, options, operation)
+        except ValueError as error:
+            # a fallback mode's codec not taking the parameter
+            self.logger.warning("COMPRESS: mode: %s; %s, ignored",
+                                infodict['mode'], str(error))
+            return args
+        return add_codec_flags(args, codec, flags, self.comp_prog)
+
+
+    def _digest_info(self, infodict, digests, verify=None, digest_file=False):
+        """Adds the digests to compute to the infodict
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :param digests: the hashlib algorithm names or None
+        :type digests: list of strings
+        :param verify: the expected hex digests by algorithm name,
+                       True for the archive's DIGESTS sidecar file or None
+        :type verify: dictionary or boolean
+        :param digest_file: write the DIGESTS sidecar file
+        :type digest_file: boolean
+        :returns: boolean, False if the digests can not be computed
+        """
+        if isinstance(digests, str):
+            digests = [digests]
+        names = list(digests or [])
+        if verify is True:
+            try:
+                verify = read_digests(infodict['source'])
+            except (IOError, OSError) as error:
+                self.logger.error("COMPRESS: failed to read the digests of "
+                                  "%s: %s", infodict['source'], str(error))
+                return False
+            if not verify:
+                self.logger.error("COMPRESS: no digests listed for %s",
+                                  infodict['source'])
+                return False
+        if verify:
+            names.extend(x for x in verify if x.lower() not in names)
+        if not names:
+            return True
+        try:
+            infodict['digests'] = Digests(names)
+        except ValueError as error:
+            self.logger.error("COMPRESS: %s", str(error))
+            return False
+        infodict['digest_file'] = digest_file
+        infodict['verify'] = verify
+        return True
+
+
+    def _run_digested(self, infodict):
+        """Runs the operation with the archive written or read through a
+        relay digesting it in the same pass.  The seekable modes digest
+        their frames themselves, the archives of the other modes are
+        digested by _finish() instead.
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: OperationResult or False
+        """
+        stream = self._digest_stream(infodict)
+        if stream is False:
+            return False
+        if stream is None:
+            return self._run(infodict)
+        with stream:
+            return self._run(infodict)
+
+
+    def _digest_stream(self, infodict):
+        """Opens the archive file as the infodict's stream, for the modes
+        able to write or read the archive through a digesting relay
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: the opened file, None if no digests were requested or
+                  the mode can not use a stream, False on failure
+        """
+        if infodict.get('digests') is None or \
+                not self.is_supported(infodict['mode']):
+            return None
+        definition = self._map[infodict['mode']]
+        if definition.cmd != "tar" or definition.func != "_common":
+            return None
+        compressing = self.loaded_type[0] in ['Compression']
+        if compressing:
+            path = self._output_filename(infodict)
+        else:
+            path = infodict['source']
+        try:
+            stream = open(path, 'wb' if compressing else 'rb')
+        except (IOError, OSError) as error:
+            self.logger.error("COMPRESS: %s", str(error))
             return False
+        infodict['stream'] = stream
+        if not compressing:
+            self._stream_options(infodict)
+        return stream
+
+
+    def _finish_digests(self, result, infodict):
+        """Adds the archive's digests to the result, digesting the archive
+        file if it was not digested in the same pass, then writes the
+        DIGESTS file or verifies the expected digests
+
+        :param result: the operation's result
+        :type result: OperationResult
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        """
+        compressing = result.operation == 'compress'
+        if compressing:
+            path = self._output_filename(infodict)
+        else:
+            path = infodict['source']
+        digests = infodict['digests']
+        try:
+            if digests.size != os.path.getsize(path):
+                self.logger.debug("COMPRESS: digesting the archive: %s", path)
+                digests.digest_file(path)
+            result.extra['digests'] = digests.hexdigests()
+            if compressing and infodict.get('digest_file'):
+                result.extra['digests_file'] = write_digests(
+                    path, result.extra['digests'])
+        except (IOError, OSError) as error:
+            self.logger.error("COMPRESS: failed to digest %s: %s",
+                              path, str(error))
+            result.success = False
+            return
+        if compressing or not infodict.get('verify'):
+            return
+        expected = infodict['verify']
+        mismatched = [x for x in expected if expected[x].lower() !=
+                      result.extra['digests'].get(x.lower())]
+        result.extra['verified'] = not mismatched
+        if mismatched:
+            self.logger.error("COMPRESS: %s digest mismatch: %s", path,
+                              ', '.join(mismatched))
+            result.success = False
+
+
+    def _extract_info(self, infodict, source, destination, mode,
+                      other_options):
+        """Validates and completes the extraction parameters,
+        determining the mode if needed, see _extract() for the parameters.
+
+        :returns: the infodict to run or None
+        """
+        if self.loaded_type[0] not in ["Decompression"]:
+            return None
+        if not infodict:
+            infodict = self.create_infodict(source, destination, mode=mode,
+                                            other_options=other_options)
         if mode or infodict['mode']:
             mode = mode or infodict['mode']
             if mode.endswith("_x"):
@@ -159,27 +723,510 @@ class CompressMap(object):
                 self.logger.warning("Please use the 'other_options' "
                                     "capability in the non '*_x' modes")
         self.logger.debug("other_options: %s", infodict['other_options'])
-        if not infodict:
-            infodict = self.create_infodict(source, destination, mode=mode,
-                                            other_options=other_options)
         if infodict['mode'] in [None]:
             infodict['mode'] = self.mode or 'auto'
         if infodict['mode'] in ['auto']:
             infodict['mode'] = self.determine_mode(infodict['source'])
             if not infodict['mode']:
                 self.logger.error(self.mode_error)
-                return False
+                return None
+        self._parallelize(infodict)
         self.logger.debug("CompressMap, Running extraction process %s",
                           infodict['mode'])
+        return infodict
+
+
+    def _parallel_mode(self, mode):
+        """Returns the parallel mode to substitute for the mode
+
+        :param mode: the (de)compression mode
+        :type mode: string
+        :returns: string or None if the parallel option is disabled or
+                  none of the mode's substitutes is available
+        """
+        if not self.parallel:
+            return None
+        for substitute in PARALLEL_SUBSTITUTES.get(mode, []):
+            if substitute in self._map and \
+                    self._map[substitute].enabled(self.available):
+                return substitute
+        return None
+
+
+    def _parallelize(self, infodict):
+        """Substitutes the parallel equivalent of the infodict's mode,
+        recording the substitution as infodict['parallel']
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        """
+        mode = self._parallel_mode(infodict['mode'])
+        if not mode:
+            return
+        self.logger.debug("COMPRESS: _parallelize(); using mode: %s for: %s",
+                          mode, infodict['mode'])
+        infodict['parallel'] = {
+            'requested': infodict['mode'],
+            'mode': mode,
+            'threads': infodict.get('threads', self.threads),
+        }
+        infodict['mode'] = mode
+
+
+    def compress_to(self, stream, source, basedir='.', mode=None, arch=None,
+                    other_options=None, target=None):
+        """Compresses the source, writing the archive to the stream
+        instead of a file.  Only the tar based modes are supported.
+
+        :param stream: writable file object or file descriptor
+        :type stream: file object or integer
+        :param source: path to the directory
+        :type source: string
+        :param basedir: optional path the source is relative to
+        :type basedir: string
+        :param mode: optional mode to use to compress with
+        :type mode: string
+        :param target: optional adaptive 'auto' mode target,
+                       see compress()
+        :type target: dictionary
+        :returns: OperationResult, false if it failed or could not be run
+        """
+        if not self.compress:
+            self.logger.error("COMPRESS: compress_to(); %s are loaded",
+                              self.loaded_type[1])
+            return False
+        infodict = self._compress_info(None, '-', source, basedir, mode,
+                                       False, arch, other_options, target)
+        if not infodict or not self._resolve_mode(infodict):
+            return False
+        self._parallelize(infodict)
+        if not self._stream_supported(infodict['mode']):
+            return False
+        infodict['stream'] = stream
         return self._run(infodict)
 
 
+    def extract_from(self, stream, destination, mode=None,
+                     other_options=None):
+        """Extracts the archive read from the stream, such as a pipe from
+        another process.  Only the tar based modes are supported.
+        With the 'auto' mode, the format is sniffed from the stream's
+        first bytes.
+
+        :param stream: readable file object or file descriptor
+        :type stream: file object or integer
+        :param destination: path to the directory to extract to
+        :type destination: string
+        :param mode: optional mode to use to de-compress with
+        :type mode: string
+        :returns: OperationResult, false if it failed or could not be run
+        """
+        if not self.extract:
+            self.logger.error("COMPRESS: extract_from(); %s are loaded",
+                              self.loaded_type[1])
+            return False
+        infodict = self.create_infodict('-', destination, mode=mode,
+                                        other_options=other_options)
+        infodict['stream'] = stream
+        if infodict['mode'] in [None, 'auto']:
+            infodict['header'] = read_header(stream_reader(stream),
+                                             SNIFF_SIZE)
+            infodict['mode'] = self._stream_mode(
+                match_format(infodict['header']))
+            if not infodict['mode']:
+                self.logger.error(self.mode_error)
+                return False
+        elif self.is_supported(infodict['mode']) and \
+                self._map[infodict['mode']].func == "_seekable":
+            # a stream can not be seeked to its seek table
+            infodict['fallback'] = self._seekable_fallback(infodict)
+            if not infodict['fallback']:
+                return False
+            infodict['mode'] = infodict['fallback']
+        self._parallelize(infodict)
+        if not self._stream_supported(infodict['mode']):
+            return False
+        self._stream_options(infodict)
+        return self._run(infodict)
+
+
+    def _stream_options(self, infodict):
+        """Adds the tar option selecting the decompressor, for the modes
+        leaving it to tar's detection which does not work on streams
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        """
+        option = STREAM_TAR_OPTIONS.get(self._map[infodict['mode']].id)
+        if option:
+            other = infodict['other_options'] or []
+            if isinstance(other, str):
+                other = shlex.split(other)
+            infodict['other_options'] = [option] + list(other)
+
+
+    def _stream_supported(self, mode):
+        """Returns True if the mode can (de)compress a stream
+
+        :param mode: the (de)compression mode
+        :type mode: string
+        :returns: boolean
+        """
+        if self.is_supported(mode):
+            definition = self._map[mode]
+            if definition.cmd == "tar" and \
+                    definition.func in ["_common", "_seekable"]:
+                return True
+        self.logger.error("COMPRESS: mode: %s does not support streams", mode)
+        return False
+
+
+    def _stream_mode(self, fmt):
+        """Returns the best available mode able to extract the format
+        from a stream
+
+        :param fmt: the sniffed format, one of the MAGIC_FORMAT_IDS keys
+        :type fmt: string
+        :returns: string or None
+        """
+        ids = MAGIC_FORMAT_IDS.get(fmt) or set()
+        for mode in self.search_order:
+            definition = self._map.get(mode)
+            if definition and definition.id in ids and \
+                    definition.cmd == "tar" and definition.func == "_common" \
+                    and definition.enabled(self.available):
+                return mode
+        return None
+
+
+    def _run_stream(self, args, infodict):
+        """Runs the command with the archive side connected to the
+        infodict's stream, directly or through a pipe and relay thread
+
+        :param args: the command to run
+        :type args: list or string
+        :param infodict: dict with the 'stream' and optional 'header'
+                         of the stream's bytes already read
+        :type infodict: dictionary
+        :returns: ProcessStats
+        """
+        stream = infodict['stream']
+        name = self._map[infodict['mode']].id
+        env = self._run_env(infodict)
+        popen = self._run_kwargs(infodict)
+        compressing = self.loaded_type[0] in ['Compression']
+        digests = infodict.get('digests')
+        fd = stream_fileno(stream)
+        if fd is not None and not infodict.get('header') and digests is None:
+            if compressing and hasattr(stream, 'flush'):
+                stream.flush()
+            if compressing:
+                return run_command(args, name, env=env, stdout=fd, **popen)
+            return run_command(args, name, env=env, stdin=fd, **popen)
+        read, write = open_pipe()
+        if compressing:
+            relay = Relay(lambda size: os.read(read, size),
+                          stream_writer(stream), read, digests=digests)
+        else:
+            relay = Relay(stream_reader(stream), stream_writer(write), write,
+                          infodict.get('header', b''), digests)
+        relay.start()
+        try:
+            if compressing:
+                stats = run_command(args, name, env=env, stdout=write,
+                                    **popen)
+            else:
+                stats = run_command(args, name, env=env, stdin=read, **popen)
+        finally:
+            # the relay owns the other end
+            os.close(write if compressing else read)
+            relay.join()
+        infodict['stream_bytes'] = relay.bytes
+        if relay.error is not None and stats.returncode == 0:
+            self.logger.error("COMPRESS: stream relay failed: %s",
+                              str(relay.error))
+            stats = stats._replace(returncode=1)
+        return stats
+
+
+    def extract_members(self, source, members, destination, mode=None,
+                        other_options=None):
+        """Extracts only the named members of the archive
+
+        pixz indexed archives are seeked straight to the blocks holding
+        the members, squashfs images are random access by themselves.
+        Seekable archives only have the frames holding the members
+        decompressed.  Other tar archives are streamed through tar, which
+        stops reading once all of the members are found.
+
+        :param source: path to the archive
+        :type source: string
+        :param members: the member paths, as listed in the archive
+        :type members: list of strings
+        :param destination: path to the directory to extract to
+        :type destination: string
+        :param mode: optional mode to use to de-compress with
+        :type mode: string
+        :returns: OperationResult, false if it failed or could not be run.
+                  Its extra['method'] is the extraction method used.
+        """
+        if isinstance(members, str):
+            members = [members]
+        infodict = self._extract_info(None, source, destination, mode,
+                                      other_options)
+        if not infodict or not members:
+            return False
+        if not self.is_supported(infodict['mode']):
+            self.logger.error("mode: %s is not supported in the current %s "
+                              "definitions", infodict['mode'],
+                              self.loaded_type[1])
+            return False
+        infodict['members'] = list(members)
+        with self._governed(infodict):
+            return self._extract_members(infodict)
+
+
+    def _extract_members(self, infodict):
+        """Internal function.  Runs the member extraction,
+        see extract_members()
+
+        :param infodict: dict as returned by this class's create_infodict(),
+                         with the 'members' list added
+        :type infodict: dictionary
+        :returns: OperationResult or False
+        """
+        start = time.time()
+        definition = self._map[infodict['mode']]
+        if definition.id == "PIXZ" and not definition.shell:
+            infodict['method'] = 'pixz'
+            try:
+                stats = run_pipeline(self._pixz_members_commands(infodict),
+                                     definition.id, env=self._run_env(infodict),
+                                     **self._run_kwargs(infodict))
+            except OSError as error:
+                self.logger.error("COMPRESS: extract_members(); OSError: %s",
+                                  str(error))
+                return False
+            if stats.returncode == 0:
+                return self._finish(OperationResult(
+                    None, infodict['mode'], True, stats), infodict, start)
+            self.logger.warning("COMPRESS: extract_members(); pixz failed, "
+                                "the archive may not be indexed, "
+                                "streaming it instead")
+        elif definition.func == "_seekable":
+            result = self._seekable_members(infodict)
+            if result is not None:
+                return self._finish(result, infodict, start)
+            # a regular archive, stream it with the fallback mode
+            infodict['fallback'] = self._seekable_fallback(infodict)
+            if not infodict['fallback']:
+                return False
+            infodict = dict(infodict, mode=infodict['fallback'])
+            definition = self._map[infodict['mode']]
+        args = self._members_command(infodict)
+        if not args:
+            return False
+        stats = run_command(args, definition.id, env=self._run_env(infodict),
+                            **self._run_kwargs(infodict))
+        return self._finish(OperationResult(None, infodict['mode'],
+                                            stats.returncode == 0, stats),
+                            infodict, start)
+
+
+    def _members_command(self, infodict):
+        """Builds the mode's extraction command limited to the members
+
+        :param infodict: dict as returned by this class's create_infodict(),
+                         with the 'members' list added
+        :type infodict: dictionary
+        :returns: argv list, string for shell definitions or None
+        """
+        definition = self._map[infodict['mode']]
+        if definition.cmd == "tar":
+            infodict['method'] = 'stream'
+            # stop reading once each member has been found
+            extra = ["--occurrence=1", "--"] + infodict['members']
+        elif definition.cmd == "unsquashfs":
+            infodict['method'] = 'unsquashfs'
+            extra = infodict['members']
+        else:
+            self.logger.error("COMPRESS: extract_members(); mode: %s does not "
+                              "support extracting members", infodict['mode'])
+            return None
+        args = self._get_command(infodict)
+        if not args:
+            return None
+        if isinstance(args, str):
+            return ' '.join([args] + [shlex.quote(x) for x in extra])
+        return args + extra
+
+
+    def _pixz_members_commands(self, infodict):
+        """Builds the pixz member extraction pipeline, pixz seeks to the
+        blocks of the members using its index and pipes them to tar
+
+        :param infodict: dict as returned by this class's create_infodict(),
+                         with the 'members' list added
+        :type infodict: dictionary
+        :returns: list of the two argv lists
+        """
+        pixz = ["pixz", "-x", "-i", infodict['source']] + infodict['members']
+        tar = ["tar"]
+        if infodict['other_options']:
+            if isinstance(infodict['other_options'], str):
+                tar.extend(shlex.split(infodict['other_options']))
+            else:
+                tar.extend(infodict['other_options'])
+        tar.extend(["-xpf", "-", "-C", infodict['destination']])
+        return [self._governed_args(pixz, infodict), tar]
+
+
+    def compress_many(self, jobs, max_workers=None, max_threads=None):
+        """Runs many compression jobs on a bounded worker pool
+
+        :param jobs: the compress() keyword parameters dictionary of each job
+        :type jobs: iterable of dictionaries
+        :param max_workers: optional maximum number of jobs running at once
+        :type max_workers: integer
+        :param max_threads: optional maximum number of threads in use by the
+            running jobs, modes in MULTI_THREADED_MODES count as all cores.
+            Both default to the number of usable cores.
+        :type max_threads: integer
+        :returns: list of (job, result) tuples in completion order
+        """
+        if not self.compress:
+            self.logger.error("COMPRESS: compress_many(); %s are loaded",
+                              self.loaded_type[1])
+            return []
+        return run_jobs(lambda job: self.compress(**job), jobs,
+                        self._job_threads, max_workers, max_threads,
+                        self.logger)
+
+
+    def extract_many(self, jobs, max_workers=None, max_threads=None):
+        """Runs many extraction jobs on a bounded worker pool
+
+        :param jobs: the extract() keyword parameters dictionary of each job
+        :type jobs: iterable of dictionaries
+        :param max_workers: optional maximum number of jobs running at once
+        :type max_workers: integer
+        :param max_threads: optional maximum number of threads in use by the
+            running jobs, modes in MULTI_THREADED_MODES count as all cores.
+            Both default to the number of usable cores.
+        :type max_threads: integer
+        :returns: list of (job, result) tuples in completion order
+        """
+        if not self.extract:
+            self.logger.error("COMPRESS: extract_many(); %s are loaded",
+                              self.loaded_type[1])
+            return []
+        return run_jobs(lambda job: self.extract(**job), jobs,
+                        self._job_threads, max_workers, max_threads,
+                        self.logger)
+
+
+    def test(self, sources, walk=False, max_workers=None):
+        """Tests the integrity of many archives on a bounded worker pool,
+        see test_archive()
+
+        :param sources: paths to the archives
+        :type sources: iterable of strings
+        :param walk: list the tar archives through tar
+        :type walk: boolean
+        :param max_workers: optional maximum number of archives tested
+                            at once, default: the number of usable cores
+        :type max_workers: integer
+        :returns: list of (source, result) tuples in completion order
+        """
+        if not self.extract:
+            self.logger.error("COMPRESS: test(); %s are loaded",
+                              self.loaded_type[1])
+            return []
+        return run_jobs(lambda source: self.test_archive(source, walk=walk),
+                        sources, lambda source: 1, max_workers, None,
+                        self.logger)
+
+
+    def test_archive(self, source, mode=None, walk=False):
+        """Tests the integrity of the archive, decompressing it without
+        writing the data anywhere.  The codec's own test option is used
+        where it has one.  With walk, tar archives are listed by tar
+        instead, which also checks the tar headers.
+
+        :param source: path to the archive
+        :type source: string
+        :param mode: optional mode of the archive
+        :type mode: string
+        :param walk: list the tar archives through tar
+        :type walk: boolean
+        :returns: OperationResult, its throughput is the archive's bytes
+                  tested per second
+        """
+        start = time.time()
+        infodict = self._extract_info(None, source, None, mode, None)
+        if not infodict or not self.is_supported(infodict['mode']):
+            self.logger.error("COMPRESS: test(); no mode to test %s with",
+                              source)
+            return OperationResult('test', mode, False,
+                                   input_bytes=tree_size(source))
+        infodict['operation'] = 'test'
+        definition = self._map[infodict['mode']]
+        if walk and definition.cmd == "tar":
+            command = TEST_COMMANDS["TAR"]
+        else:
+            command = TEST_COMMANDS.get(definition.id)
+            if command and not find_binary(command[0]) and \
+                    definition.cmd == "tar":
+                command = TEST_COMMANDS["TAR"]
+        if not command:
+            self.logger.error("COMPRESS: test(); mode: %s has no test "
+                              "command", infodict['mode'])
+            return self._finish(False, infodict, start)
+        try:
+            with self._governed(infodict):
+                args = [command[0]]
+                args.extend(render_args(compile_args(command[1:]), infodict))
+                args = self._governed_args(args, infodict)
+                stats = run_command(args, definition.id,
+                                    env=self._run_env(infodict),
+                                    stdout=DEVNULL,
+                                    **self._run_kwargs(infodict))
+        except OSError as error:
+            self.logger.error("COMPRESS: test(); OSError: %s", str(error))
+            return self._finish(False, infodict, start)
+        if stats.returncode != 0:
+            self.logger.error("COMPRESS: test(); %s failed the test",
+                              source)
+        infodict['method'] = args[0]
+        return self._finish(OperationResult(None, infodict['mode'],
+                                            stats.returncode == 0, stats),
+                            infodict, start)
+
+
+    def _job_threads(self, job):
+        """Returns the number of threads the job's mode will use
+
+        :param job: compress() or extract() keyword parameters
+        :type job: dictionary
+        :returns: integer
+        """
+        infodict = job.get('infodict') or {}
+        mode = job.get('mode') or infodict.get('mode') or self.mode
+        if mode in [None, 'auto']:
+            mode = self.determine_mode(job.get('source')
+                                       or infodict.get('source') or '')
+        mode = self._parallel_mode(mode) or mode
+        if mode in MULTI_THREADED_MODES:
+            return cpu_count()
+        return 1
+
+
     def _run(self, infodict):
         """Internal function that runs the designated function
 
         :param infodict: optional dictionary of the next 3 parameters.
         :type infodict: dictionary
-        :returns: boolean
+        :returns: OperationResult or False
         """
         if not self.is_supported(infodict['mode']):
             self.logger.error("mode: %s is not supported in the current %s "
@@ -188,6 +1235,7 @@ class CompressMap(object):
                              )
             return False
         _func = self._map[infodict['mode']].func
+        start = time.time()
         try:
             # see if it is an internal function name (string)
             # or an external function pointer
@@ -199,7 +1247,8 @@ class CompressMap(object):
                 self.logger.debug("Compress: _run(); func is a function: '%s'",
                                   _func)
                 func = _func
-            success = func(infodict)
+            with self._governed(infodict):
+                success = func(infodict)
         except AttributeError:
             self.logger.error("FAILED to find or run function '%s'",
                               str(self._map[infodict['mode']].func))
@@ -210,7 +1259,127 @@ class CompressMap(object):
             #print(msg)
             #print("Exception:", e)
             #return False
-        return success
+        return self._finish(success, infodict, start)
+
+
+    def _finish(self, result, infodict, start):
+        """Completes the operation's result and passes it to the hooks
+
+        :param result: the function's result, external functions
+                       may return a boolean
+        :type result: OperationResult or boolean
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :param start: the time.time() the operation started at
+        :type start: float
+        :returns: OperationResult
+        """
+        if not isinstance(result, OperationResult):
+            result = OperationResult(None, infodict['mode'], result,
+                                     wall_time=time.time() - start)
+        if infodict.get('operation'):
+            result.operation = infodict['operation']
+        elif infodict['mode'] == 'rsync':
+            result.operation = 'rsync'
+        elif self.loaded_type[0] in ['Compression']:
+            result.operation = 'compress'
+        else:
+            result.operation = 'extract'
+        result.mode = infodict['mode']
+        if infodict.get('adaptive'):
+            result.extra['adaptive'] = infodict['adaptive']
+        if infodict.get('cache'):
+            result.extra['cache'] = infodict['cache']
+        if infodict.get('members'):
+            result.extra['members'] = infodict['members']
+            result.extra['method'] = infodict.get('method')
+        if infodict.get('parallel'):
+            result.extra['parallel'] = infodict['parallel']
+        if infodict.get('frames'):
+            result.extra['frames'] = infodict['frames']
+        if infodict.get('transfer'):
+            result.extra['transfer'] = infodict['transfer']
+        if infodict.get('codec_options'):
+            result.extra['codec_options'] = infodict['codec_options']
+        if infodict.get('allotment'):
+            allotment = infodict['allotment']
+            result.extra['governor'] = {
+                'threads': allotment.threads,
+                'cpus': sorted(allotment.cpus) if allotment.cpus else None,
+            }
+        if result.operation == 'test':
+            result.extra['method'] = infodict.get('method')
+        if infodict.get('digests') is not None and result:
+            self._finish_digests(result, infodict)
+        if infodict.get('fallback'):
+            result.extra['fallback'] = infodict['fallback']
+        if result.operation == 'test':
+            # always measured, for the throughput
+            result.input_bytes = tree_size(infodict['source'])
+        else:
+            self._measure(result, infodict)
+        notify_hooks(self.hooks, result, self.logger)
+        return result
+
+
+    def _measure(self, result, infodict):
+        """Adds the data sizes to the result.  The archive's size is the
+        relayed stream's byte count or the archive file's size.  The
+        trees are only walked with measure_bytes, the destination of an
+        extraction or rsync then includes any files already in it.
+
+        :param result: the operation's result
+        :type result: OperationResult
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        """
+        source = infodict['source']
+        if result.operation == 'compress':
+            if infodict.get('stream') is not None:
+                result.output_bytes = infodict.get('stream_bytes')
+            else:
+                result.output_bytes = tree_size(
+                    self._output_filename(infodict))
+            source = os.path.join(infodict['basedir'] or '.', source)
+        elif result.operation == 'extract':
+            if infodict.get('stream') is not None:
+                result.input_bytes = infodict.get('stream_bytes')
+            else:
+                result.input_bytes = tree_size(source)
+        if not self.measure_bytes:
+            return
+        if result.operation == 'compress':
+            result.input_bytes = tree_size(source)
+        elif result.operation == 'extract':
+            result.output_bytes = tree_size(infodict['destination'])
+        else:
+            result.input_bytes = tree_size(source)
+            result.output_bytes = tree_size(infodict['destination'])
+
+
+    def add_hook(self, hook):
+        """Adds a callable to be called with the OperationResult
+        of every operation run
+
+        :param hook: callable accepting an OperationResult
+        :type hook: function
+        """
+        self.hooks.append(hook)
+
+
+    def _output_filename(self, infodict):
+        """Returns the filename the compression writes,
+        including the auto-ext extension if enabled
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: string
+        """
+        filename = infodict['filename']
+        if infodict['auto-ext']:
+            filename += self.extension_separator + \
+                self.extension(infodict["mode"])
+        return filename
 
 
     @staticmethod
@@ -228,32 +1397,56 @@ class CompressMap(object):
         """Uses the decompressor_search_order spec parameter and
         compares the decompressor's file extension strings
         with the source file and returns the mode to use for decompression.
+        If sniffing is enabled, the file's content is checked first.
 
         :param source: file path of the file to determine
         :type source: string
         :returns: string: the decompressor mode to use on the source file
         """
         self.logger.info("COMPRESS: determine_mode(), source = %s", source)
-        result = None
-        for mode in self.search_order:
-            self.logger.debug("COMPRESS: determine_mode(), mode = %s, %s",
-                              mode, self.search_order)
-            for ext in self._map[mode].extensions:
-                if source.endswith(ext) and \
-                   self._map[mode].enabled(self.available):
-                    result = mode
-                    break
+        if self.sniff:
+            result = sniff_mode(source, self.search_order, self._map,
+                                self.available)
             if result:
-                self.logger.debug("COMPRESS: determine_mode(), mode = %s", mode)
-                break
-        if not result:
+                self.logger.debug("COMPRESS: determine_mode(), sniffed "
+                                  "mode = %s", result)
+                return result
+        result = self._suffix_index.lookup(source)
+        if result:
+            self.logger.debug("COMPRESS: determine_mode(), mode = %s", result)
+        else:
             self.logger.warning("COMPRESS: determine_mode(), failed to find a "
                                 "mode to use for: %s", source)
         return result
 
 
+    def determine_modes(self, paths, sniff=False):
+        """Bulk version of determine_mode() for classifying many files.
+        Only the file extensions are matched, without any file access,
+        unless sniff is set.
+
+        :param paths: file paths of the files to determine
+        :type paths: iterable of strings
+        :param sniff: check each file's content before its extension,
+                      reading the start of every file
+        :type sniff: boolean
+        :returns: dictionary: of path: mode, the mode is None if not found
+        """
+        lookup = self._suffix_index.lookup
+        results = {}
+        for path in paths:
+            mode = None
+            if sniff:
+                mode = sniff_mode(path, self.search_order, self._map,
+                                  self.available)
+            results[path] = mode or lookup(path)
+        self.logger.info("COMPRESS: determine_modes(), resolved %d of %d",
+                         len([x for x in results.values() if x]), len(results))
+        return results
+
+
     def rsync(self, infodict=None, source=None, destination=None,
-              mode=None):
+              mode=None, native=True, shards=None):
         """Convienience function. Performs an rsync transfer
 
         :param infodict: optional dictionary of the next 3 parameters.
@@ -264,13 +1457,178 @@ class CompressMap(object):
         :type destination: string
         :param mode: optional mode to use to (de)compress with
         :type mode: string
-        :returns: boolean
+        :param native: copy a local transfer within one filesystem natively,
+                       cloning the files where the filesystem supports it,
+                       instead of running rsync
+        :type native: boolean
+        :param shards: optional number of rsync processes to run at once,
+                       splitting a local source by its top level directories
+        :type shards: integer
+        :returns: OperationResult
         """
         if not infodict:
             if not mode:
                 mode = 'rsync'
             infodict = self.create_infodict(source, destination, mode=mode)
-        return self._common(infodict)
+        start = time.time()
+        with self._governed(infodict):
+            if native and self._native_copy(infodict):
+                result = self._tree_copy(infodict)
+            elif shards and shards > 1 and self._shardable(infodict):
+                result = self._rsync_sharded(infodict, shards)
+            else:
+                result = self._common(infodict)
+        return self._finish(result, infodict, start)
+
+
+    def _native_copy(self, infodict):
+        """Returns True if the rsync transfer can be copied natively,
+        the stock rsync mode between local paths on one filesystem
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: boolean
+        """
+        return (infodict['mode'] == 'rsync' and
+                infodict.get('stream') is None and
+                same_filesystem(infodict['source'], infodict['destination']))
+
+
+    def _tree_copy(self, infodict):
+        """Internal function.  Copies the rsync transfer's tree natively
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: OperationResult
+        """
+        source = infodict['source']
+        target = rsync_target(source, infodict['destination'])
+        self.logger.debug("COMPRESS: _tree_copy(); copying %s to %s",
+                          source, target)
+        start = time.time()
+        user, system = cpu_times()
+        copier = TreeCopy(max_workers=infodict.get('threads') or self.threads,
+                          logger=self.logger)
+        success = copier.copy(source, target)
+        end_user, end_system = cpu_times()
+        infodict['transfer'] = dict(copier.stats, method='native')
+        return OperationResult(None, infodict['mode'], success,
+                               returncode=0 if success else 1,
+                               wall_time=time.time() - start,
+                               user_time=end_user - user,
+                               sys_time=end_system - system)
+
+
+    def _shardable(self, infodict):
+        """Returns True if the rsync transfer can be split in shards,
+        an argv definition with a local source directory
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: boolean
+        """
+        mode = infodict['mode']
+        return (self.is_supported(mode) and not self._map[mode].shell and
+                infodict.get('stream') is None and
+                not is_remote(infodict['source']) and
+                os.path.isdir(infodict['source']))
+
+
+    def _rsync_sharded(self, infodict, shards):
+        """Internal function.  Runs the rsync transfer as one rsync per top
+        level directory of the source, up to shards at once.
+
+        A first non recursive pass copies the top level files and
+        directories, deleting the extraneous top level entries.  Each shard
+        then runs with --delete inside its own directory, so the transfer
+        deletes the same files as a single rsync run.
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :param shards: the number of rsync processes to run at once
+        :type shards: integer
+        :returns: OperationResult
+        """
+        source = infodict['source'].rstrip('/') + '/'
+        target = rsync_target(infodict['source'],
+                              infodict['destination']).rstrip('/') + '/'
+        try:
+            names = sorted(x.name for x in os.scandir(source)
+                           if x.is_dir(follow_symlinks=False))
+            if not is_remote(target):
+                os.makedirs(target, exist_ok=True)
+        except OSError as error:
+            self.logger.error("COMPRESS: _rsync_sharded(); %s", str(error))
+            return OperationResult(None, infodict['mode'], False)
+
+        def _command(src, dst, top=False):
+            cmdinfo = dict(infodict, source=src, destination=dst)
+            args = self._common_command(cmdinfo)
+            if args and top:
+                # after the definition's options, -a enables the recursion
+                index = args.index(src)
+                args[index:index] = ['--no-recursive', '--dirs']
+            return args
+
+        def _shard(name):
+            return run_command(_command(source + name + '/', target + name + '/'),
+                               self._map[infodict['mode']].id,
+                               env=self._run_env(infodict),
+                               **self._run_kwargs(infodict))
+
+        top = _command(source, target, top=True)
+        if not top:
+            return False
+        start = time.time()
+        stats = [run_command(top, self._map[infodict['mode']].id,
+                             env=self._run_env(infodict),
+                             **self._run_kwargs(infodict))]
+        if stats[0].returncode == 0:
+            done = run_jobs(_shard, names, lambda name: 1, max_workers=shards,
+                            max_threads=shards, logger=self.logger)
+            stats.extend(x[1] for x in done if x[1])
+            failed = sorted(x[0] for x in done if not x[1] or x[1].returncode)
+        else:
+            failed = []
+        infodict['transfer'] = {'method': 'sharded', 'shards': len(names),
+                                'failed': failed}
+        returncode = next((x.returncode for x in stats if x.returncode), 0)
+        if failed and not returncode:
+            returncode = 1
+        measured = [x for x in stats if x.user_time is not None]
+        return OperationResult(
+            None, infodict['mode'], returncode == 0, returncode=returncode,
+            wall_time=time.time() - start,
+            user_time=sum(x.user_time for x in measured) if measured else None,
+            sys_time=sum(x.sys_time for x in measured) if measured else None,
+            max_rss=max(x.max_rss for x in measured) if measured else None)
+
+
+    def _get_command_builder(self, mode):
+        """Returns the command building function of the mode,
+        for modes running one of the internal command functions
+
+        :param mode: the (de)compression mode
+        :type mode: string
+        :returns: function or None if the mode is not run by a command
+        """
+        _func = self._map[mode].func
+        if not isinstance(_func, str):
+            return None
+        return getattr(self, '%s_command' % _func, None)
+
+
+    def _get_command(self, infodict):
+        """Returns the command to run for the infodict
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: argv list, string for shell definitions or None
+        """
+        builder = self._get_command_builder(infodict['mode'])
+        if builder is None:
+            return None
+        return builder(infodict)
 
 
     def _common(self, infodict):
@@ -279,13 +1637,120 @@ class CompressMap(object):
 
         :param infodict: dict as returned by this class's create_infodict()
         :type infodict: dictionary
-        :returns: boolean
+        :returns: OperationResult or False
+        """
+        args = self._common_command(infodict)
+        if not args:
+            return False
+        # now run the (de)compressor command in a subprocess
+        # return it's result with the resource usage
+        if infodict.get('stream') is not None:
+            stats = self._run_stream(args, infodict)
+        else:
+            stats = run_command(args, self._map[infodict['mode']].id,
+                                env=self._run_env(infodict),
+                                **self._run_kwargs(infodict))
+        return OperationResult(None, infodict['mode'], stats.returncode == 0,
+                               stats)
+
+
+    def _run_env(self, infodict):
+        """Returns the environment to run the infodict's command in,
+        including any of its own 'env' variables
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: dictionary
+        """
+        allotment = infodict.get('allotment')
+        definition = self._map.get(infodict['mode'])
+        thread_env = THREAD_ENV.get(definition.id) \
+            if allotment and definition else None
+        level = (infodict.get('codec_options') or {}).get('level')
+        level_env = None
+        if level is not None and definition and \
+                definition.func == "_seekable":
+            level_env = COMPRESS_LEVEL_ENV.get(self._codec(infodict['mode']))
+        if not infodict.get('env') and not thread_env and not level_env:
+            return self.env
+        env = self.env.copy()
+        env.update(infodict.get('env') or {})
+        if level_env:
+            env[level_env[0]] = level_env[1] % level
+        if thread_env:
+            name, value = thread_env[0], thread_env[1] % allotment.threads
+            env[name] = ' '.join([env[name], value]) if env.get(name) \
+                else value
+        return env
+
+
+    @contextmanager
+    def _governed(self, infodict):
+        """Context manager running the infodict's job under the governor,
+        recording its thread budget as infodict['threads'] and its
+        allotment as infodict['allotment']
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        """
+        if self.governor is None:
+            yield
+            return
+        budget = self.governor.budget(infodict['mode'] in MULTI_THREADED_MODES)
+        requested = (infodict.get('codec_options') or {}).get('threads')
+        with self.governor.job(requested or budget) as allotment:
+            infodict['allotment'] = allotment
+            infodict['threads'] = allotment.threads
+            if infodict.get('parallel'):
+                infodict['parallel']['threads'] = allotment.threads
+            yield
+
+
+    def _run_kwargs(self, infodict):
+        """Returns the run_command() keyword parameters of the infodict's
+        processes, applying the governor's priorities and cpus
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: dictionary
+        """
+        if infodict.get('allotment') is None:
+            return {}
+        wrapper = self.governor.wrapper(infodict['allotment'])
+        return {'wrapper': wrapper} if wrapper else {}
+
+
+    def _governed_args(self, args, infodict):
+        """Adds the codec's thread option for the governor's thread budget
+
+        :param args: the command, argv list or string for shell definitions
+        :type args: list or string
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: the command
+        """
+        if infodict.get('allotment') is None or isinstance(args, str):
+            return args
+        if self.loaded_type[0] in ['Compression']:
+            operation = 'compress'
+        else:
+            operation = 'extract'
+        return thread_options(args, infodict['allotment'].threads, operation)
+
+
+    def _common_command(self, infodict):
+        """Internal function.  Builds the command for the commonly
+        supported compression or decompression commands.
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: argv list, string for shell definitions or None
         """
         if not infodict['mode'] or not self.is_supported(infodict['mode']):
             self.logger.error("ERROR: CompressMap; %s mode: %s not correctly "
                               "set!", self.loaded_type[0], infodict['mode']
                              )
-            return False
+            return None
 
         # Avoid modifying the source dictionary
         cmdinfo = infodict.copy()
@@ -294,20 +1759,28 @@ class CompressMap(object):
         cmdlist = self._map[cmdinfo['mode']]
 
         # for compression, add the file extension if enabled
-        if cmdinfo['auto-ext']:
-            cmdinfo['filename'] += self.extension_separator + \
-                self.extension(cmdinfo["mode"])
+        cmdinfo['filename'] = self._output_filename(cmdinfo)
 
-        cmdargs = self._sub_other_options(cmdlist.args, cmdinfo)
+        if infodict.get('stream') is not None:
+            # the archive is written or read through the stream
+            if self.loaded_type[0] in ['Compression']:
+                cmdinfo['filename'] = '-'
+            else:
+                cmdinfo['source'] = '-'
 
-        # Do the string substitution
-        opts = ' '.join(cmdargs) %(cmdinfo)
-        args = ' '.join([cmdlist.cmd, opts])
+        if cmdlist.shell:
+            cmdargs = self._sub_other_options(cmdlist.args, cmdinfo)
+            # Do the string substitution
+            opts = ' '.join(cmdargs) %(cmdinfo)
+            args = ' '.join([cmdlist.cmd, opts])
+        else:
+            args = [cmdlist.cmd]
+            args.extend(render_args(compile_args(cmdlist.args), cmdinfo))
+            args = self._governed_args(self._codec_args(args, infodict),
+                                       infodict)
 
         self.logger.debug("COMPRESS: _common(); command args: %s", args)
-        # now run the (de)compressor command in a subprocess
-        # return it's success/fail return value
-        return subcmd(args, cmdlist.id, env=self.env)
+        return args
 
 
     def create_infodict(self, source, destination=None, basedir=None,
@@ -349,6 +1822,7 @@ class CompressMap(object):
             'other_options': other_options,
             'comp_prog': self.comp_prog,
             'decomp_opt': self.decomp_opt,
+            'threads': self.threads,
             }
 
 
@@ -363,6 +1837,31 @@ class CompressMap(object):
         return mode in list(self._map)
 
 
+    def is_enabled(self, mode):
+        """Truth function to test the mode desired is supported
+        and the binaries it needs are installed
+
+        :param mode: string, mode to use to (de)compress with
+        :type mode: string
+        :returns: boolean
+        """
+        return self.is_supported(mode) and \
+            self._map[mode].enabled(self.available)
+
+
+    def build_command(self, infodict):
+        """Returns the command running the infodict's operation and
+        the environment to run it in, for running it outside of this class
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: tuple of the argv list, or string for shell definitions,
+                  and the environment dictionary; the command is None
+                  if the mode is not run by a command
+        """
+        return self._get_command(infodict), self._run_env(infodict)
+
+
     @property
     def available_modes(self):
         """Convienence function to return the available modes
@@ -396,14 +1895,33 @@ class CompressMap(object):
 
         :param infodict: dict as returned by this class's create_infodict()
         :type infodict: dictionary
-        :returns: boolean
+        :returns: OperationResult or False
+        """
+        args = self._sqfs_command(infodict)
+        if not args:
+            return False
+        # now run the (de)compressor command in a subprocess
+        # return it's result with the resource usage
+        stats = run_command(args, self._map[infodict['mode']].id,
+                            env=self._run_env(infodict),
+                            **self._run_kwargs(infodict))
+        return OperationResult(None, infodict['mode'], stats.returncode == 0,
+                               stats)
+
+
+    def _sqfs_command(self, infodict):
+        """Internal function.  Builds the squashfs command.
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: argv list, string for shell definitions or None
         """
 
         if not infodict['mode'] or not self.is_supported(infodict['mode']):
             self.logger.error("ERROR: CompressMap; %s mode: %s not correctly "
                               "set!", self.loaded_type[0], infodict['mode']
                              )
-            return False
+            return None
 
         # Avoid modifying the source dictionary
         cmdinfo = infodict.copy()
@@ -412,20 +1930,247 @@ class CompressMap(object):
         cmdlist = self._map[cmdinfo['mode']]
 
         # for compression, add the file extension if enabled
-        if cmdinfo['auto-ext']:
-            cmdinfo['filename'] += self.extension_separator + \
-                self.extension(cmdinfo["mode"])
+        cmdinfo['filename'] = self._output_filename(cmdinfo)
+
+        if cmdlist.shell:
+            sqfs_opts = self._sub_other_options(cmdlist.args, cmdinfo)
+            if not infodict['arch'] and "-Xbcj" in sqfs_opts:
+                sqfs_opts.remove("-Xbcj")
+                sqfs_opts.remove("%(arch)s")
+            opts = ' '.join(sqfs_opts) % (cmdinfo)
+            return ' '.join([cmdlist.cmd, opts])
+        args = [cmdlist.cmd]
+        args.extend(render_args(compile_args(cmdlist.args), cmdinfo))
+        # the empty %(arch)s is already dropped, drop its option too
+        if not infodict['arch'] and "-Xbcj" in args:
+            args.remove("-Xbcj")
+        return self._governed_args(self._codec_args(args, infodict), infodict)
+
+
+    def _seekable(self, infodict):
+        """Internal function.  Compresses or extracts the seekable
+        multi-frame archives, (de)compressing their frames in parallel.
+        Extracting a regular archive falls back to the next mode able
+        to handle its format.
 
-        sqfs_opts = self._sub_other_options(cmdlist.args, cmdinfo)
-        if not infodict['arch']:
-            sqfs_opts.remove("-Xbcj")
-            sqfs_opts.remove("%(arch)s")
-        opts = ' '.join(sqfs_opts) % (cmdinfo)
-        args = ' '.join([cmdlist.cmd, opts])
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: OperationResult or False
+        """
+        if self.loaded_type[0] in ['Compression']:
+            return self._seekable_compress(infodict)
+        codec = SEEKABLE_CODECS[self._map[infodict['mode']].id]
+        try:
+            frames = read_frames(infodict['source'], codec)
+        except (IOError, OSError, SeekableError) as error:
+            self.logger.error("COMPRESS: _seekable(); %s: %s",
+                              infodict['source'], str(error))
+            return False
+        if not frames:
+            return self._seekable_fallback_run(infodict)
+        infodict['frames'] = len(frames)
+        env = self._run_env(infodict)
+        args = self._common_command(infodict)
+        if not args:
+            return False
+        start = time.time()
+        before = cpu_times()
+        proc = Popen(self._run_kwargs(infodict).get('wrapper', []) +
+                     command_args(args, env), stdin=PIPE, env=env)
+        success = True
+        chunks = decompress_stream(infodict['source'], frames, codec,
+                                   infodict.get('threads'), env,
+                                   infodict.get('digests'))
+        try:
+            for data in chunks:
+                proc.stdin.write(data)
+        except (SeekableError, BrokenPipeError) as error:
+            self.logger.error("COMPRESS: _seekable(); %s: %s",
+                              infodict['source'], str(error))
+            success = False
+        finally:
+            chunks.close()
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        stats = self._seekable_stats(wait_process(proc, start), start, before)
+        return OperationResult(None, infodict['mode'],
+                               success and stats.returncode == 0, stats)
+
+
+    def _seekable_compress(self, infodict):
+        """Internal function.  Pipes the tar stream of the source into
+        the seekable archive's frames.
 
-        # now run the (de)compressor command in a subprocess
-        # return it's success/fail return value
-        return subcmd(args, cmdlist.id, env=self.env)
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: OperationResult or False
+        """
+        codec = SEEKABLE_CODECS[self._map[infodict['mode']].id]
+        env = self._run_env(infodict)
+        args = self._common_command(infodict)
+        if not args:
+            return False
+        filename = self._output_filename(infodict)
+        stream = infodict.get('stream')
+        if stream is None:
+            try:
+                output = open(filename, 'wb')
+            except (IOError, OSError) as error:
+                self.logger.error("COMPRESS: _seekable(); %s: %s",
+                                  filename, str(error))
+                return False
+        elif isinstance(stream, int):
+            output = os.fdopen(stream, 'wb', closefd=False)
+        else:
+            output = stream
+        start = time.time()
+        before = cpu_times()
+        proc = Popen(self._run_kwargs(infodict).get('wrapper', []) +
+                     command_args(args, env), stdout=PIPE, env=env)
+        success = True
+        sink = output
+        if infodict.get('digests') is not None:
+            sink = DigestWriter(output, infodict['digests'])
+        try:
+            infodict['frames'] = compress_stream(
+                proc.stdout, sink, codec, self.frame_size,
+                infodict.get('threads'), env)
+            output.flush()
+        except (IOError, OSError, SeekableError) as error:
+            self.logger.error("COMPRESS: _seekable(); %s: %s",
+                              filename, str(error))
+            proc.kill()
+            success = False
+        finally:
+            proc.stdout.close()
+            # the caller's stream is left open
+            if output is not stream:
+                output.close()
+        stats = self._seekable_stats(wait_process(proc, start), start, before)
+        return OperationResult(None, infodict['mode'],
+                               success and stats.returncode == 0, stats)
+
+
+    @staticmethod
+    def _seekable_stats(stats, start, before):
+        """Returns the tar process stats with the cpu times of the frame
+        (de)compression added, which ran in threads and the zstd utility"""
+        after = cpu_times()
+        return ProcessStats(stats.returncode, time.time() - start,
+                            after[0] - before[0], after[1] - before[1],
+                            stats.max_rss)
+
+
+    def _seekable_fallback(self, infodict):
+        """Returns the mode to handle the infodict's regular archive with,
+        in place of its seekable mode
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: string or None
+        """
+        codec = SEEKABLE_CODECS[self._map[infodict['mode']].id]
+        mode = format_mode(codec, self.search_order, self._map,
+                           self.available, skip_func="_seekable")
+        if not mode:
+            self.logger.error("COMPRESS: _seekable(); %s has no seek table "
+                              "and no other %s mode is available",
+                              infodict['source'], codec)
+            return None
+        mode = self._parallel_mode(mode) or mode
+        self.logger.debug("COMPRESS: _seekable(); %s has no seek table, "
+                          "using mode: %s", infodict['source'], mode)
+        return mode
+
+
+    def _seekable_fallback_run(self, infodict):
+        """Extracts the regular archive with the fallback mode
+
+        :param infodict: dict as returned by this class's create_infodict()
+        :type infodict: dictionary
+        :returns: OperationResult or False
+        """
+        mode = self._seekable_fallback(infodict)
+        if not mode:
+            return False
+        infodict['fallback'] = mode
+        _func = self._map[mode].func
+        if isinstance(_func, str):
+            _func = getattr(self, _func)
+        cmdinfo = dict(infodict, mode=mode)
+        stream = self._digest_stream(cmdinfo)
+        if stream is False:
+            return False
+        if stream is None:
+            return _func(cmdinfo)
+        with stream:
+            return _func(cmdinfo)
+
+
+    def _seekable_members(self, infodict):
+        """Extracts the members of a seekable archive, decompressing only
+        the frames holding them
+
+        :param infodict: dict as returned by this class's create_infodict(),
+                         with the 'members' list added
+        :type infodict: dictionary
+        :returns: OperationResult, False if it failed or
+                  None if the archive has no seek table
+        """
+        codec = SEEKABLE_CODECS[self._map[infodict['mode']].id]
+        try:
+            frames = read_frames(infodict['source'], codec)
+        except (IOError, OSError, SeekableError) as error:
+            self.logger.error("COMPRESS: extract_members(); %s: %s",
+                              infodict['source'], str(error))
+            return False
+        if not frames:
+            return None
+        infodict['method'] = 'seekable'
+        members = [x.rstrip('/') for x in infodict['members']]
+        found = set()
+        directories = set()
+        start = time.time()
+        before = cpu_times()
+        fileobj = SeekableFile(infodict['source'], frames, codec,
+                               self._run_env(infodict))
+        extract_options = {}
+        if hasattr(tarfile, 'data_filter'):
+            extract_options['filter'] = 'tar'
+        try:
+            with tarfile.open(fileobj=fileobj, mode='r:') as archive:
+                for info in archive:
+                    name = info.name.rstrip('/')
+                    matched = [x for x in members if name == x or
+                               name.startswith(x + '/')]
+                    if not matched:
+                        continue
+                    archive.extract(info, infodict['destination'],
+                                    **extract_options)
+                    found.update(matched)
+                    if info.isdir():
+                        # the entries below a directory may follow anywhere
+                        directories.update(matched)
+                    elif found.issuperset(members) and not directories:
+                        break
+        except (IOError, OSError, tarfile.TarError, SeekableError) as error:
+            self.logger.error("COMPRESS: extract_members(); %s: %s",
+                              infodict['source'], str(error))
+            return False
+        finally:
+            fileobj.close()
+        infodict['frames'] = fileobj.decoded
+        missing = [x for x in members if x not in found]
+        if missing:
+            self.logger.error("COMPRESS: extract_members(); not found in "
+                              "%s: %s", infodict['source'], ', '.join(missing))
+        after = cpu_times()
+        return OperationResult(None, infodict['mode'], not missing,
+                               wall_time=time.time() - start,
+                               user_time=after[0] - before[0],
+                               sys_time=after[1] - before[1])
 
 
     def search_order_extensions(self, search_order):
@@ -16,15 +16,30 @@ Maintained in full by:
 from __future__ import print_function
 
 import os
+import tarfile
+import tempfile
+import time
 from subprocess import Popen, PIPE
 
 from DeComp.definitions import (CONTENTS_SEARCH_ORDER, DEFINITION_FIELDS,
+                                DEFINITION_DEFAULTS,
                                 EXTENSION_SEPARATOR, COMPRESSOR_PROGRAM_OPTIONS,
                                 DECOMPRESSOR_PROGRAM_OPTIONS,
                                 LIST_XATTRS_OPTIONS
                                )
 from DeComp import log
-from DeComp.utils import create_classes, check_available
+from DeComp.entries import tar_line, EntryTable
+from DeComp.parsers import get_parser, parse_tar_tv
+from DeComp.native import tarfile_entries
+from DeComp.detect import format_mode, sniff_mode, SuffixIndex
+from DeComp.governor import thread_options
+from DeComp.iso9660 import IsoImage
+from DeComp.results import OperationResult
+from DeComp.seekable import read_frames, decompress_stream, StreamReader
+from DeComp.squashfs import SquashfsImage, UnsupportedImage
+from DeComp.utils import (create_classes, check_available, LazyAvailable,
+                          compile_args, render_args, tree_size, wait_process,
+                          notify_hooks)
 
 
 class ContentsMap(object):
@@ -41,7 +56,8 @@ class ContentsMap(object):
                  separator=EXTENSION_SEPARATOR, search_order=None, logger=None,
                  comp_prog=COMPRESSOR_PROGRAM_OPTIONS['linux'],
                  decomp_opt=DECOMPRESSOR_PROGRAM_OPTIONS['linux'],
-                 list_xattrs_opt=LIST_XATTRS_OPTIONS['linux']):
+                 list_xattrs_opt=LIST_XATTRS_OPTIONS['linux'], sniff=False,
+                 lazy_probe=False, hooks=None, index=None, governor=None):
         """Class init
 
         :param definitions: dictionary of
@@ -58,6 +74,23 @@ class ContentsMap(object):
         :param logger: optional logging module instance,
                        default: pyDecomp logging namespace instance
         :type logger: logging
+        :param sniff: enables determine_mode() checking the archive's content
+                      before falling back to the file extension matching,
+                      it reads the start of every file determined
+        :type sniff: boolean
+        :param lazy_probe: only probe for a binary the first time a mode
+                           needing it is resolved, instead of all at init
+        :type lazy_probe: boolean
+        :param hooks: optional callables, each is called with the
+                      OperationResult of every contents listing run
+        :type hooks: list
+        :param index: optional persistent contents index, the listings of
+                      unchanged archives are then answered from it
+        :type index: index.ContentsIndex
+        :param governor: optional resource governor giving each listing its
+            thread budget, priorities and cpus, it may be shared with
+            other maps to limit the threads of all of their jobs
+        :type governor: governor.ResourceGovernor
         """
         if definitions is None:
             definitions = {}
@@ -73,14 +106,27 @@ class ContentsMap(object):
         self.comp_prog = comp_prog
         self.decomp_opt = decomp_opt
         self.list_xattrs_opt = list_xattrs_opt
+        self.sniff = sniff
+        self.hooks = list(hooks or [])
+        self.index = index
+        self.governor = governor
         self.logger.info("ContentsMap: __init__(), search_order = %s",
                          str(self.search_order))
         # create the contents definitions namedtuple classes
-        self._map = create_classes(definitions, self.fields)
-        binaries = set()
-        for mode in self.search_order:
-            binaries.update(self._map[mode].binaries)
-        self.available = check_available(binaries)
+        self._map = create_classes(definitions, self.fields,
+                                   DEFINITION_DEFAULTS)
+        # compile the argv templates once, up front
+        for mode in self._map:
+            compile_args(self._map[mode].args)
+        if lazy_probe:
+            self.available = LazyAvailable()
+        else:
+            binaries = set()
+            for mode in self.search_order:
+                binaries.update(self._map[mode].binaries)
+            self.available = check_available(binaries)
+        self._suffix_index = SuffixIndex(self.search_order, self._map,
+                                         self.available, lazy=lazy_probe)
 
 
     def contents(self, source, destination, mode="auto", verbose=False):
@@ -88,24 +134,309 @@ class ContentsMap(object):
 
         :param source: optional path to the directory
         :type source: string
-        :param destination: optional path to the directory
+        :param destination: optional file path to write the listing to.
+            The listing is then streamed to it instead of being returned.
         :type destination: string
         :param mode: optional mode to use to (de)compress with
         :type mode: string
         :param verbose: toggle
         :type verbose: boolean
-        :returns: string, list of the contents
+        :returns: string, list of the contents or the destination path
         """
         if mode in ['auto']:
             mode = self.determine_mode(source)
+        if destination:
+            return self._write_contents(source, destination, mode, verbose)
+        if self._get_func(mode, '_iter') is not None:
+            errors = []
+            return self._joined(self.contents_iter(source, mode, errors),
+                                errors, verbose)
+        start = time.time()
+        func = self._get_func(mode)
+        result = func(source, destination,
+                      self._map[mode].cmd, self._map[mode].args, verbose)
+        self._finish(mode, source, start, len(result), bool(result))
+        return result
+
+
+    def contents_iter(self, source, mode="auto", errors=None):
+        """Generator yielding the contents listing lines of the archive as
+        the listing tool produces them.
+
+        With an index, the `tar -tv` format listings are rendered from the
+        indexed entries instead, listing and indexing the archive first if
+        it is not indexed yet.  Answers from the index do not call the hooks.
+
+        :param source: path to the archive
+        :type source: string
+        :param mode: optional mode to use to list the contents with
+        :type mode: string
+        :param errors: optional list to append the listing's stderr lines to,
+                       otherwise they are logged as warnings
+        :type errors: list
+        :returns: generator of strings, one per line without the newline
+        """
+        if mode in ['auto']:
+            mode = self.determine_mode(source)
+        if self.index is not None and self._tar_format(mode):
+            table = self.entries(source, mode, errors)
+            if table is not None:
+                xattrs = self._map[mode].cmd == "tar" and \
+                    self.list_xattrs_opt == "--xattrs" and \
+                    "%(list_xattrs_opt)s" in self._map[mode].args
+                return (tar_line(x, xattrs) for x in table)
+        return self._measured(*self._listing(source, mode, errors))
+
+
+    def _listing(self, source, mode, errors=None):
+        """Starts the mode's listing of the archive
+
+        :param source: path to the archive
+        :type source: string
+        :param mode: the contents mode
+        :type mode: string
+        :param errors: optional list to append the listing's stderr lines to
+        :type errors: list
+        :returns: the (lines, source, mode, stats) parameters of _measured()
+        """
+        func = self._get_func(mode, '_iter')
+        stats = {}
+        if func is None:
+            # no streaming version, split up the complete listing
+            func = self._get_func(mode)
+            result = func(source, None, self._map[mode].cmd,
+                          self._map[mode].args, False)
+            stats['failed'] = not result
+            lines = iter(result.splitlines())
+        else:
+            lines = func(source, None, self._map[mode].cmd,
+                         self._map[mode].args, errors, stats)
+        return lines, source, mode, stats
+
+
+    def _tar_format(self, mode):
+        """Returns True if the mode lists in the `tar -tv` format
+
+        :param mode: the contents mode
+        :type mode: string
+        :returns: boolean
+        """
+        definition = self._map[mode]
+        return definition.func in ["_tarfile", "_seekable", "_squashfs",
+                                   "_iso9660"] or \
+            get_parser(definition.cmd, definition.args) is parse_tar_tv
+
+
+    def _measured(self, lines, source, mode, stats):
+        """Generator passing the listing lines through while measuring it,
+        the hooks are called once it is finished
+
+        :param lines: the listing lines
+        :type lines: iterable of strings
+        :param source: path to the archive
+        :type source: string
+        :param mode: the contents mode
+        :type mode: string
+        :param stats: filled in by the listing function:
+                      'process': ProcessStats, 'failed': boolean,
+                      the listing's OperationResult is added as 'result'
+        :type stats: dictionary
+        :returns: generator of strings
+        """
+        start = time.time()
+        size = 0
+        done = False
+        try:
+            for line in lines:
+                size += len(line) + 1
+                yield line
+            done = True
+        finally:
+            process = stats.get('process')
+            if process is not None:
+                success = done and process.returncode == 0
+            else:
+                success = done and not stats.get('failed')
+            stats['result'] = self._finish(mode, source, start, size,
+                                           success, process)
+
+
+    def _finish(self, mode, source, start, output_bytes, success, stats=None):
+        """Creates the listing's result and passes it to the hooks
+
+        :param mode: the contents mode
+        :type mode: string
+        :param source: path to the archive
+        :type source: string
+        :param start: the time.time() the listing started at
+        :type start: float
+        :param output_bytes: the size of the listing text
+        :type output_bytes: integer
+        :param success: the listing succeeded
+        :type success: boolean
+        :param stats: optional listing process resource usage
+        :type stats: ProcessStats
+        :returns: OperationResult
+        """
+        result = OperationResult('contents', mode, success, stats,
+                                 input_bytes=tree_size(source),
+                                 output_bytes=output_bytes)
+        if stats is None:
+            result.wall_time = time.time() - start
+        notify_hooks(self.hooks, result, self.logger)
+        return result
+
+
+    def add_hook(self, hook):
+        """Adds a callable to be called with the OperationResult
+        of every contents listing run
+
+        :param hook: callable accepting an OperationResult
+        :type hook: function
+        """
+        self.hooks.append(hook)
+
+
+    def _get_func(self, mode, suffix=''):
+        """Returns the function to run for the mode
+
+        :param mode: the contents mode
+        :type mode: string
+        :param suffix: optional internal function name suffix
+        :type suffix: string
+        :returns: function or None if an internal suffixed one does not exist
+        """
         # see if it is an internal function name (string)
         # or an external function pointer
         if isinstance(self._map[mode].func, str):
-            func = getattr(self, '%s' % self._map[mode].func)
-        else:
-            func = self._map[mode].func
-        return func(source, destination,
-                    self._map[mode].cmd, self._map[mode].args, verbose)
+            return getattr(self, '%s%s' % (self._map[mode].func, suffix), None)
+        if suffix:
+            return None
+        return self._map[mode].func
+
+
+    def _write_contents(self, source, destination, mode, verbose):
+        """Streams the contents listing of the archive to the destination
+        file, holding only one line in memory at a time.
+
+        :param source: path to the archive
+        :type source: string
+        :param destination: file path to write the listing to
+        :type destination: string
+        :param mode: the contents mode to use
+        :type mode: string
+        :param verbose: toggle
+        :type verbose: boolean
+        :returns: string, the destination path or '' on failure
+        """
+        count = 0
+        try:
+            with open(destination, 'w', encoding='UTF-8') as output:
+                for line in self.contents_iter(source, mode):
+                    output.write(line)
+                    output.write('\n')
+                    count += 1
+        except (IOError, OSError) as error:
+            self.logger.error("ContentsMap: contents(); failed to write: %s, %s",
+                              destination, str(error))
+            return ''
+        if verbose:
+            self.logger.info("ContentsMap: contents(); wrote %d lines to: %s",
+                             count, destination)
+        return destination
+
+
+    def entries(self, source, mode="auto", errors=None):
+        """Returns the structured contents listing of the archive.
+        Modes without a native backend have their text listing parsed.
+        With an index, unchanged archives are answered from it and new
+        listings are added to it.
+
+        :param source: path to the archive
+        :type source: string
+        :param mode: optional mode to use to list the contents with
+        :type mode: string
+        :param errors: optional list to append the listing's stderr lines to
+        :type errors: list
+        :returns: EntryTable or None if the listing failed or can not
+                  be parsed
+        """
+        if mode in ['auto']:
+            mode = self.determine_mode(source)
+        key = None
+        if self.index is not None:
+            key = self.index.key(source)
+            table = self.index.get(source, key)
+            if table is not None:
+                self.logger.debug("ContentsMap: entries(); indexed: %s",
+                                  source)
+                return table
+        table = self.list_entries(source, mode, errors)
+        if table is not None and key is not None:
+            self.index.put(source, mode, table, key)
+        return table
+
+
+    def list_entries(self, source, mode, errors=None):
+        """Lists and parses the archive's contents, without the index
+
+        :param source: path to the archive
+        :type source: string
+        :param mode: the contents mode to use
+        :type mode: string
+        :param errors: optional list to append the listing's stderr lines to
+        :type errors: list
+        :returns: EntryTable or None if the listing failed or can not
+                  be parsed
+        """
+        func = self._get_func(mode, '_entries')
+        if func is not None:
+            try:
+                return EntryTable(func(source, self._map[mode].cmd,
+                                       self._map[mode].args))
+            except (tarfile.TarError, IOError, OSError, EOFError) as error:
+                self.logger.error("ContentsMap: entries(); failed to list: "
+                                  "%s, %s", source, str(error))
+                return None
+        parser = get_parser(self._map[mode].cmd, self._map[mode].args)
+        if parser is None:
+            self.logger.error("ContentsMap: entries(); mode: %s does not "
+                              "support structured listings", mode)
+            return None
+        lines, source, mode, stats = self._listing(source, mode, errors)
+        table = EntryTable(parser(self._measured(lines, source, mode, stats)))
+        if not stats['result']:
+            self.logger.error("ContentsMap: entries(); failed to list: %s",
+                              source)
+            return None
+        return table
+
+
+    def read_member(self, source, name, mode="auto"):
+        """Reads one regular file of the archive in process, without
+        running a utility or extracting the archive
+
+        :param source: path to the archive
+        :type source: string
+        :param name: the file's path in the archive
+        :type name: string
+        :param mode: optional mode to read the archive with
+        :type mode: string
+        :returns: bytes or None if it could not be read
+        """
+        if mode in ['auto']:
+            mode = self.determine_mode(source)
+        func = self._get_func(mode, '_read') if mode else None
+        if func is None:
+            self.logger.error("ContentsMap: read_member(); mode: %s does not "
+                              "support reading members", mode)
+            return None
+        try:
+            return func(source, name, self._map[mode].cmd)
+        except (IOError, OSError) as error:
+            self.logger.error("ContentsMap: read_member(); failed to read: "
+                              "%s, %s", source, str(error))
+            return None
 
 
     @staticmethod
@@ -123,29 +454,52 @@ class ContentsMap(object):
         """Uses the search_order spec parameter and compares the contents
         file extension strings with the source file and returns the mode to
         use for contents generation.
+        If sniffing is enabled, the archive's content is checked first.
 
         :param source: file path of the file to determine
         :type source: string
         :returns: string: the contents generation mode to use on the source file
         """
         self.logger.debug("ContentsMap: determine_mode(), source = %s", source)
-        result = None
-        for mode in self.search_order:
-            self.logger.debug("ContentsMap: determine_mode(), mode = %s, %s",
-                              mode, self.search_order)
-            for ext in self._map[mode].extensions:
-                if source.endswith(ext) and \
-                   self._map[mode].enabled(self.available):
-                    result = mode
-                    break
+        if self.sniff:
+            result = sniff_mode(source, self.search_order, self._map,
+                                self.available)
             if result:
-                break
+                self.logger.debug("ContentsMap: determine_mode(), sniffed "
+                                  "mode = %s", result)
+                return result
+        result = self._suffix_index.lookup(source)
         if not result:
             self.logger.debug("ContentsMap: determine_mode(), failed to "
                               "find a mode to use for: %s", source)
         return result
 
 
+    def determine_modes(self, paths, sniff=False):
+        """Bulk version of determine_mode() for classifying many archives.
+        Only the file extensions are matched, without any file access,
+        unless sniff is set.
+
+        :param paths: file paths of the archives to determine
+        :type paths: iterable of strings
+        :param sniff: check each file's content before its extension,
+                      reading the start of every file
+        :type sniff: boolean
+        :returns: dictionary: of path: mode, the mode is None if not found
+        """
+        lookup = self._suffix_index.lookup
+        results = {}
+        for path in paths:
+            mode = None
+            if sniff:
+                mode = sniff_mode(path, self.search_order, self._map,
+                                  self.available)
+            results[path] = mode or lookup(path)
+        self.logger.debug("ContentsMap: determine_modes(), resolved %d of %d",
+                          len([x for x in results.values() if x]), len(results))
+        return results
+
+
     def _common(self, source, destination, cmd, args, verbose):
         """General purpose controller to generate the contents listing
 
@@ -161,35 +515,59 @@ class ContentsMap(object):
         :type verbose: boolean
         :returns: string, list of the contents
         """
-        _cmd = [cmd]
-        _cmd.extend((' '.join(args)
-                     % {'source': source, "destination": destination,
-                        'comp_prog': self.comp_prog,
-                        'decomp_opt': self.decomp_opt,
-                        'list_xattrs_opt': self.list_xattrs_opt,
-                       }
-                    ).split()
-                   )
-        try:
-            proc = Popen(_cmd, stdout=PIPE, stderr=PIPE)
-            results = proc.communicate()
-            stdout = results[0].decode('UTF-8')
-            stderr = results[1].decode('UTF-8')
-            result = "\n".join([stdout, stderr])
-        except OSError as error:
-            result = ''
-            self.logger.error("ContentsMap: _common(); OSError: %s, %s",
-                              str(error), ' '.join(_cmd))
+        errors = []
+        lines = self._common_iter(source, destination, cmd, args, errors)
+        return self._joined(lines, errors, verbose)
+
+
+    def _joined(self, lines, errors, verbose):
+        """Joins a listing's lines and its error messages into the
+        contents() result
+
+        :param lines: the listing lines
+        :type lines: iterable of strings
+        :param errors: the list the listing appends its error messages to
+        :type errors: list
+        :param verbose: toggle
+        :type verbose: boolean
+        :returns: string, list of the contents
+        """
+        lines = list(lines)
+        lines.append('')
+        result = "\n".join(["\n".join(lines), "\n".join(errors + [''])])
         if verbose:
             self.logger.info(result)
         return result
 
 
-    @staticmethod
-    def _mountable(_source, _destination, _cmd, _args, _verbose):
-        """Control module to mount/umount a mountable filesystem
+    def _command(self, source, destination, cmd, args):
+        """Builds the command list of the contents listing utility
 
-        :param source: optional path to the directory
+        :param source: path to the archive
+        :type source: string
+        :param destination: optional path to the directory
+        :type destination: string
+        :param cmd: definition command to use to generate the contents with
+        :type cmd: string
+        :param args: optioanl command arguments
+        :type args: list
+        :returns: list
+        """
+        _cmd = [cmd]
+        _cmd.extend(render_args(compile_args(args),
+                                {'source': source, "destination": destination,
+                                 'comp_prog': self.comp_prog,
+                                 'decomp_opt': self.decomp_opt,
+                                 'list_xattrs_opt': self.list_xattrs_opt,
+                                }))
+        return _cmd
+
+
+    def _common_iter(self, source, destination, cmd, args, errors=None,
+                     stats=None):
+        """General purpose generator streaming the contents listing lines
+
+        :param source: path to the archive
         :type source: string
         :param destination: optional path to the directory
         :type destination: string
@@ -197,8 +575,444 @@ class ContentsMap(object):
         :type cmd: string
         :param args: optioanl command arguments
         :type args: list
+        :param errors: optional list to append the stderr lines to
+        :type errors: list
+        :param stats: optional dictionary to store the listing
+                      process's ProcessStats in, as 'process'
+        :type stats: dictionary
+        :returns: generator of strings, one per line without the newline
+        """
+        _cmd = self._command(source, destination, cmd, args)
+        allotment = None
+        if self.governor is not None:
+            # the listings are single threaded jobs
+            allotment = self.governor.allot(self.governor.budget(False))
+            _cmd = self.governor.wrapper(allotment) + \
+                thread_options(_cmd, allotment.threads, 'extract')
+        try:
+            for line in self._run_listing(_cmd, cmd, errors, stats):
+                yield line
+        finally:
+            if allotment is not None:
+                self.governor.free(allotment)
+
+
+    def _run_listing(self, _cmd, cmd, errors, stats):
+        """Generator running the listing command, see _common_iter()
+
+        :param _cmd: the command list
+        :type _cmd: list
+        :param cmd: definition command, used for the log
+        :type cmd: string
+        :returns: generator of strings, one per line without the newline
+        """
+        # stderr goes to a file so it can not block the stdout pipe
+        with tempfile.TemporaryFile() as stderr:
+            start = time.time()
+            try:
+                proc = Popen(_cmd, stdout=PIPE, stderr=stderr)
+            except OSError as error:
+                self.logger.error("ContentsMap: _common(); OSError: %s, %s",
+                                  str(error), ' '.join(_cmd))
+                if stats is not None:
+                    stats['failed'] = True
+                return
+            finished = False
+            try:
+                for line in proc.stdout:
+                    yield line.decode('UTF-8').rstrip('\n')
+                finished = True
+            finally:
+                proc.stdout.close()
+                if not finished and proc.poll() is None:
+                    # the consumer stopped early
+                    proc.kill()
+                process = wait_process(proc, start)
+                if stats is not None:
+                    stats['process'] = process
+            stderr.seek(0)
+            for line in stderr.read().decode('UTF-8').splitlines():
+                if errors is None:
+                    self.logger.warning("ContentsMap: %s: %s", cmd, line)
+                else:
+                    errors.append(line)
+
+
+    def _tarfile(self, source, destination, cmd, args, verbose):
+        """In process python tarfile contents listing controller
+
+        :param source: path to the archive
+        :type source: string
+        :param destination: optional path to the directory
+        :type destination: string
+        :param cmd: the tarfile.open() stream mode to use
+        :type cmd: string
+        :param args: unused
+        :type args: list
+        :param verbose: toggle
+        :type verbose: boolean
+        :returns: string, list of the contents
+        """
+        errors = []
+        lines = self._tarfile_iter(source, destination, cmd, args, errors)
+        return self._joined(lines, errors, verbose)
+
+
+    def _tarfile_iter(self, source, _destination, cmd, args, errors=None,
+                      stats=None):
+        """Generator streaming the tarfile contents listing lines
+        in the `tar -tv` format
+
+        :param source: path to the archive
+        :type source: string
+        :param cmd: the tarfile.open() stream mode to use
+        :type cmd: string
+        :param args: unused
+        :type args: list
+        :param errors: optional list to append the error messages to
+        :type errors: list
+        :param stats: optional dictionary to flag a failure in, as 'failed'
+        :type stats: dictionary
+        :returns: generator of strings
+        """
+        try:
+            for entry in self._tarfile_entries(source, cmd, args):
+                yield tar_line(entry)
+        except (tarfile.TarError, IOError, OSError, EOFError) as error:
+            if stats is not None:
+                stats['failed'] = True
+            msg = "%s: %s" % (source, str(error))
+            if errors is None:
+                self.logger.warning("ContentsMap: tarfile: %s", msg)
+            else:
+                errors.append(msg)
+
+
+    @staticmethod
+    def _tarfile_entries(source, cmd, _args):
+        """Generator of the tarfile ContentsEntry records
+
+        :param source: path to the archive
+        :type source: string
+        :param cmd: the tarfile.open() stream mode to use
+        :type cmd: string
+        :returns: generator of ContentsEntry
+        """
+        return tarfile_entries(source, cmd)
+
+
+    def _seekable(self, source, destination, cmd, args, verbose):
+        """Seekable multi-frame archive contents listing controller
+
+        :param source: path to the archive
+        :type source: string
+        :param destination: optional path to the directory
+        :type destination: string
+        :param cmd: the archive's codec, 'zstd' or 'xz'
+        :type cmd: string
+        :param args: unused
+        :type args: list
+        :param verbose: toggle
+        :type verbose: boolean
+        :returns: string, list of the contents
+        """
+        errors = []
+        lines = self._seekable_iter(source, destination, cmd, args, errors)
+        return self._joined(lines, errors, verbose)
+
+
+    def _seekable_iter(self, source, _destination, cmd, _args, errors=None,
+                       stats=None):
+        """Generator streaming the seekable archive's contents listing
+        lines in the `tar -tv` format, its frames are decompressed in
+        parallel.  Regular archives are listed with the next mode able
+        to handle their format.
+
+        :param source: path to the archive
+        :type source: string
+        :param cmd: the archive's codec, 'zstd' or 'xz'
+        :type cmd: string
+        :param errors: optional list to append the error messages to
+        :type errors: list
+        :param stats: optional dictionary to flag a failure in, as 'failed',
+                      or to store the fallback listing's stats in
+        :type stats: dictionary
+        :returns: generator of strings
+        """
+        try:
+            frames = read_frames(source, cmd)
+            if not frames:
+                mode = self._seekable_fallback(source, cmd)
+                lines, _source, _mode, inner = self._listing(source, mode,
+                                                             errors)
+                try:
+                    for line in lines:
+                        yield line
+                finally:
+                    if stats is not None:
+                        stats.update(inner)
+                return
+            for entry in self._seekable_stream(source, cmd, frames):
+                yield tar_line(entry)
+        except (tarfile.TarError, IOError, OSError, EOFError) as error:
+            if stats is not None:
+                stats['failed'] = True
+            msg = "%s: %s" % (source, str(error))
+            if errors is None:
+                self.logger.warning("ContentsMap: seekable: %s", msg)
+            else:
+                errors.append(msg)
+
+
+    def _seekable_entries(self, source, cmd, _args):
+        """Returns the seekable archive's ContentsEntry records
+
+        :param source: path to the archive
+        :type source: string
+        :param cmd: the archive's codec, 'zstd' or 'xz'
+        :type cmd: string
+        :returns: iterable of ContentsEntry
+        """
+        frames = read_frames(source, cmd)
+        if frames:
+            return self._seekable_stream(source, cmd, frames)
+        mode = self._seekable_fallback(source, cmd)
+        table = self.list_entries(source, mode)
+        if table is None:
+            raise IOError("the %s mode listing failed" % mode)
+        return table
+
+
+    def _seekable_stream(self, source, cmd, frames):
+        """Generator of the ContentsEntry records of the seekable archive
+
+        :param source: path to the archive
+        :type source: string
+        :param cmd: the archive's codec, 'zstd' or 'xz'
+        :type cmd: string
+        :param frames: the archive's frames
+        :type frames: list of seekable.Frame
+        :returns: generator of ContentsEntry
+        """
+        stream = StreamReader(decompress_stream(source, frames, cmd,
+                                                env=self.env))
+        try:
+            for entry in tarfile_entries(source, 'r|', stream):
+                yield entry
+        finally:
+            stream.close()
+
+
+    def _seekable_fallback(self, source, codec):
+        """Returns the mode to list the regular archive with
+
+        :param source: path to the archive
+        :type source: string
+        :param codec: the archive's codec, 'zstd' or 'xz'
+        :type codec: string
+        :returns: string
+        :raises IOError: if no other mode is available
+        """
+        mode = format_mode(codec, self.search_order, self._map,
+                           self.available, skip_func="_seekable")
+        if not mode:
+            raise IOError("no seek table and no other %s mode is available"
+                          % codec)
+        self.logger.debug("ContentsMap: seekable; %s has no seek table, "
+                          "using mode: %s", source, mode)
+        return mode
+
+
+    def _squashfs(self, source, destination, cmd, args, verbose):
+        """In process squashfs image contents listing controller
+
+        :param source: path to the image
+        :type source: string
+        :param destination: optional path to the directory
+        :type destination: string
+        :param cmd: the image format, 'squashfs'
+        :type cmd: string
+        :param args: unused
+        :type args: list
         :param verbose: toggle
         :type verbose: boolean
         :returns: string, list of the contents
         """
-        return 'NOT IMPLEMENTED!!!!!!'
+        errors = []
+        lines = self._squashfs_iter(source, destination, cmd, args, errors)
+        return self._joined(lines, errors, verbose)
+
+
+    def _squashfs_iter(self, source, _destination, cmd, _args, errors=None,
+                       stats=None):
+        """Generator streaming the squashfs image's contents listing lines
+        in the `tar -tv` format, only its metadata blocks are read.
+        The images it can not read are listed with the next mode able
+        to handle their format.
+
+        :param source: path to the image
+        :type source: string
+        :param cmd: the image format, 'squashfs'
+        :type cmd: string
+        :param errors: optional list to append the error messages to
+        :type errors: list
+        :param stats: optional dictionary to flag a failure in, as 'failed',
+                      or to store the fallback listing's stats in
+        :type stats: dictionary
+        :returns: generator of strings
+        """
+        try:
+            try:
+                image = SquashfsImage(source)
+            except UnsupportedImage as error:
+                mode = self._squashfs_fallback(source, cmd, error)
+                lines, _source, _mode, inner = self._listing(source, mode,
+                                                             errors)
+                try:
+                    for line in lines:
+                        yield line
+                finally:
+                    if stats is not None:
+                        stats.update(inner)
+                return
+            with image:
+                for entry in image.entries():
+                    yield tar_line(entry)
+        except (IOError, OSError) as error:
+            if stats is not None:
+                stats['failed'] = True
+            msg = "%s: %s" % (source, str(error))
+            if errors is None:
+                self.logger.warning("ContentsMap: squashfs: %s", msg)
+            else:
+                errors.append(msg)
+
+
+    def _squashfs_entries(self, source, cmd, _args):
+        """Returns the squashfs image's ContentsEntry records
+
+        :param source: path to the image
+        :type source: string
+        :param cmd: the image format, 'squashfs'
+        :type cmd: string
+        :returns: iterable of ContentsEntry
+        """
+        try:
+            image = SquashfsImage(source)
+        except UnsupportedImage as error:
+            mode = self._squashfs_fallback(source, cmd, error)
+            table = self.list_entries(source, mode)
+            if table is None:
+                raise IOError("the %s mode listing failed" % mode) from error
+            return table
+        with image:
+            return list(image.entries())
+
+
+    def _squashfs_read(self, source, name, _cmd):
+        """Returns the content of a squashfs image's regular file
+
+        :param source: path to the image
+        :type source: string
+        :param name: the file's path in the image
+        :type name: string
+        :returns: bytes
+        """
+        with SquashfsImage(source) as image:
+            return image.read(name)
+
+
+    def _squashfs_fallback(self, source, fmt, reason):
+        """Returns the mode to list the image this reader can not read with
+
+        :param source: path to the image
+        :type source: string
+        :param fmt: the image format, 'squashfs'
+        :type fmt: string
+        :param reason: the reason it can not be read
+        :type reason: UnsupportedImage
+        :returns: string
+        :raises IOError: if no other mode is available
+        """
+        mode = format_mode(fmt, self.search_order, self._map,
+                           self.available, skip_func="_squashfs")
+        if not mode:
+            raise IOError("%s and no other %s mode is available"
+                          % (str(reason), fmt))
+        self.logger.debug("ContentsMap: squashfs; %s: %s, using mode: %s",
+                          source, str(reason), mode)
+        return mode
+
+
+    def _iso9660(self, source, destination, cmd, args, verbose):
+        """In process iso9660 image contents listing controller
+
+        :param source: path to the image
+        :type source: string
+        :param destination: optional path to the directory
+        :type destination: string
+        :param cmd: the image format, 'iso9660'
+        :type cmd: string
+        :param args: unused
+        :type args: list
+        :param verbose: toggle
+        :type verbose: boolean
+        :returns: string, list of the contents
+        """
+        errors = []
+        lines = self._iso9660_iter(source, destination, cmd, args, errors)
+        return self._joined(lines, errors, verbose)
+
+
+    def _iso9660_iter(self, source, _destination, _cmd, _args, errors=None,
+                      stats=None):
+        """Generator streaming the memory mapped iso9660 image's contents
+        listing lines in the `tar -tv` format, with the Rock Ridge or
+        Joliet names when the image has them
+
+        :param source: path to the image
+        :type source: string
+        :param errors: optional list to append the error messages to
+        :type errors: list
+        :param stats: optional dictionary to flag a failure in, as 'failed'
+        :type stats: dictionary
+        :returns: generator of strings
+        """
+        try:
+            with IsoImage(source) as image:
+                for entry in image.entries():
+                    yield tar_line(entry)
+        except (IOError, OSError) as error:
+            if stats is not None:
+                stats['failed'] = True
+            msg = "%s: %s" % (source, str(error))
+            if errors is None:
+                self.logger.warning("ContentsMap: iso9660: %s", msg)
+            else:
+                errors.append(msg)
+
+
+    @staticmethod
+    def _iso9660_entries(source, _cmd, _args):
+        """Returns the iso9660 image's ContentsEntry records
+
+        :param source: path to the image
+        :type source: string
+        :returns: list of ContentsEntry
+        """
+        with IsoImage(source) as image:
+            return list(image.entries())
+
+
+    @staticmethod
+    def _iso9660_read(source, name, _cmd):
+        """Returns the content of an iso9660 image's regular file
+
+        :param source: path to the image
+        :type source: string
+        :param name: the file's path in the image
+        :type name: string
+        :returns: bytes
+        """
+        with IsoImage(source) as image:
+            return image.read(name)
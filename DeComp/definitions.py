@@ -26,9 +26,15 @@ DEFINITION_FIELDS = OrderedDict([
     ("id", str),
     ("extensions", list),
     ("binaries", set),
+    ("shell", bool),
     ]
 )
 
+# Default values of the optional trailing definition fields
+DEFINITION_DEFAULTS = {
+    "shell": False,
+}
+
 DEFINITION_HELP = """
 The definition entries are to follow the the definition_types
 with the exception of the first entry "Type" which is a mode identifier
@@ -51,6 +57,11 @@ Definiton entries are composed of the following:
             "TAR",       <== ID string that identifies the utility
             ["tar"],     <== file extensions list
             {"tar"},     <== the set of binaries required
+            False,       <== optional, run the command through a shell.
+                             Only needed for definitions using shell syntax
+                             such as pipes or redirections.  By default the
+                             args are compiled into an argv template and the
+                             utility is run directly.
            ],
 
 
@@ -65,6 +76,11 @@ values during run time:
 "%(comp_prog)s"      the compressor program option (different for bsd tar than linux tar)
 "other_options"      placeholder for insertion of other options to pass to the compressor
                      it will be replaced by those options or removed from the args list
+
+Without a shell, each args entry is one argv word after any shell quoting
+is removed, eg: "'pixz -t'" becomes the single word: pixz -t
+Substituted values are never re-split, so paths may contain spaces.
+Entries substituting to an empty string are dropped.
 """
 
 XATTRS_OPTIONS = {"linux": [
@@ -196,6 +212,56 @@ COMPRESS_DEFINITIONS = {
                 ],
                 "GZIP", ["tar.gz"], {"tar"},
             ],
+    "pigz": [
+                "_common", "tar",
+                [
+                    "other_options", "%(comp_prog)s", "'pigz -p %(threads)s'",
+                    "-cpf", "%(filename)s", "-C", "%(basedir)s", "%(source)s"
+                ],
+                "PIGZ", ["tar.gz"], {"tar", "pigz"},
+            ],
+    "pbzip2": [
+                "_common", "tar",
+                [
+                    "other_options", "%(comp_prog)s", "'pbzip2 -p%(threads)s'",
+                    "-cpf", "%(filename)s", "-C", "%(basedir)s", "%(source)s"
+                ],
+                "PBZIP2", ["tar.bz2"], {"tar", "pbzip2"},
+              ],
+    "xz_mt": [
+                "_common", "tar",
+                [
+                    "other_options", "%(comp_prog)s", "'xz -T%(threads)s'",
+                    "-cpf", "%(filename)s", "-C", "%(basedir)s", "%(source)s"
+                ],
+                "XZ_MT", ["tar.xz"], {"tar", "xz"},
+             ],
+    "zstd_mt": [
+                "_common", "tar",
+                [
+                    "other_options", "%(comp_prog)s", "'zstd -T%(threads)s'",
+                    "-cpf", "%(filename)s", "-C", "%(basedir)s", "%(source)s"
+                ],
+                "ZSTD_MT", ["tar.zstd", "tar.zst", "tzst", "zst"],
+                {"tar", "zstd"},
+            ],
+    "zstd_seekable": [
+                "_seekable", "tar",
+                [
+                    "other_options", "-cpf", "-", "-C", "%(basedir)s",
+                    "%(source)s"
+                ],
+                "ZSTD_SEEKABLE", ["tar.zst", "tar.zstd", "tzst", "zst"],
+                {"tar", "zstd"},
+            ],
+    "xz_seekable": [
+                "_seekable", "tar",
+                [
+                    "other_options", "-cpf", "-", "-C", "%(basedir)s",
+                    "%(source)s"
+                ],
+                "XZ_SEEKABLE", ["tar.xz", "txz", "xz"], {"tar"},
+            ],
     "squashfs_xz": [
                     "_sqfs", "mksquashfs",
                     [
@@ -330,6 +396,33 @@ DECOMPRESS_DEFINITIONS = {
                 ],
                 "GZIP", ["tar.gz", "gz"], {"tar"},
             ],
+    "pigz": [
+                "_common", "tar",
+                [
+                    "other_options", "%(comp_prog)s", "'pigz -p %(threads)s'",
+                    "%(decomp_opt)s", "-xpf", "%(source)s",
+                    "-C", "%(destination)s"
+                ],
+                "PIGZ", ["tar.gz", "gz"], {"tar", "pigz"},
+            ],
+    "pbzip2": [
+                "_common", "tar",
+                [
+                    "other_options", "%(comp_prog)s", "'pbzip2 -p%(threads)s'",
+                    "%(decomp_opt)s", "-xpf", "%(source)s",
+                    "-C", "%(destination)s"
+                ],
+                "PBZIP2", ["tar.bz2", "bz2", "tbz2"], {"tar", "pbzip2"},
+              ],
+    "xz_mt": [
+                "_common", "tar",
+                [
+                    "other_options", "%(comp_prog)s", "'xz -T%(threads)s'",
+                    "%(decomp_opt)s", "-xpf", "%(source)s",
+                    "-C", "%(destination)s"
+                ],
+                "XZ_MT", ["tar.xz", "xz"], {"tar", "xz"},
+             ],
     "squashfs": [
                     "_common", "unsquashfs",
                     [
@@ -338,22 +431,275 @@ DECOMPRESS_DEFINITIONS = {
                     ],
                     "SQUASHFS", ["squashfs", "sfs"], {"unsquashfs"},
                 ],
+    "zstd_seekable": [
+                "_seekable", "tar",
+                ["other_options", "-xpf", "-", "-C", "%(destination)s"],
+                "ZSTD_SEEKABLE", ["tar.zst", "tar.zstd", "tzst", "zst"],
+                {"tar", "zstd"},
+            ],
+    "xz_seekable": [
+                "_seekable", "tar",
+                ["other_options", "-xpf", "-", "-C", "%(destination)s"],
+                "XZ_SEEKABLE", ["tar.xz", "txz", "xz"], {"tar"},
+            ],
     }
 
 
+# the seekable modes are only chosen by sniffing an archive's seek table
 DECOMPRESSOR_SEARCH_ORDER = [
-    "zstd", "pzstd", "pixz", "lbzip2", "squashfs", "gzip", "xz", "bzip2", "tar"
+    "zstd", "pzstd", "pixz", "lbzip2", "squashfs", "gzip", "xz", "bzip2", "tar",
+    "zstd_seekable", "xz_seekable"
 ]
 
 DECOMPRESSOR_XATTR_SEARCH_ORDER = [
     "zstd", "pzstd", "pixz_x", "lbzip2_x", "squashfs", "gzip_x", "xz_x", "bzip2_x", "tar_x"
 ]
 
+# The modes whose utilities already use all of the cores by themselves.
+# Used by the batch schedulers to avoid oversubscribing the cores.
+MULTI_THREADED_MODES = {
+    "lbzip2", "pixz", "pixz_i", "pixz_x", "pzstd",
+    "squashfs", "squashfs_xz", "squashfs_gzip", "squashfs_zstd",
+    "squashfs_pzstd", "zstd_seekable", "xz_seekable",
+    "pigz", "pbzip2", "xz_mt", "zstd_mt",
+}
+
+# The tar option selecting the decompressor for the modes relying on
+# tar detecting the compression from the archive file, which it can not
+# do while reading the archive from a stream
+STREAM_TAR_OPTIONS = {
+    "XZ": "-J",
+    "BZIP2": "-j",
+}
+
+# The parallel modes substituted for the single threaded modes by the
+# CompressMap parallel option, in order of preference.  Each one reads and
+# writes the same format as the mode it replaces, the ones not available
+# or not in the loaded definitions are skipped.
+PARALLEL_SUBSTITUTES = {
+    "gzip": ["pigz"],
+    "bzip2": ["lbzip2", "pbzip2"],
+    "xz": ["pixz", "xz_mt"],
+    "zstd": ["zstd_mt", "pzstd"],
+}
+
+# The typed codec parameters of compress() and extract(), by codec.
+# Each parameter maps to its (option format, minimum, maximum, operations),
+# a maximum of None is unbounded and the operations are the ones the codec
+# takes the parameter for.  memory_limit is in MiB and window is the log2
+# of the match window size.  The threads options are also added by a
+# ResourceGovernor, see governor.thread_options().
+CODEC_OPTIONS = {
+    "zstd": {
+        "level": ("--ultra -%d", 1, 22, ("compress",)),
+        "threads": ("-T%d", 0, None, ("compress",)),
+        "memory_limit": ("--memory=%dMiB", 1, None, ("extract",)),
+        "window": ("--long=%d", 10, 31, ("compress", "extract")),
+    },
+    "pzstd": {
+        "level": ("-%d", 1, 19, ("compress",)),
+        "threads": ("-p %d", 1, None, ("compress", "extract")),
+    },
+    "xz": {
+        "level": ("-%d", 0, 9, ("compress",)),
+        "threads": ("-T%d", 0, None, ("compress", "extract")),
+        "memory_limit": ("--memlimit=%dMiB", 1, None, ("compress", "extract")),
+    },
+    "pixz": {
+        "level": ("-%d", 0, 9, ("compress",)),
+        "threads": ("-p %d", 1, None, ("compress", "extract")),
+    },
+    "gzip": {
+        "level": ("-%d", 1, 9, ("compress",)),
+    },
+    "pigz": {
+        "level": ("-%d", 0, 9, ("compress",)),
+        "threads": ("-p %d", 1, None, ("compress", "extract")),
+    },
+    "bzip2": {
+        "level": ("-%d", 1, 9, ("compress",)),
+    },
+    "lbzip2": {
+        "level": ("-%d", 1, 9, ("compress",)),
+        "threads": ("-n %d", 1, None, ("compress", "extract")),
+    },
+    "pbzip2": {
+        "level": ("-%d", 1, 9, ("compress",)),
+        "threads": ("-p%d", 1, None, ("compress", "extract")),
+        "memory_limit": ("-m%d", 1, None, ("extract",)),
+    },
+    "lzip": {
+        "level": ("-%d", 0, 9, ("compress",)),
+    },
+    "lzma": {
+        "level": ("-%d", 0, 9, ("compress",)),
+        "memory_limit": ("--memlimit=%dMiB", 1, None, ("compress", "extract")),
+    },
+    "lzop": {
+        "level": ("-%d", 1, 9, ("compress",)),
+    },
+    "mksquashfs": {
+        "threads": ("-processors %d", 1, None, ("compress",)),
+        "memory_limit": ("-mem %dM", 1, None, ("compress",)),
+    },
+    "unsquashfs": {
+        "threads": ("-processors %d", 1, None, ("extract",)),
+    },
+}
+
+# The codecs taking their options after the paths
+OPTIONS_LAST = {"mksquashfs"}
+
+# The codec of the tar modes by definition id, other modes run their
+# codec as the command
+MODE_CODECS = {
+    "XZ": "xz",
+    "XZ_MT": "xz",
+    "PIXZ": "pixz",
+    "ZSTD": "zstd",
+    "ZSTD_MT": "zstd",
+    "PZSTD": "pzstd",
+    "GZIP": "gzip",
+    "PIGZ": "pigz",
+    "BZIP2": "bzip2",
+    "LBZIP2": "lbzip2",
+    "PBZIP2": "pbzip2",
+    "LZIP": "lzip",
+    "LZ": "lzma",
+    "LZOP": "lzop",
+}
+
+# The tar option letters running a codec by tar itself.  When the codec
+# is given parameters, the letter is replaced by the compress program
+# option running the codec with its options.
+TAR_CODEC_LETTERS = {
+    "xz": "J",
+    "gzip": "z",
+    "bzip2": "j",
+}
+
+# The codec parameters of the seekable modes, the level is passed
+# through COMPRESS_LEVEL_ENV and the threads compress the frames
+SEEKABLE_PARAMETERS = ("level", "threads")
+
+# Environment variable and value format setting the number of threads
+# of the codec tar runs by itself, by definition id
+THREAD_ENV = {
+    "XZ": ("XZ_OPT", "-T%d"),
+}
+
+# Environment variable and value format setting the compression level
+# of the codec, used by the seekable modes compressing the frames
+# in this process.
+COMPRESS_LEVEL_ENV = {
+    "xz": ("XZ_OPT", "-%d"),
+    "zstd": ("ZSTD_CLEVEL", "%d"),
+}
+
+# The (mode, level) candidates measured by the adaptive 'auto'
+# compression mode, the ones not available are skipped.
+# A level of None runs the mode at its default level.
+ADAPTIVE_CANDIDATES = [
+    ("zstd", 1), ("zstd", 3), ("zstd", 9), ("zstd", 19),
+    ("pzstd", None), ("gzip", None), ("lbzip2", None),
+    ("bzip2", 9), ("xz", 1), ("xz", 6), ("pixz", None),
+]
+
+# Bytes of the source tree sampled to measure the adaptive candidates
+ADAPTIVE_SAMPLE_SIZE = 4 * 1024 * 1024
+
+# Without any target, the adaptive mode picks the smallest output of the
+# candidates estimated to take at most this factor of the fastest one's time
+ADAPTIVE_TIME_FACTOR = 4.0
+
+# The codec of the seekable multi-frame modes by definition id,
+# the contents definitions use the codec as their cmd
+SEEKABLE_CODECS = {
+    "ZSTD_SEEKABLE": "zstd",
+    "XZ_SEEKABLE": "xz",
+}
+
+# The uncompressed size of each frame of the seekable modes
+SEEKABLE_FRAME_SIZE = 4 * 1024 * 1024
+
+# The integrity test commands by definition id, used by
+# CompressMap.test().  Each decompresses the archive, discarding the data.
+# The squashfs images are listed, which reads all of their metadata.
+TEST_COMMANDS = {
+    "TAR": ["tar", "-tf", "%(source)s"],
+    "GZIP": ["gzip", "-t", "%(source)s"],
+    "PIGZ": ["pigz", "-t", "%(source)s"],
+    "BZIP2": ["bzip2", "-t", "%(source)s"],
+    "LBZIP2": ["lbzip2", "-t", "%(source)s"],
+    "PBZIP2": ["pbzip2", "-t", "%(source)s"],
+    "XZ": ["xz", "-t", "%(source)s"],
+    "XZ_MT": ["xz", "-T%(threads)s", "-t", "%(source)s"],
+    "XZ_SEEKABLE": ["xz", "-t", "%(source)s"],
+    "PIXZ": ["xz", "-t", "%(source)s"],
+    "ZSTD": ["zstd", "-q", "-t", "%(source)s"],
+    "ZSTD_MT": ["zstd", "-q", "-t", "%(source)s"],
+    "ZSTD_SEEKABLE": ["zstd", "-q", "-t", "%(source)s"],
+    "PZSTD": ["pzstd", "-q", "-t", "%(source)s"],
+    "LZIP": ["lzip", "-t", "%(source)s"],
+    "LZ": ["xz", "--format=lzma", "-t", "%(source)s"],
+    "LZOP": ["lzop", "-t", "%(source)s"],
+    "SQUASHFS": ["unsquashfs", "-n", "-l", "%(source)s"],
+}
+
 """Configure this here in case it is ever changed.
 This is the only edit point required then."""
 EXTENSION_SEPARATOR = '.'
 
 
+# Magic byte signatures used to identify an archive from its content.
+# Each entry is: (format, offset, signature bytes)
+# The offsets are from the start of the file.
+MAGIC_SIGNATURES = [
+    ("zstd", 0, b"\x28\xb5\x2f\xfd"),
+    ("xz", 0, b"\xfd7zXZ\x00"),
+    ("bzip2", 0, b"BZh"),
+    ("gzip", 0, b"\x1f\x8b"),
+    ("lzip", 0, b"LZIP"),
+    ("lzop", 0, b"\x89LZO\x00\r\n\x1a\n"),
+    ("squashfs", 0, b"hsqs"),
+    ("squashfs", 0, b"sqsh"),
+    ("tar", 257, b"ustar"),
+    ("iso9660", 32769, b"CD001"),
+]
+
+# The number of bytes read from the start of a file to check all
+# signatures within it.  Signatures beyond it (iso9660) get a second
+# small read only if nothing matched in the first one.
+SNIFF_SIZE = 4096
+
+# The maximum number of (path, inode, mtime) sniff results cached
+SNIFF_CACHE_SIZE = 65536
+
+# Maps the sniffed format to the definition id strings able to handle it.
+# The search_order then selects the best available mode among them.
+MAGIC_FORMAT_IDS = {
+    "zstd": {"ZSTD", "PZSTD", "ZSTD_MT"},
+    "zstd_seekable": {"ZSTD_SEEKABLE"},
+    "xz": {"XZ", "PIXZ", "PY_XZ", "XZ_MT"},
+    "xz_seekable": {"XZ_SEEKABLE"},
+    "bzip2": {"BZIP2", "LBZIP2", "PY_BZIP2", "PBZIP2"},
+    "gzip": {"GZIP", "PY_GZIP", "PIGZ"},
+    "lzip": {"LZIP"},
+    "lzop": {"LZOP"},
+    "squashfs": {"SQUASHFS", "PY_SQUASHFS"},
+    "tar": {"TAR", "PY_TAR"},
+    "iso9660": {"ISOINFO", "PY_ISO9660"},
+}
+
+# The format sniffed for the archives of a format with a seek table,
+# see seekable.py.  The archive falls back to its plain format if none of
+# the seekable modes is available.
+SEEKABLE_FORMATS = {
+    "zstd": "zstd_seekable",
+    "xz": "xz_seekable",
+}
+
+
 CONTENTS_DEFINITIONS = {
     "tar": [
                 "_common", "tar",
@@ -422,11 +768,68 @@ CONTENTS_DEFINITIONS = {
                     ["-ll", "%(source)s"],
                     "SQUASHFS", ["squashfs", "sfs"], {"unsquashfs"},
                 ],
+    # In process python tarfile modes, the cmd is the tarfile.open() mode
+    "py_tar": [
+                "_tarfile", "r|",
+                [],
+                "PY_TAR", [".tar"], set(),
+              ],
+    "py_gzip": [
+                "_tarfile", "r|gz",
+                [],
+                "PY_GZIP", [".tgz", ".tar.gz", "gz"], set(),
+               ],
+    "py_bzip2": [
+                "_tarfile", "r|bz2",
+                [],
+                "PY_BZIP2", [".tbz2", "bz2", ".tar.bz2"], set(),
+                ],
+    "py_xz": [
+                "_tarfile", "r|xz",
+                [],
+                "PY_XZ", ["tar.xz", "txz", "xz"], set(),
+             ],
+    "zstd_seekable": [
+                "_seekable", "zstd",
+                [],
+                "ZSTD_SEEKABLE", ["tar.zst", "tar.zstd", "tzst", "zst"],
+                {"zstd"},
+             ],
+    "xz_seekable": [
+                "_seekable", "xz",
+                [],
+                "XZ_SEEKABLE", ["tar.xz", "txz", "xz"], set(),
+             ],
+    # In process squashfs image reader, the cmd is the image format
+    "py_squashfs": [
+                "_squashfs", "squashfs",
+                [],
+                "PY_SQUASHFS", ["squashfs", "sfs"], set(),
+                   ],
+    # In process iso9660 image reader, the cmd is the image format
+    "py_iso9660": [
+                "_iso9660", "iso9660",
+                [],
+                "PY_ISO9660", ['.iso'], set(),
+                  ],
 }
 
 # isoinfo_f should be a last resort only
+# the seekable modes are only chosen by sniffing an archive's seek table
 CONTENTS_SEARCH_ORDER = [
     "zstd", "pzstd",
     "pixz", "lbzip2", "isoinfo_l", "squashfs",
-    "gzip", "xz", "bzip2", "tar", "isoinfo_f"
+    "gzip", "xz", "bzip2", "tar", "isoinfo_f",
+    "zstd_seekable", "xz_seekable"
+]
+
+# Prefers the in process python modes where possible
+# py_squashfs falls back to unsquashfs for the images it can not read,
+# py_iso9660 is tried before isoinfo
+CONTENTS_NATIVE_SEARCH_ORDER = [
+    "zstd", "pzstd",
+    "py_xz", "py_bzip2", "py_gzip", "py_tar",
+    "pixz", "lbzip2", "py_iso9660", "isoinfo_l", "py_squashfs", "squashfs",
+    "gzip", "xz", "bzip2", "tar", "isoinfo_f",
+    "zstd_seekable", "xz_seekable"
 ]
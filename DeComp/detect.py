@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+"""
+detect.py
+
+Archive format detection functions used by the CompressMap and
+ContentsMap classes to determine the mode to use for a file.
+
+The content sniffing reads a small header from the start of the file
+and compares it to the MAGIC_SIGNATURES in definitions.py.  The zstd
+and xz archives also have their end read for a seek table, only those
+having one are handled by the seekable modes.  No subprocesses are run.
+Results are cached per (path, inode, mtime), so classifying the same
+files again costs only a stat() call.
+
+The SuffixIndex class handles the file extension matching.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import os
+import stat
+from collections import OrderedDict
+
+from DeComp.definitions import (MAGIC_SIGNATURES, MAGIC_FORMAT_IDS,
+                                SEEKABLE_FORMATS, SNIFF_SIZE, SNIFF_CACHE_SIZE)
+from DeComp.seekable import is_seekable
+
+
+_SNIFF_CACHE = OrderedDict()
+
+
+def clear_sniff_cache():
+    """Empties the cached sniff results"""
+    _SNIFF_CACHE.clear()
+
+
+def _match_signature(header, offset=0):
+    """Compares the header bytes to the known magic signatures
+
+    :param header: the bytes read from the file
+    :type header: bytes
+    :param offset: the file offset the header was read from
+    :type offset: integer
+    :returns: string: the format name or None
+    """
+    for fmt, start, magic in MAGIC_SIGNATURES:
+        start -= offset
+        if start < 0:
+            continue
+        if header[start:start + len(magic)] == magic:
+            return fmt
+    return None
+
+
+def _read_format(source):
+    """Reads the file header(s) and returns the matching format
+
+    :param source: path to the file
+    :type source: string
+    :returns: string: the format name or None
+    """
+    fd = os.open(source, os.O_RDONLY)
+    try:
+        header = os.read(fd, SNIFF_SIZE)
+        fmt = _match_signature(header)
+        if fmt or len(header) < SNIFF_SIZE:
+            return fmt
+        # only the signatures located past the first read are left
+        start = min(x[1] for x in MAGIC_SIGNATURES if x[1] >= SNIFF_SIZE)
+        end = max(x[1] + len(x[2]) for x in MAGIC_SIGNATURES)
+        os.lseek(fd, start, os.SEEK_SET)
+        return _match_signature(os.read(fd, end - start), start)
+    finally:
+        os.close(fd)
+
+
+def match_format(header):
+    """Determines the archive format from the first bytes of an archive,
+    for streams which can not be sniffed by path
+
+    :param header: the archive's first bytes, SNIFF_SIZE of them
+    :type header: bytes
+    :returns: string: the format name, see MAGIC_SIGNATURES or None
+    """
+    return _match_signature(header)
+
+
+def sniff_format(source):
+    """Determines the archive format of a file from its content
+
+    :param source: path to the file
+    :type source: string
+    :returns: string: the format name, see MAGIC_SIGNATURES or None
+    """
+    try:
+        info = os.stat(source)
+    except OSError:
+        return None
+    if not (stat.S_ISREG(info.st_mode) or stat.S_ISBLK(info.st_mode)):
+        return None
+    key = (source, info.st_ino, info.st_mtime)
+    if key in _SNIFF_CACHE:
+        return _SNIFF_CACHE[key]
+    try:
+        fmt = _read_format(source)
+    except OSError:
+        return None
+    if fmt in SEEKABLE_FORMATS and is_seekable(source, fmt):
+        fmt = SEEKABLE_FORMATS[fmt]
+    _SNIFF_CACHE[key] = fmt
+    if len(_SNIFF_CACHE) > SNIFF_CACHE_SIZE:
+        _SNIFF_CACHE.popitem(last=False)
+    return fmt
+
+
+def sniff_mode(source, search_order, modes, available):
+    """Returns the best available mode able to handle the source file's
+    sniffed format.
+
+    :param source: path to the file
+    :type source: string
+    :param search_order: the mode search order
+    :type search_order: list of strings
+    :param modes: the mode definitions namedtuple class instances
+    :type modes: dictionary
+    :param available: the confirmed installed binaries
+    :type available: set
+    :returns: string: the mode to use or None
+    """
+    fmt = sniff_format(source)
+    mode = format_mode(fmt, search_order, modes, available)
+    for plain, seekable in SEEKABLE_FORMATS.items():
+        if mode is None and fmt == seekable:
+            # no seekable mode, handle it as its plain format
+            mode = format_mode(plain, search_order, modes, available)
+    return mode
+
+
+def format_mode(fmt, search_order, modes, available, skip_func=None):
+    """Returns the best available mode able to handle the format
+
+    :param fmt: the format, one of the MAGIC_FORMAT_IDS keys
+    :type fmt: string
+    :param search_order: the mode search order
+    :type search_order: list of strings
+    :param modes: the mode definitions namedtuple class instances
+    :type modes: dictionary
+    :param available: the confirmed installed binaries
+    :type available: set
+    :param skip_func: optional definition func whose modes are skipped
+    :type skip_func: string
+    :returns: string: the mode to use or None
+    """
+    ids = MAGIC_FORMAT_IDS.get(fmt)
+    if not ids:
+        return None
+    for mode in search_order:
+        if mode in modes and modes[mode].id in ids and \
+           modes[mode].func != skip_func and \
+           modes[mode].enabled(available):
+            return mode
+    return None
+
+
+class SuffixIndex(object):
+    """Reverse file extension index for fast mode resolution.
+
+    Holds the extensions of the search_order modes, each mapped to its
+    modes in priority order.  A lookup then costs one dictionary lookup per
+    distinct extension length.  Unless it is lazy, only the available modes
+    are indexed, otherwise availability is tested when a mode is resolved.
+    """
+
+    __slots__ = ('_index', '_lengths', '_modes', '_available', '_lazy')
+
+    def __init__(self, search_order, modes, available, lazy=False):
+        """Class init
+
+        :param search_order: the mode search order, highest priority first
+        :type search_order: list of strings
+        :param modes: the mode definitions namedtuple class instances
+        :type modes: dictionary
+        :param available: the confirmed installed binaries
+        :type available: set or LazyAvailable
+        :param lazy: defer the availability test to lookup() time
+        :type lazy: boolean
+        """
+        self._index = {}
+        self._modes = modes
+        self._available = available
+        self._lazy = lazy
+        for priority, mode in enumerate(search_order):
+            if mode not in modes:
+                continue
+            if not lazy and not modes[mode].enabled(available):
+                continue
+            for ext in modes[mode].extensions or []:
+                if ext:
+                    self._index.setdefault(ext, []).append((priority, mode))
+        self._lengths = sorted(set(len(ext) for ext in self._index))
+
+    def _first(self, candidates):
+        """Returns the first enabled (priority, mode) of the candidates"""
+        if not self._lazy:
+            return candidates[0]
+        for hit in candidates:
+            if self._modes[hit[1]].enabled(self._available):
+                return hit
+        return None
+
+    def lookup(self, source):
+        """Returns the highest priority mode with an extension matching
+        the end of the source filename
+
+        :param source: file path of the file to determine
+        :type source: string
+        :returns: string: the mode or None
+        """
+        best_rank = 0
+        best_mode = None
+        size = len(source)
+        for length in self._lengths:
+            if length > size:
+                break
+            candidates = self._index.get(source[-length:])
+            if candidates and (best_mode is None or
+                               candidates[0][0] < best_rank):
+                hit = self._first(candidates)
+                if hit and (best_mode is None or hit[0] < best_rank):
+                    best_rank, best_mode = hit
+        return best_mode
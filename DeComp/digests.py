@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+digests.py
+
+Archive digests computed while the archive is being written or read,
+instead of reading the archive again afterwards.
+
+The DIGESTS sidecar files use the release DIGESTS format:
+
+    # SHA512 HASH
+    <hex digest>  <archive file name>
+    # BLAKE2B HASH
+    <hex digest>  <archive file name>
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import hashlib
+import os
+
+
+# Suffix of the DIGESTS sidecar file written next to the archive
+DIGESTS_SUFFIX = ".DIGESTS"
+
+# Read size used to digest an archive file
+DIGEST_BLOCK = 1 << 20
+
+
+class Digests(object):
+    """The running digests of one archive"""
+
+    def __init__(self, names):
+        """Class init
+
+        :param names: the hashlib algorithm names, eg: 'sha512', 'blake2b'
+        :type names: list of strings
+        :raises ValueError: for an unknown algorithm
+        """
+        self.names = [x.lower() for x in names]
+        self._hashers = [hashlib.new(x) for x in self.names]
+        # the number of bytes digested
+        self.size = 0
+
+
+    def update(self, data):
+        """Adds the next archive data to the digests
+
+        :param data: the archive data
+        :type data: bytes
+        """
+        for hasher in self._hashers:
+            hasher.update(data)
+        self.size += len(data)
+
+
+    def reset(self):
+        """Restarts the digests from the start of the archive"""
+        self._hashers = [hashlib.new(x) for x in self.names]
+        self.size = 0
+
+
+    def hexdigests(self):
+        """Returns the digests
+
+        :returns: dictionary of the hex digest by algorithm name
+        """
+        return dict(zip(self.names, [x.hexdigest() for x in self._hashers]))
+
+
+    def digest_file(self, path):
+        """Digests the whole archive file, replacing any partial digests
+
+        :param path: path to the archive
+        :type path: string
+        :raises IOError: if the file can not be read
+        """
+        self.reset()
+        with open(path, 'rb') as archive:
+            while True:
+                block = archive.read(DIGEST_BLOCK)
+                if not block:
+                    break
+                self.update(block)
+
+
+class DigestWriter(object):
+    """Writable file object wrapper digesting the data written"""
+
+    def __init__(self, target, digests):
+        """Class init
+
+        :param target: the file object written to
+        :type target: file object
+        :param digests: the digests to update
+        :type digests: Digests
+        """
+        self._target = target
+        self._digests = digests
+
+
+    def write(self, data):
+        """Digests the data, then writes it to the target
+
+        :param data: the data to write
+        :type data: bytes
+        :returns: the target's write() result
+        """
+        self._digests.update(data)
+        return self._target.write(data)
+
+
+    def flush(self):
+        """Flushes the target"""
+        self._target.flush()
+
+
+def write_digests(path, digests):
+    """Writes the DIGESTS sidecar file of the archive
+
+    :param path: path to the archive
+    :type path: string
+    :param digests: the hex digest by algorithm name
+    :type digests: dictionary
+    :returns: string, the sidecar file path
+    :raises IOError: if the file can not be written
+    """
+    name = os.path.basename(path)
+    sidecar = path + DIGESTS_SUFFIX
+    with open(sidecar, 'w', encoding='UTF-8') as output:
+        for algorithm in sorted(digests):
+            output.write("# %s HASH\n" % algorithm.upper())
+            output.write("%s  %s\n" % (digests[algorithm], name))
+    return sidecar
+
+
+def read_digests(path):
+    """Reads the archive's digests from its DIGESTS sidecar file
+
+    :param path: path to the archive
+    :type path: string
+    :returns: dictionary of the hex digest by algorithm name,
+              only the ones listed for the archive's file name
+    :raises IOError: if the file can not be read
+    """
+    name = os.path.basename(path)
+    digests = {}
+    algorithm = None
+    with open(path + DIGESTS_SUFFIX, encoding='UTF-8') as source:
+        for line in source:
+            line = line.strip()
+            if line.startswith('#'):
+                words = line.lstrip('#').split()
+                algorithm = words[0].lower() if len(words) == 2 and \
+                    words[1] == "HASH" else None
+            elif line and algorithm:
+                parts = line.split(None, 1)
+                if len(parts) == 2 and parts[1] == name:
+                    digests[algorithm] = parts[0].lower()
+    return digests
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+
+"""
+entries.py
+
+The structured contents listing entry record, its text formatting
+functions and the compact EntryTable with its query functions.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import json
+import stat
+import struct
+import sys
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from heapq import nlargest
+from sys import intern
+
+
+ENTRY_FIELDS = ["name", "size", "mode", "uid", "gid", "uname", "gname",
+                "mtime", "linkname", "xattrs"]
+
+# Width of the "owner/group size" tar -tv listing column
+UGS_WIDTH = 19
+
+# Version of the EntryTable.to_bytes() format
+TABLE_FORMAT = 1
+
+_INT_COLUMNS = ('sizes', 'modes', 'uids', 'gids', 'mtimes')
+_STR_COLUMNS = ('names', 'unames', 'gnames', 'linknames')
+
+
+class ContentsEntry(namedtuple("ContentsEntry", ENTRY_FIELDS)):
+    """One archive member.
+
+    name:      the member path
+    size:      size in bytes
+    mode:      st_mode style integer, including the file type bits
+    uid, gid:  integer ids, -1 if unknown
+    uname, gname: owner names, '' if unknown
+    mtime:     modification time in seconds since the epoch
+    linkname:  the symlink or hardlink target, '' if not a link
+    xattrs:    dictionary of the extended attributes or None
+    """
+
+    # reduce memory used by limiting it to the predefined fields variables
+    __slots__ = ()
+
+    @property
+    def is_dir(self):
+        """True if the entry is a directory"""
+        return stat.S_ISDIR(self.mode)
+
+    @property
+    def is_symlink(self):
+        """True if the entry is a symbolic link"""
+        return stat.S_ISLNK(self.mode)
+
+    @property
+    def is_hardlink(self):
+        """True if the entry is a hard link to another member"""
+        return stat.S_ISREG(self.mode) and bool(self.linkname)
+
+
+def tar_line(entry, xattrs=False):
+    """Formats an entry the way a `tar -tv` listing does
+
+    :param entry: the entry to format
+    :type entry: ContentsEntry
+    :param xattrs: format it as `tar --xattrs -tv` does, with an extended
+                   attributes flag after the permissions
+    :type xattrs: boolean
+    :returns: string
+    """
+    owner = "%s/%s" % (entry.uname or entry.uid, entry.gname or entry.gid)
+    size = str(entry.size)
+    pad = ' ' * max(1, UGS_WIDTH - len(owner) - len(size))
+    name = entry.name
+    perms = stat.filemode(entry.mode)
+    if entry.is_dir and not name.endswith('/'):
+        name += '/'
+    if entry.is_symlink:
+        name = "%s -> %s" % (name, entry.linkname)
+    elif entry.is_hardlink:
+        name = "%s link to %s" % (name, entry.linkname)
+        perms = 'h' + perms[1:]
+    if xattrs:
+        perms += '*' if entry.xattrs else ' '
+    return "%s %s%s%s %s %s" % (
+        perms, owner, pad, size,
+        time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.mtime)), name)
+
+
+def _clean_name(name):
+    """Normalizes a member path for the lookups, no leading './' or '/'
+    and no trailing '/'"""
+    if name.startswith('./'):
+        name = name[2:]
+    return name.strip('/')
+
+
+class EntryTable(object):
+    """Compact column based table of contents listing entries.
+
+    Each field is stored in its own column, the integer fields in
+    arrays and the strings interned, so repeated owner names and link
+    targets are only held once.  Rows are returned as ContentsEntry
+    instances on access.
+    """
+
+    __slots__ = ('names', 'sizes', 'modes', 'uids', 'gids', 'unames',
+                 'gnames', 'mtimes', 'linknames', 'xattrs', '_sorted')
+
+    def __init__(self, entries=None):
+        """Class init
+
+        :param entries: optional entries to load
+        :type entries: iterable of ContentsEntry
+        """
+        self.names = []
+        self.sizes = array('q')
+        self.modes = array('L')
+        self.uids = array('l')
+        self.gids = array('l')
+        self.unames = []
+        self.gnames = []
+        self.mtimes = array('q')
+        self.linknames = []
+        # sparse, only the entries having any: index: dictionary
+        self.xattrs = {}
+        self._sorted = None
+        if entries is not None:
+            self.extend(entries)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        return ContentsEntry(
+            self.names[index], self.sizes[index], self.modes[index],
+            self.uids[index], self.gids[index], self.unames[index],
+            self.gnames[index], self.mtimes[index], self.linknames[index],
+            self.xattrs.get(index))
+
+    def __iter__(self):
+        for index in range(len(self.names)):
+            yield self[index]
+
+    def __repr__(self):
+        return "<EntryTable: %d entries>" % len(self.names)
+
+    def append(self, entry):
+        """Adds an entry to the table
+
+        :param entry: the entry to add
+        :type entry: ContentsEntry
+        """
+        if entry.xattrs:
+            self.xattrs[len(self.names)] = entry.xattrs
+        self.names.append(intern(entry.name))
+        self.sizes.append(entry.size)
+        self.modes.append(entry.mode)
+        self.uids.append(entry.uid)
+        self.gids.append(entry.gid)
+        self.unames.append(intern(entry.uname))
+        self.gnames.append(intern(entry.gname))
+        self.mtimes.append(int(entry.mtime))
+        self.linknames.append(intern(entry.linkname))
+        self._sorted = None
+
+    def extend(self, entries):
+        """Adds the entries to the table
+
+        :param entries: the entries to add
+        :type entries: iterable of ContentsEntry
+        """
+        for entry in entries:
+            self.append(entry)
+
+    def select(self, indexes):
+        """Returns a new table of the rows at the indexes
+
+        :param indexes: the row indexes
+        :type indexes: iterable of integers
+        :returns: EntryTable
+        """
+        table = EntryTable()
+        table.extend(self[index] for index in indexes)
+        return table
+
+    def filter(self, predicate):
+        """Returns a new table of the entries the predicate is true for
+
+        :param predicate: function accepting a ContentsEntry
+        :type predicate: function
+        :returns: EntryTable
+        """
+        return EntryTable(x for x in self if predicate(x))
+
+    def _sorted_names(self):
+        """Returns the (cleaned name, index) list sorted by name,
+        built on first use"""
+        if self._sorted is None:
+            self._sorted = sorted(
+                (_clean_name(name), index) for index, name in enumerate(self.names))
+        return self._sorted
+
+    def lookup(self, name):
+        """Returns the entry of the member path
+
+        :param name: the member path
+        :type name: string
+        :returns: ContentsEntry or None
+        """
+        name = _clean_name(name)
+        ordered = self._sorted_names()
+        pos = bisect_left(ordered, (name, -1))
+        if pos < len(ordered) and ordered[pos][0] == name:
+            return self[ordered[pos][1]]
+        return None
+
+    def prefix(self, path):
+        """Returns the entries at or below the directory path
+
+        :param path: the directory path
+        :type path: string
+        :returns: EntryTable
+        """
+        path = _clean_name(path)
+        ordered = self._sorted_names()
+        indexes = []
+        if path:
+            pos = bisect_left(ordered, (path, -1))
+            if pos < len(ordered) and ordered[pos][0] == path:
+                indexes.append(ordered[pos][1])
+            path += '/'
+        pos = bisect_left(ordered, (path, -1))
+        while pos < len(ordered) and ordered[pos][0].startswith(path):
+            indexes.append(ordered[pos][1])
+            pos += 1
+        return self.select(sorted(indexes))
+
+    def total_size(self):
+        """Returns the sum of all the entry sizes"""
+        return sum(self.sizes)
+
+    def size_by_directory(self, depth=1):
+        """Totals the entry sizes by their parent directory path,
+        truncated to the depth number of path components.
+
+        :param depth: number of leading path components to group by
+        :type depth: integer
+        :returns: dictionary of directory: total size
+        """
+        totals = defaultdict(int)
+        for index, name in enumerate(self.names):
+            parts = _clean_name(name).split('/')[:-1]
+            totals['/'.join(parts[:depth])] += self.sizes[index]
+        return dict(totals)
+
+    def largest(self, count=10):
+        """Returns the largest entries
+
+        :param count: the number of entries to return
+        :type count: integer
+        :returns: list of ContentsEntry, largest first
+        """
+        indexes = nlargest(count, range(len(self.sizes)),
+                           key=self.sizes.__getitem__)
+        return [self[index] for index in indexes]
+
+    def to_bytes(self):
+        """Serializes the table to a compact, platform independent
+        zlib compressed form
+
+        :returns: bytes
+        """
+        parts = []
+        for column in _INT_COLUMNS:
+            data = array('q', getattr(self, column))
+            if data.itemsize != 8:
+                raise ValueError("EntryTable: no 64 bit integer array type")
+            if sys.byteorder == 'big':
+                data.byteswap()
+            parts.append(data.tobytes())
+        for column in _STR_COLUMNS:
+            parts.append('\0'.join(getattr(self, column)).encode(
+                'UTF-8', 'surrogateescape'))
+        parts.append(json.dumps(dict((str(index), value) for index, value
+                                     in self.xattrs.items())).encode('UTF-8'))
+        header = struct.pack('<BI%dI' % len(parts), TABLE_FORMAT,
+                             len(self.names), *[len(x) for x in parts])
+        return zlib.compress(header + b''.join(parts))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Loads a table serialized by to_bytes()
+
+        :param data: the serialized table
+        :type data: bytes
+        :returns: EntryTable
+        :raises ValueError: if the data is not a valid serialized table
+        """
+        try:
+            data = zlib.decompress(data)
+        except zlib.error as error:
+            raise ValueError("EntryTable: invalid data: %s"
+                             % str(error)) from error
+        count = len(_INT_COLUMNS) + len(_STR_COLUMNS) + 1
+        header = struct.Struct('<BI%dI' % count)
+        if len(data) < header.size or data[0] != TABLE_FORMAT:
+            raise ValueError("EntryTable: unsupported data format")
+        fields = header.unpack_from(data)
+        length, sizes = fields[1], fields[2:]
+        table = cls()
+        pos = header.size
+        parts = []
+        for size in sizes:
+            parts.append(data[pos:pos + size])
+            pos += size
+        for column, part in zip(_INT_COLUMNS, parts):
+            values = array('q')
+            values.frombytes(part)
+            if sys.byteorder == 'big':
+                values.byteswap()
+            if len(values) != length:
+                raise ValueError("EntryTable: truncated %s column" % column)
+            getattr(table, column).fromlist(values.tolist())
+        for column, part in zip(_STR_COLUMNS, parts[len(_INT_COLUMNS):]):
+            values = [intern(x) for x in part.decode(
+                'UTF-8', 'surrogateescape').split('\0')] if length else []
+            if len(values) != length:
+                raise ValueError("EntryTable: truncated %s column" % column)
+            setattr(table, column, values)
+        table.xattrs = dict((int(index), value) for index, value
+                            in json.loads(parts[-1].decode('UTF-8')).items())
+        return table
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+"""
+governor.py
+
+Resource governor for the utilities run by CompressMap and ContentsMap.
+
+A ResourceGovernor passed to the maps gives each job a thread budget,
+translated into the codec's own thread option (see CODEC_OPTIONS), and
+runs the job's processes with a lower cpu and io priority and on a set
+of cpus.  The priorities and cpus are applied by running the commands
+through the nice, ionice and taskset utilities, which set them before
+executing the command, so the processes the command starts, such as the
+compressor run by tar, inherit them.  The thread budgets of the running jobs are taken from one pool
+of thread slots, so sharing the governor between the maps limits the
+threads in use by all of the jobs running in the process.
+
+The seekable modes compress their frames in this process's threads,
+they only get the thread budget.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import shlex
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from DeComp import log
+from DeComp.definitions import CODEC_OPTIONS
+from DeComp.options import add_codec_flags, codec_flags, command_codec, has_option
+from DeComp.scheduler import ThreadSlots
+from DeComp.utils import find_binary
+
+
+# The io scheduling classes, as named by ionice, and their numbers
+IOPRIO_CLASSES = {
+    "realtime": 1,
+    "best-effort": 2,
+    "idle": 3,
+}
+
+# the thread budget and cpus given to one job, and the thread slots taken
+Allotment = namedtuple("Allotment", ["threads", "cpus", "slots"])
+
+
+def thread_options(args, threads, operation):
+    """Adds the codec's thread option to the command, for the codec run
+    as the command or as the compress program of tar (-I 'codec').
+    Codecs already given a thread option are left as they are.
+
+    :param args: the command argv list
+    :type args: list of strings
+    :param threads: the number of threads
+    :type threads: integer
+    :param operation: 'compress' or 'extract'
+    :type operation: string
+    :returns: list of strings, the new argv list
+    """
+    codec, index = command_codec(args)
+    option = CODEC_OPTIONS.get(codec, {}).get("threads")
+    if option is None:
+        return list(args)
+    words = args[1:] if index == 0 else shlex.split(args[index])[1:]
+    if has_option(words, option[0]):
+        return list(args)
+    try:
+        flags = codec_flags(codec, {"threads": threads}, operation)
+    except ValueError:
+        # the codec takes no thread count for the operation
+        return list(args)
+    return add_codec_flags(args, codec, flags)
+
+
+class ResourceGovernor(object):
+    """Thread budget, priorities and cpu affinity of the jobs' processes"""
+
+    def __init__(self, job_threads=None, max_threads=None, nice=None,
+                 ioclass=None, iolevel=4, affinity=None, logger=None):
+        """Class init
+
+        :param job_threads: the thread budget of each multi-threaded job,
+                            default: all of the thread slots
+        :type job_threads: integer
+        :param max_threads: the total threads of the jobs running at once,
+                            default: the number of usable cores
+        :type max_threads: integer
+        :param nice: optional niceness added to the jobs' processes
+        :type nice: integer
+        :param ioclass: optional io scheduling class of the jobs' processes,
+                        'realtime', 'best-effort' or 'idle'
+        :type ioclass: string
+        :param iolevel: the io priority level in the class, 0 to 7
+        :type iolevel: integer
+        :param affinity: optional cpus to run the jobs on, a set of cpu
+            numbers or a list of sets given to the jobs in turn
+        :type affinity: set of integers or list of sets
+        :param logger: optional logging module instance
+        :type logger: logging
+        """
+        self.logger = logger or log
+        self.slots = ThreadSlots(max_threads)
+        self.job_threads = self.slots.clamp(job_threads or self.slots.capacity)
+        if ioclass and ioclass not in IOPRIO_CLASSES:
+            raise ValueError("unknown io class: %s" % ioclass)
+        if affinity and all(isinstance(x, int) for x in affinity):
+            affinity = [affinity]
+        self.affinity = [set(x) for x in affinity or []]
+        self.nice = nice
+        self.ioclass = ioclass
+        self.iolevel = iolevel
+        # the wrapper utilities of the settings given, by setting
+        self._wrappers = {}
+        for setting, binary in (("nice", "nice"), ("ioclass", "ionice"),
+                                ("affinity", "taskset")):
+            if not getattr(self, setting):
+                continue
+            self._wrappers[setting] = find_binary(binary)
+            if self._wrappers[setting] is None:
+                self.logger.warning("ResourceGovernor: %s is not installed, "
+                                    "the %s is not applied", binary, setting)
+        self._turn = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+
+    def budget(self, multi_threaded):
+        """Returns the thread budget of a job
+
+        :param multi_threaded: the job's utility uses several threads
+        :type multi_threaded: boolean
+        :returns: integer
+        """
+        return self.job_threads if multi_threaded else 1
+
+
+    def allot(self, threads):
+        """Blocks until the job's threads are free, then takes them.
+        Each allotment must be given back with free().
+
+        :param threads: the job's thread budget, see budget()
+        :type threads: integer
+        :returns: Allotment of the job
+        """
+        taken = self.slots.acquire(threads)
+        cpus = None
+        if self.affinity:
+            with self._lock:
+                cpus = self.affinity[self._turn % len(self.affinity)]
+                self._turn += 1
+        return Allotment(min(taken, len(cpus)) if cpus else taken, cpus, taken)
+
+
+    def free(self, allotment):
+        """Gives back the threads of a finished job
+
+        :param allotment: the job's allotment
+        :type allotment: Allotment
+        """
+        self.slots.release(allotment.slots)
+
+
+    @contextmanager
+    def job(self, threads):
+        """Context manager running a job, see allot().  Jobs started inside
+        a running job of the same thread share its allotment.
+
+        :param threads: the job's thread budget, see budget()
+        :type threads: integer
+        :returns: Allotment of the job
+        """
+        current = getattr(self._local, 'allotment', None)
+        if current is not None:
+            yield current
+            return
+        self._local.allotment = self.allot(threads)
+        try:
+            yield self._local.allotment
+        finally:
+            self.free(self._local.allotment)
+            self._local.allotment = None
+
+
+    def wrapper(self, allotment):
+        """Returns the argv words to prefix a job's command with, running
+        it through the utilities applying its priorities and cpus
+
+        :param allotment: the job's allotment
+        :type allotment: Allotment
+        :returns: list of strings, empty if there is nothing to apply
+        """
+        words = []
+        if allotment.cpus and self._wrappers.get("affinity"):
+            words.extend([self._wrappers["affinity"], "-c",
+                          ','.join(str(x) for x in sorted(allotment.cpus))])
+        if self._wrappers.get("ioclass"):
+            words.extend([self._wrappers["ioclass"], "-c",
+                          str(IOPRIO_CLASSES[self.ioclass])])
+            if self.ioclass != "idle":
+                words.extend(["-n", str(self.iolevel)])
+        if self._wrappers.get("nice"):
+            words.extend([self._wrappers["nice"], "-n", str(self.nice)])
+        return words
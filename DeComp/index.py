@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+"""
+index.py
+
+Persistent SQLite index of the parsed archive contents listings.
+
+Each archive's EntryTable is stored keyed on the archive's real path,
+size and mtime, plus optionally a sha256 digest of its content.  While the
+archive is unchanged, its listing is answered from the index without
+running the listing utility.  The least recently used listings are
+evicted once the stored listings exceed the size limit.
+
+A directory of archives can be kept indexed with refresh(), which only
+lists the new or changed archives, or continuously with watch().
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from DeComp import log
+from DeComp.entries import EntryTable
+
+
+# The default maximum total size of the stored listings
+DEFAULT_INDEX_SIZE = 256 * 1024 * 1024
+
+# Read size used to digest the archives
+DIGEST_BLOCK = 1 << 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    entries INTEGER NOT NULL,
+    used REAL NOT NULL,
+    data BLOB NOT NULL
+)
+"""
+
+
+class ContentsIndex(object):
+    """Persistent store of the archive contents listings"""
+
+    def __init__(self, path, max_size=DEFAULT_INDEX_SIZE, digest=False,
+                 logger=None):
+        """Class init
+
+        :param path: the SQLite database file, created if needed
+        :type path: string
+        :param max_size: the maximum total size of the stored listings
+        :type max_size: integer
+        :param digest: also key the archives on a sha256 digest of their
+                       content, not only on their size and mtime
+        :type digest: boolean
+        :param logger: optional logging module instance
+        :type logger: logging
+        """
+        self.path = path
+        self.max_size = max_size
+        self.digest = digest
+        self.logger = logger or log
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+
+
+    def close(self):
+        """Closes the database"""
+        with self._lock:
+            self._db.close()
+
+
+    def key(self, source):
+        """Returns the identity of the archive
+
+        :param source: path to the archive
+        :type source: string
+        :returns: (real path, size, mtime_ns, digest) tuple
+                  or None if the archive does not exist
+        """
+        path = os.path.realpath(source)
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        digest = ''
+        if self.digest:
+            hasher = hashlib.sha256()
+            try:
+                with open(path, 'rb') as archive:
+                    while True:
+                        block = archive.read(DIGEST_BLOCK)
+                        if not block:
+                            break
+                        hasher.update(block)
+            except (IOError, OSError):
+                return None
+            digest = hasher.hexdigest()
+        return path, info.st_size, info.st_mtime_ns, digest
+
+
+    def get(self, source, key=None):
+        """Returns the stored listing of the unchanged archive
+
+        :param source: path to the archive
+        :type source: string
+        :param key: optional key() of the archive, if already known
+        :type key: tuple
+        :returns: EntryTable or None if it is not indexed or has changed
+        """
+        key = key or self.key(source)
+        if key is None:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM listings WHERE path = ? AND size = ? AND "
+                "mtime = ? AND digest = ?", key).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE listings SET used = ? WHERE path = ?",
+                             (time.time(), key[0]))
+            self._db.commit()
+        try:
+            return EntryTable.from_bytes(row[0])
+        except ValueError as error:
+            self.logger.warning("ContentsIndex: get(); dropping the invalid "
+                                "listing of %s: %s", key[0], str(error))
+            self.remove(source)
+            return None
+
+
+    def mode(self, source):
+        """Returns the mode the stored listing was made with
+
+        :param source: path to the archive
+        :type source: string
+        :returns: string or None if it is not indexed
+        """
+        with self._lock:
+            row = self._db.execute("SELECT mode FROM listings WHERE path = ?",
+                                   (os.path.realpath(source),)).fetchone()
+        return row[0] if row else None
+
+
+    def put(self, source, mode, table, key=None):
+        """Stores the listing of the archive, then evicts the least
+        recently used listings over the size limit
+
+        :param source: path to the archive
+        :type source: string
+        :param mode: the contents mode the listing was made with
+        :type mode: string
+        :param table: the archive's listing
+        :type table: EntryTable
+        :param key: optional key() of the archive taken before it was
+                    listed, so a change while listing is not missed
+        :type key: tuple
+        :returns: boolean
+        """
+        key = key or self.key(source)
+        if key is None:
+            return False
+        data = table.to_bytes()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO listings (path, size, mtime, digest, "
+                "mode, entries, used, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (mode, len(table), time.time(), sqlite3.Binary(data)))
+            self._db.commit()
+        self.evict()
+        return True
+
+
+    def remove(self, source):
+        """Removes the archive's listing
+
+        :param source: path to the archive
+        :type source: string
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM listings WHERE path = ?",
+                             (os.path.realpath(source),))
+            self._db.commit()
+
+
+    def evict(self):
+        """Removes the least recently used listings until the stored
+        listings fit in the maximum size
+
+        :returns: integer, the number of listings removed
+        """
+        removed = 0
+        with self._lock:
+            total = self._db.execute(
+                "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM listings"
+            ).fetchone()[0]
+            if total <= self.max_size:
+                return 0
+            paths = []
+            for path, size in self._db.execute(
+                    "SELECT path, LENGTH(data) FROM listings ORDER BY used"):
+                if total <= self.max_size:
+                    break
+                paths.append((path,))
+                total -= size
+            self._db.executemany("DELETE FROM listings WHERE path = ?", paths)
+            self._db.commit()
+            removed = len(paths)
+        self.logger.debug("ContentsIndex: evict(); removed %d listings",
+                          removed)
+        return removed
+
+
+    def prune(self):
+        """Removes the listings of the archives no longer existing
+
+        :returns: integer, the number of listings removed
+        """
+        with self._lock:
+            paths = [x[0] for x in self._db.execute(
+                "SELECT path FROM listings")]
+        gone = [(x,) for x in paths if not os.path.exists(x)]
+        with self._lock:
+            self._db.executemany("DELETE FROM listings WHERE path = ?", gone)
+            self._db.commit()
+        return len(gone)
+
+
+    def refresh(self, directory, contents):
+        """Indexes the new or changed archives in the directory tree
+
+        :param directory: the directory to scan
+        :type directory: string
+        :param contents: the contents definitions to list the archives with
+        :type contents: ContentsMap
+        :returns: list of the archive paths (re)indexed
+        """
+        with self._lock:
+            known = dict((row[0], row[1:]) for row in self._db.execute(
+                "SELECT path, size, mtime, digest FROM listings"))
+        indexed = []
+        for root, _dirs, files in os.walk(directory):
+            for name in sorted(files):
+                source = os.path.join(root, name)
+                key = self.key(source)
+                if key is None or known.get(key[0]) == key[1:]:
+                    continue
+                mode = contents.determine_mode(source)
+                if not mode:
+                    continue
+                table = contents.list_entries(source, mode)
+                if table is None:
+                    continue
+                if self.put(source, mode, table, key):
+                    indexed.append(source)
+        self.logger.info("ContentsIndex: refresh(); indexed %d archives in %s",
+                         len(indexed), directory)
+        return indexed
+
+
+    def watch(self, directory, contents, interval=60.0, stop=None):
+        """Keeps the directory tree indexed, refreshing it every interval
+        seconds until the stop event is set.  This blocks, run it in
+        a thread to watch in the background.
+
+        :param directory: the directory to watch
+        :type directory: string
+        :param contents: the contents definitions to list the archives with
+        :type contents: ContentsMap
+        :param interval: seconds between the refreshes
+        :type interval: float
+        :param stop: optional event ending the watch
+        :type stop: threading.Event
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.refresh(directory, contents)
+            self.prune()
+            stop.wait(interval)
@@ -0,0 +1,535 @@
+# -*- coding: utf-8 -*-
+
+"""
+iso9660.py
+
+In process ISO9660 image reader used by the ContentsMap py_iso mode,
+instead of running `isoinfo -l` or `isoinfo -f`.
+
+The image is memory mapped and its directory records are walked in
+place.  The Rock Ridge names, modes, owners, times and symlinks are used
+when the primary volume has them, otherwise the Joliet names when the
+image has a Joliet volume, otherwise the plain ISO9660 names without
+their ';1' version.  Rock Ridge relocated directories are shown at their
+original place.
+
+The file extents are returned as memoryview slices of the mapped image,
+without copying the data.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import calendar
+import mmap
+import stat
+import struct
+from collections import namedtuple
+
+from DeComp.entries import ContentsEntry
+
+
+# The sector size of the volume descriptors
+SECTOR_SIZE = 2048
+
+# The sector of the first volume descriptor
+DESCRIPTORS_START = 16
+
+# The Joliet escape sequences of the supplementary volume descriptor
+JOLIET_ESCAPES = (b"%/@", b"%/C", b"%/E")
+
+_PRIMARY = 1
+_SUPPLEMENTARY = 2
+_TERMINATOR = 255
+
+_DIRECTORY = 0x02
+_MULTI_EXTENT = 0x80
+
+_RECORD = struct.Struct('<BBI4xI4x7sBBBHxxB')
+_PX = struct.Struct('<I4xI4xI4xI')
+_CE = struct.Struct('<I4xI4xI')
+
+# the Rock Ridge SL component flags
+_SL_CONTINUE = 0x01
+_SL_CURRENT = 0x02
+_SL_PARENT = 0x04
+_SL_ROOT = 0x08
+
+# the Rock Ridge TF flags
+_TF_CREATION = 0x01
+_TF_MODIFY = 0x02
+_TF_LONG_FORM = 0x80
+
+# The maximum number of chained SUSP continuation areas followed for
+# one directory record
+MAX_CONTINUATIONS = 16
+
+# One directory record, the Rock Ridge fields are None without them.
+# extents: the (offset, size) image ranges of the file's data
+Record = namedtuple("Record", [
+    "name", "flags", "extents", "mtime", "mode", "uid", "gid", "linkname",
+    "relocated", "child"])
+
+
+class IsoError(IOError):
+    """Raised for invalid or truncated ISO9660 images"""
+
+
+def _date(data):
+    """Converts a 7 byte directory record date to seconds since the epoch"""
+    year, month, day, hour, minute, second, offset = \
+        struct.unpack('<6Bb', data)
+    if not month:
+        return 0
+    try:
+        return calendar.timegm((1900 + year, month, day, hour, minute,
+                                second)) - offset * 15 * 60
+    except (ValueError, OverflowError):
+        return 0
+
+
+def _long_date(data):
+    """Converts a 17 byte volume descriptor date to seconds since the
+    epoch"""
+    try:
+        digits = data[:16].decode('ascii')
+        fields = [int(digits[x:x + 2]) for x in range(4, 14, 2)]
+        offset = struct.unpack('<b', data[16:17])[0]
+        return calendar.timegm([int(digits[:4])] + fields) - offset * 15 * 60
+    except (ValueError, OverflowError, UnicodeDecodeError):
+        return 0
+
+
+def _plain_name(data, joliet):
+    """Decodes a primary or Joliet file identifier, without its version"""
+    if joliet:
+        name = data.decode('UTF-16-BE', 'replace')
+    else:
+        name = data.decode('latin-1')
+    name = name.split(';', 1)[0]
+    if not joliet and name.endswith('.'):
+        name = name[:-1]
+    return name
+
+
+class IsoImage(object):
+    """Read only access to a memory mapped ISO9660 image"""
+
+    def __init__(self, path, joliet=True, rock_ridge=True):
+        """Class init, reads the volume descriptors
+
+        :param path: path to the image
+        :type path: string
+        :param joliet: use the Joliet names if there are no Rock Ridge ones
+        :type joliet: boolean
+        :param rock_ridge: use the Rock Ridge extensions if there are any
+        :type rock_ridge: boolean
+        :raises IsoError: if it is not a valid ISO9660 image
+        :raises OSError: if the image can not be read
+        """
+        self.path = path
+        with open(path, 'rb') as image:
+            try:
+                self._map = mmap.mmap(image.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+            except ValueError as error:
+                # an empty file
+                raise IsoError("%s is not an ISO9660 image" % path) from error
+        self._view = memoryview(self._map)
+        self.extension = None
+        try:
+            self._volumes(joliet)
+            # the root's '.' record holds the SUSP SP entry
+            root = self._root_record
+            self._susp_skip = None
+            if rock_ridge:
+                self._susp_skip = self._sp_skip(root)
+            if self._susp_skip is not None:
+                self.extension = "rockridge"
+            elif self._joliet_root is not None:
+                self.extension = "joliet"
+                self._root_record = self._joliet_root
+                self.block_size = self._joliet_block_size
+        except Exception:
+            self.close()
+            raise
+
+
+    def close(self):
+        """Unmaps the image.  The memoryviews returned by extents() must
+        be released first, otherwise the mapping stays until they are."""
+        if self._map is None:
+            return
+        try:
+            self._view.release()
+            self._map.close()
+        except BufferError:
+            # extents still in use, unmapped once they are released
+            pass
+        self._map = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *_exc):
+        self.close()
+
+
+    def _bytes(self, offset, size):
+        """Returns the image bytes at the offset"""
+        if offset < 0 or offset + size > len(self._map):
+            raise IsoError("%s is truncated at %d" % (self.path, offset))
+        return self._view[offset:offset + size]
+
+
+    def _volumes(self, joliet):
+        """Finds the primary and the Joliet volume descriptors"""
+        self._root_record = None
+        self._joliet_root = None
+        sector = DESCRIPTORS_START
+        while True:
+            descriptor = self._bytes(sector * SECTOR_SIZE, SECTOR_SIZE)
+            if bytes(descriptor[1:6]) != b"CD001":
+                raise IsoError("%s is not an ISO9660 image" % self.path)
+            kind = descriptor[0]
+            block_size = struct.unpack('<H', descriptor[128:130])[0]
+            if kind == _PRIMARY and self._root_record is None:
+                self.block_size = block_size
+                self.volume_id = bytes(descriptor[40:72]).decode(
+                    'latin-1').strip()
+                self.created = _long_date(bytes(descriptor[813:830]))
+                self._root_record = bytes(descriptor[156:190])
+            elif kind == _SUPPLEMENTARY and joliet and \
+                    bytes(descriptor[88:91]) in JOLIET_ESCAPES:
+                self._joliet_block_size = block_size
+                self._joliet_root = bytes(descriptor[156:190])
+            elif kind == _TERMINATOR:
+                break
+            sector += 1
+        if self._root_record is None:
+            raise IsoError("%s has no primary volume descriptor" % self.path)
+
+
+    def _records(self, extent, size):
+        """Generator of the raw directory records of a directory extent,
+        '.' and '..' included"""
+        start = extent * self.block_size
+        data = self._bytes(start, size)
+        position = 0
+        while position < size:
+            length = data[position]
+            if not length:
+                # records do not cross the sectors, go to the next one
+                position = (position // SECTOR_SIZE + 1) * SECTOR_SIZE
+                continue
+            if position + length > size or length < _RECORD.size:
+                raise IsoError("%s: invalid directory record at %d"
+                               % (self.path, start + position))
+            yield data[position:position + length]
+            position += length
+
+
+    def _sp_skip(self, root):
+        """Returns the SUSP skip length of the root's '.' record
+        or None without Rock Ridge"""
+        fields = _RECORD.unpack(root[:_RECORD.size])
+        for record in self._records(fields[2], fields[3]):
+            area = self._system_use(record, 0)
+            if area[:2] == b"SP" and len(area) >= 7 and \
+                    area[4:6] == b"\xbe\xef":
+                return area[6]
+            return None
+        return None
+
+
+    @staticmethod
+    def _system_use(record, skip):
+        """Returns the system use area of a directory record"""
+        name_size = record[32]
+        start = 33 + name_size + (1 - name_size % 2) + skip
+        return bytes(record[start:])
+
+
+    def _susp_entries(self, area):
+        """Generator of the (signature, data) SUSP entries of a system use
+        area, the continuation areas included"""
+        continuations = 0
+        while area:
+            following = None
+            position = 0
+            while position + 4 <= len(area):
+                signature = area[position:position + 2]
+                length = area[position + 2]
+                if length < 4 or position + length > len(area):
+                    break
+                data = area[position:position + length]
+                position += length
+                if signature == b"ST":
+                    break
+                if signature == b"CE" and length >= 28:
+                    block, offset, size = _CE.unpack(data[4:4 + _CE.size])
+                    following = (block * self.block_size + offset, size)
+                    continue
+                yield signature, data
+            if following is None or continuations >= MAX_CONTINUATIONS:
+                return
+            continuations += 1
+            area = bytes(self._bytes(*following))
+
+
+    def _record(self, raw):
+        """Parses a directory record
+
+        :param raw: the record
+        :type raw: memoryview
+        :returns: Record
+        """
+        (_length, attributes, extent, size, date, flags, _unit, _gap,
+         _volume, name_size) = _RECORD.unpack(raw[:_RECORD.size])
+        name = bytes(raw[33:33 + name_size])
+        fields = {
+            "name": name, "flags": flags,
+            "extents": [((extent + attributes) * self.block_size, size)],
+            "mtime": _date(date), "mode": None, "uid": None, "gid": None,
+            "linkname": None, "relocated": False, "child": None,
+        }
+        if self.extension != "rockridge":
+            fields['name'] = _plain_name(name, self.extension == "joliet") \
+                if name not in (b"\x00", b"\x01") else name
+            return Record(**fields)
+        names = []
+        components = []
+        continued = False
+        for signature, data in self._susp_entries(
+                self._system_use(raw, self._susp_skip)):
+            if signature == b"NM" and len(data) >= 5:
+                names.append(bytes(data[5:]))
+            elif signature == b"PX" and len(data) >= 4 + _PX.size:
+                mode, _nlink, uid, gid = _PX.unpack(data[4:4 + _PX.size])
+                fields.update(mode=mode, uid=uid, gid=gid)
+            elif signature == b"SL" and len(data) >= 5:
+                continued = self._sl_components(data[5:], components,
+                                                continued)
+            elif signature == b"TF" and len(data) >= 5:
+                mtime = self._tf_mtime(data)
+                if mtime is not None:
+                    fields['mtime'] = mtime
+            elif signature == b"RE":
+                fields['relocated'] = True
+            elif signature == b"CL" and len(data) >= 12:
+                fields['child'] = struct.unpack('<I', data[4:8])[0]
+        if names:
+            fields['name'] = b''.join(names).decode('UTF-8', 'surrogateescape')
+        elif name not in (b"\x00", b"\x01"):
+            fields['name'] = _plain_name(name, False)
+        if components:
+            fields['linkname'] = self._sl_target(components)
+        return Record(**fields)
+
+
+    @staticmethod
+    def _sl_components(data, components, continued):
+        """Adds a Rock Ridge SL entry's path components to the list,
+        returns True if its last component continues in the next entry"""
+        position = 0
+        while position + 2 <= len(data):
+            flags = data[position]
+            size = data[position + 1]
+            content = bytes(data[position + 2:position + 2 + size])
+            position += 2 + size
+            if flags & _SL_ROOT:
+                part = '/'
+            elif flags & _SL_PARENT:
+                part = '..'
+            elif flags & _SL_CURRENT:
+                part = '.'
+            else:
+                part = content.decode('UTF-8', 'surrogateescape')
+            if continued and components:
+                components[-1] += part
+            else:
+                components.append(part)
+            continued = bool(flags & _SL_CONTINUE)
+        return continued
+
+
+    @staticmethod
+    def _sl_target(components):
+        """Joins the symlink path components"""
+        if components[0] == '/':
+            return '/' + '/'.join(components[1:])
+        return '/'.join(components)
+
+
+    @staticmethod
+    def _tf_mtime(data):
+        """Returns the modification time of a Rock Ridge TF entry"""
+        flags = data[4]
+        if not flags & _TF_MODIFY:
+            return None
+        size = 17 if flags & _TF_LONG_FORM else 7
+        # the creation time is recorded first
+        start = 5 + (size if flags & _TF_CREATION else 0)
+        stamp = bytes(data[start:start + size])
+        if len(stamp) != size:
+            return None
+        return _long_date(stamp) if size == 17 else _date(stamp)
+
+
+    def listdir(self, record):
+        """Returns the entries of a directory
+
+        :param record: the directory's record
+        :type record: Record
+        :returns: list of Record, the multi-extent files merged into one
+        """
+        offset, size = record.extents[0]
+        entries = []
+        pending = None
+        for raw in self._records(offset // self.block_size, size):
+            if raw[32] == 1 and raw[33] in (0, 1):
+                # the '.' and '..' records
+                continue
+            entry = self._record(raw)
+            if entry.relocated:
+                continue
+            if pending is not None:
+                # the next part of a multi-extent file
+                entry = pending._replace(
+                    flags=entry.flags,
+                    extents=pending.extents + entry.extents)
+                pending = None
+            if entry.flags & _MULTI_EXTENT:
+                pending = entry
+                continue
+            if entry.child is not None:
+                entry = self._relocated(entry)
+            entries.append(entry)
+        return entries
+
+
+    def _relocated(self, entry):
+        """Returns the record of a Rock Ridge relocated directory,
+        at the place of its CL entry"""
+        for raw in self._records(entry.child, self.block_size):
+            directory = self._record(raw)
+            return entry._replace(flags=directory.flags | _DIRECTORY,
+                                  extents=directory.extents,
+                                  mode=entry.mode or directory.mode)
+        raise IsoError("%s: invalid relocated directory" % self.path)
+
+
+    def root(self):
+        """Returns the root directory's record
+
+        :returns: Record
+        """
+        fields = _RECORD.unpack(self._root_record[:_RECORD.size])
+        return Record(b"\x00", fields[5],
+                      [(fields[2] * self.block_size, fields[3])],
+                      _date(fields[4]), None, None, None, None, False, None)
+
+
+    def walk(self):
+        """Generator of the image's records below the root, depth first
+        in the image's directory order
+
+        :returns: generator of (path, Record) tuples
+        """
+        seen = set()
+        pending = [iter([(x, '') for x in self.listdir(self.root())])]
+        while pending:
+            for entry, parent in pending[-1]:
+                path = parent + entry.name
+                yield path, entry
+                extent = entry.extents[0][0]
+                if entry.flags & _DIRECTORY and extent not in seen:
+                    seen.add(extent)
+                    pending.append(iter([(x, path + '/') for x in
+                                         self.listdir(entry)]))
+                    break
+            else:
+                pending.pop()
+
+
+    @staticmethod
+    def _mode(entry):
+        """Returns the st_mode of a record"""
+        if entry.mode is not None:
+            return entry.mode
+        if entry.flags & _DIRECTORY:
+            return stat.S_IFDIR | 0o555
+        return stat.S_IFREG | 0o444
+
+
+    def entries(self):
+        """Generator of the image's ContentsEntry records
+
+        :returns: generator of ContentsEntry
+        """
+        for path, entry in self.walk():
+            mode = self._mode(entry)
+            size = sum(x[1] for x in entry.extents)
+            if not stat.S_ISREG(mode):
+                size = len(entry.linkname or '') if \
+                    stat.S_ISLNK(mode) else 0
+            uid = entry.uid if entry.uid is not None else 0
+            gid = entry.gid if entry.gid is not None else 0
+            yield ContentsEntry(path, size, mode, uid, gid, '', '',
+                                entry.mtime, entry.linkname or '', None)
+
+
+    def lookup(self, path):
+        """Returns the record of a path, symlinks are not followed
+
+        :param path: the path in the image
+        :type path: string
+        :returns: Record
+        :raises IsoError: if it is not found
+        """
+        entry = self.root()
+        for name in [x for x in path.split('/') if x and x != '.']:
+            if not entry.flags & _DIRECTORY:
+                raise IsoError("%s: not a directory in: %s"
+                               % (self.path, path))
+            for child in self.listdir(entry):
+                if child.name == name:
+                    entry = child
+                    break
+            else:
+                raise IsoError("%s: not found: %s" % (self.path, path))
+        return entry
+
+
+    def extents(self, path):
+        """Returns the data of a regular file as memoryview slices of the
+        mapped image, without copying it.  Release them before close().
+
+        :param path: the path in the image
+        :type path: string
+        :returns: list of memoryview, one per extent
+        :raises IsoError: if it is not found or not a regular file
+        """
+        entry = self.lookup(path)
+        if not stat.S_ISREG(self._mode(entry)):
+            raise IsoError("%s: not a regular file: %s" % (self.path, path))
+        return [self._bytes(offset, size) for offset, size in entry.extents]
+
+
+    def read(self, path):
+        """Returns the content of a regular file
+
+        :param path: the path in the image
+        :type path: string
+        :returns: bytes
+        :raises IsoError: if it is not found or not a regular file
+        """
+        views = self.extents(path)
+        try:
+            return b''.join(views)
+        finally:
+            for view in views:
+                view.release()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""
+native.py
+
+In process contents backends using the python standard library
+instead of running an external utility.
+
+The tarfile module reads the tar, gzip, bzip2 and xz compressed
+archives through the gzip, bz2 and lzma modules.  The archives are read
+as a stream, so no seeking is done within the compressed data.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import stat
+import tarfile
+
+from DeComp.entries import ContentsEntry
+
+
+XATTR_PAX_PREFIX = "SCHILY.xattr."
+
+# tarfile member type: stat file type bits
+_TAR_TYPES = {
+    tarfile.REGTYPE: stat.S_IFREG,
+    tarfile.AREGTYPE: stat.S_IFREG,
+    tarfile.CONTTYPE: stat.S_IFREG,
+    tarfile.GNUTYPE_SPARSE: stat.S_IFREG,
+    tarfile.LNKTYPE: stat.S_IFREG,
+    tarfile.SYMTYPE: stat.S_IFLNK,
+    tarfile.DIRTYPE: stat.S_IFDIR,
+    tarfile.CHRTYPE: stat.S_IFCHR,
+    tarfile.BLKTYPE: stat.S_IFBLK,
+    tarfile.FIFOTYPE: stat.S_IFIFO,
+}
+
+
+def tarinfo_entry(member):
+    """Converts a tarfile.TarInfo member into a ContentsEntry
+
+    :param member: the archive member
+    :type member: tarfile.TarInfo
+    :returns: ContentsEntry
+    """
+    xattrs = {}
+    for key, value in member.pax_headers.items():
+        if key.startswith(XATTR_PAX_PREFIX):
+            xattrs[key[len(XATTR_PAX_PREFIX):]] = value
+    return ContentsEntry(
+        member.name,
+        member.size,
+        _TAR_TYPES.get(member.type, stat.S_IFREG) | member.mode,
+        member.uid,
+        member.gid,
+        member.uname,
+        member.gname,
+        member.mtime,
+        member.linkname,
+        xattrs or None,
+    )
+
+
+def tarfile_entries(source, mode="r|*", fileobj=None):
+    """Generator yielding the members of a tar archive
+
+    :param source: path to the archive
+    :type source: string
+    :param mode: tarfile.open() stream mode, eg: 'r|gz'
+    :type mode: string
+    :param fileobj: optional file object to read the archive from
+    :type fileobj: binary file object
+    :returns: generator of ContentsEntry
+    """
+    with tarfile.open(source, mode, fileobj=fileobj) as archive:
+        member = archive.next()
+        while member is not None:
+            yield tarinfo_entry(member)
+            # do not let tarfile keep every member seen in memory
+            archive.members = []
+            member = archive.next()
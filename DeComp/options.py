@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+options.py
+
+The typed codec parameters of CompressMap.compress() and extract():
+level, threads, memory_limit and window.
+
+Each codec declares the option format and the range of each parameter
+it supports in CODEC_OPTIONS.  The options are added to the codec itself,
+whether it is the command run, the compress program of tar (-I) or
+the codec tar runs by its own option, which is then replaced by -I.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import os
+import shlex
+
+from DeComp.definitions import (CODEC_OPTIONS, OPTIONS_LAST,
+                                TAR_CODEC_LETTERS)
+
+
+# The codec parameters, in the order their options are added
+PARAMETERS = ("level", "threads", "memory_limit", "window")
+
+# The tar options naming the compress program
+PROGRAM_OPTIONS = ("-I", "--use-compress-program")
+
+
+def codec_flags(codec, options, operation):
+    """Returns the codec's options for the parameters
+
+    :param codec: the codec, a CODEC_OPTIONS key
+    :type codec: string
+    :param options: the parameter values by name, None values are skipped
+    :type options: dictionary
+    :param operation: 'compress' or 'extract'
+    :type operation: string
+    :returns: list of the option strings
+    :raises ValueError: for a parameter the codec does not take for the
+                        operation, or a value out of the codec's range
+    """
+    supported = CODEC_OPTIONS.get(codec, {})
+    flags = []
+    for name in PARAMETERS:
+        value = options.get(name)
+        if value is None:
+            continue
+        if name not in supported or operation not in supported[name][3]:
+            raise ValueError("%s does not support the %s parameter to %s"
+                             % (codec or "the mode", name, operation))
+        option, minimum, maximum = supported[name][:3]
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError("the %s parameter must be an integer, not %r"
+                             % (name, value))
+        if value < minimum or (maximum is not None and value > maximum):
+            raise ValueError("the %s %s must be from %d to %s, not %d"
+                             % (codec, name, minimum,
+                                maximum if maximum is not None else "any",
+                                value))
+        flags.append(option % value)
+    return flags
+
+
+def has_option(tokens, option):
+    """Returns True if the tokens already include the option's flag
+
+    :param tokens: the command's words
+    :type tokens: list of strings
+    :param option: the CODEC_OPTIONS option format
+    :type option: string
+    :returns: boolean
+    """
+    flag = option.split()[0].split('%')[0]
+    return any(x.startswith(flag) for x in tokens)
+
+
+def command_codec(args):
+    """Returns the codec run as the command or as tar's compress program
+
+    :param args: the command argv list
+    :type args: list of strings
+    :returns: tuple of the codec and the index of its word in args,
+              or (None, None)
+    """
+    if not args:
+        return None, None
+    if os.path.basename(args[0]) in CODEC_OPTIONS:
+        return os.path.basename(args[0]), 0
+    for index in range(1, len(args)):
+        if args[index - 1] not in PROGRAM_OPTIONS:
+            continue
+        tokens = shlex.split(args[index])
+        if tokens:
+            return os.path.basename(tokens[0]), index
+    return None, None
+
+
+def add_codec_flags(args, codec, flags, comp_prog=PROGRAM_OPTIONS[0]):
+    """Adds the codec options to the command, to the codec run as the
+    command or as tar's compress program.  Otherwise tar's own codec
+    option is replaced by comp_prog running the codec with its options.
+
+    :param args: the command argv list
+    :type args: list of strings
+    :param codec: the codec
+    :type codec: string
+    :param flags: the options, as returned by codec_flags()
+    :type flags: list of strings
+    :param comp_prog: tar's compress program option
+    :type comp_prog: string
+    :returns: list of strings, the new argv list
+    """
+    args = list(args)
+    if not flags or not args:
+        return args
+    words = []
+    for flag in flags:
+        words.extend(shlex.split(flag))
+    found, index = command_codec(args)
+    if found == codec and index == 0:
+        if codec in OPTIONS_LAST:
+            args.extend(words)
+        else:
+            args[1:1] = words
+        return args
+    if found == codec:
+        args[index] = ' '.join([args[index]] + words)
+        return args
+    letter = TAR_CODEC_LETTERS.get(codec)
+    for index, word in enumerate(args[1:], 1):
+        if letter and word[:1] == '-' and word[1:2] != '-' and letter in word:
+            word = word.replace(letter, '')
+            if word == '-':
+                del args[index]
+            else:
+                args[index] = word
+            break
+    args[1:1] = [comp_prog, ' '.join([codec] + words)]
+    return args
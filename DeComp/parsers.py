@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+"""
+parsers.py
+
+Parsers turning the text contents listings of the external utilities
+into ContentsEntry records.  Lines which do not match the listing format
+(headers, warnings, blank lines) are skipped.
+
+Supported listings:
+    tar -tv          GNU and BSD tar formats
+    unsquashfs -ll
+    isoinfo -l
+    isoinfo -f
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import re
+import stat
+import time
+
+from DeComp.entries import ContentsEntry
+
+
+_PERMS = r"(?P<perms>[-bcdhlps][-rwxsStTl]{9})[+*.@ ]?"
+
+_GNU_TAR_RE = re.compile(
+    _PERMS + r"\s+(?P<owner>[^/\s]+)/(?P<group>\S+)\s+"
+    r"(?P<size>\d+|\d+,\s*\d+)\s+"
+    r"(?P<date>\d{4}-\d{2}-\d{2} \d{2}:\d{2}(?::\d{2})?) (?P<name>.*)$")
+
+_BSD_TAR_RE = re.compile(
+    _PERMS + r"\s+\d+\s+(?P<owner>\S+)\s+(?P<group>\S+)\s+"
+    r"(?P<size>\d+|\d+,\s*\d+)\s+"
+    r"(?P<date>\w{3}\s+\d+\s+(?:\d{2}:\d{2}|\d{4})) (?P<name>.*)$")
+
+_ISOINFO_RE = re.compile(
+    _PERMS + r"\s+\d+\s+(?P<owner>\d+)\s+(?P<group>\d+)\s+(?P<size>\d+)\s+"
+    r"(?P<date>\w{3}\s+\d+\s+\d{4})\s+\[\s*\d+\s+\d+\]\s\s(?P<name>.*?)\s*$")
+
+_ISOINFO_DIR = "Directory listing of "
+
+_TYPES = {
+    '-': stat.S_IFREG,
+    'h': stat.S_IFREG,
+    'd': stat.S_IFDIR,
+    'l': stat.S_IFLNK,
+    'c': stat.S_IFCHR,
+    'b': stat.S_IFBLK,
+    'p': stat.S_IFIFO,
+    's': stat.S_IFSOCK,
+}
+
+_DATE_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%b %d %Y",
+                 "%b %d %H:%M")
+
+
+def _perms_mode(perms):
+    """Converts a 'drwxr-xr-x' permission string to an st_mode integer"""
+    mode = _TYPES.get(perms[0], stat.S_IFREG)
+    for pos, (char, bit) in enumerate(zip(perms[1:], (
+            stat.S_IRUSR, stat.S_IWUSR, stat.S_IXUSR,
+            stat.S_IRGRP, stat.S_IWGRP, stat.S_IXGRP,
+            stat.S_IROTH, stat.S_IWOTH, stat.S_IXOTH))):
+        if char in 'rwxst':
+            mode |= bit
+        if char in 'sS' and pos == 2:
+            mode |= stat.S_ISUID
+        elif char in 'sS' and pos == 5:
+            mode |= stat.S_ISGID
+        elif char in 'tT' and pos == 8:
+            mode |= stat.S_ISVTX
+    return mode
+
+
+class _Converter(object):
+    """Memoizes the repetitive field conversions of a listing"""
+
+    def __init__(self):
+        self.modes = {}
+        self.dates = {}
+
+    def mode(self, perms):
+        """Returns the cached st_mode of the permissions string"""
+        if perms not in self.modes:
+            self.modes[perms] = _perms_mode(perms)
+        return self.modes[perms]
+
+    def date(self, text):
+        """Returns the cached epoch time of the date string"""
+        if text not in self.dates:
+            normalized = ' '.join(text.split())
+            value = 0
+            for fmt in _DATE_FORMATS:
+                try:
+                    parsed = time.strptime(normalized, fmt)
+                except ValueError:
+                    continue
+                if parsed.tm_year == 1900:
+                    # "Mon DD HH:MM" listings are for the current year
+                    parsed = time.strptime(
+                        "%s %d" % (normalized, time.localtime().tm_year),
+                        fmt + " %Y")
+                value = int(time.mktime(parsed))
+                break
+            self.dates[text] = value
+        return self.dates[text]
+
+
+def _owner(value):
+    """Returns the (id, name) pair of an owner field"""
+    if value.isdigit():
+        return int(value), ''
+    return -1, value
+
+
+def _size(value):
+    """Device entries list 'major, minor' instead of a size"""
+    return int(value) if value.isdigit() else 0
+
+
+def _split_link(name, perms):
+    """Splits the link target off the member name"""
+    if perms[0] == 'l' and ' -> ' in name:
+        return name.split(' -> ', 1)
+    if perms[0] == 'h' and ' link to ' in name:
+        return name.split(' link to ', 1)
+    return name, ''
+
+
+def parse_tar_tv(lines):
+    """Generator parsing a GNU or BSD `tar -tv` listing
+
+    :param lines: the listing lines
+    :type lines: iterable of strings
+    :returns: generator of ContentsEntry
+    """
+    conv = _Converter()
+    for line in lines:
+        match = _GNU_TAR_RE.match(line) or _BSD_TAR_RE.match(line)
+        if not match:
+            continue
+        perms = match.group('perms')
+        name, linkname = _split_link(match.group('name'), perms)
+        uid, uname = _owner(match.group('owner'))
+        gid, gname = _owner(match.group('group'))
+        if perms[0] == 'd' and name.endswith('/'):
+            name = name[:-1]
+        yield ContentsEntry(name, _size(match.group('size')), conv.mode(perms),
+                            uid, gid, uname, gname,
+                            conv.date(match.group('date')), linkname, None)
+
+
+def parse_unsquashfs_ll(lines):
+    """Generator parsing an `unsquashfs -ll` listing.
+    The 'squashfs-root' destination prefix is removed from the names
+    and its own root entry is skipped.
+
+    :param lines: the listing lines
+    :type lines: iterable of strings
+    :returns: generator of ContentsEntry
+    """
+    for entry in parse_tar_tv(lines):
+        root, _sep, name = entry.name.partition('/')
+        if not name:
+            continue
+        if not root:
+            name = entry.name
+        yield entry._replace(name=name)
+
+
+def parse_isoinfo_l(lines):
+    """Generator parsing an `isoinfo -l` listing
+
+    :param lines: the listing lines
+    :type lines: iterable of strings
+    :returns: generator of ContentsEntry
+    """
+    conv = _Converter()
+    directory = ''
+    for line in lines:
+        if line.startswith(_ISOINFO_DIR):
+            directory = line[len(_ISOINFO_DIR):].strip().strip('/')
+            continue
+        match = _ISOINFO_RE.match(line)
+        if not match:
+            continue
+        name = match.group('name')
+        if name in ('.', '..'):
+            continue
+        if directory:
+            name = directory + '/' + name
+        perms = match.group('perms')
+        name, linkname = _split_link(name, perms)
+        yield ContentsEntry(name, int(match.group('size')), conv.mode(perms),
+                            int(match.group('owner')), int(match.group('group')),
+                            '', '', conv.date(match.group('date')), linkname,
+                            None)
+
+
+def parse_isoinfo_f(lines):
+    """Generator parsing an `isoinfo -f` path only listing.
+    Only the name field is known.
+
+    :param lines: the listing lines
+    :type lines: iterable of strings
+    :returns: generator of ContentsEntry
+    """
+    for line in lines:
+        name = line.strip().lstrip('/')
+        if name:
+            yield ContentsEntry(name, 0, 0, -1, -1, '', '', 0, '', None)
+
+
+# The listing parsers by definition cmd
+PARSERS = {
+    "tar": parse_tar_tv,
+    "bsdtar": parse_tar_tv,
+    "unsquashfs": parse_unsquashfs_ll,
+    "isoinfo": parse_isoinfo_l,
+}
+
+
+def get_parser(cmd, args):
+    """Returns the parser for the contents definition command
+
+    :param cmd: the definition command
+    :type cmd: string
+    :param args: the definition command arguments
+    :type args: list
+    :returns: function or None
+    """
+    if cmd == "isoinfo" and "-l" not in args:
+        return parse_isoinfo_f
+    return PARSERS.get(cmd)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+results.py
+
+The result record returned by the (de)compression and contents
+operations, with the timing and resource usage of the utility run.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+from collections import namedtuple
+
+
+# The resource usage of a finished child process.
+# The cpu and memory fields are None when they could not be measured.
+ProcessStats = namedtuple("ProcessStats", ["returncode", "wall_time",
+                                           "user_time", "sys_time",
+                                           "max_rss"])
+
+
+RESULT_FIELDS = ["operation", "mode", "success", "returncode", "wall_time",
+                 "user_time", "sys_time", "max_rss", "input_bytes",
+                 "output_bytes"]
+
+
+class OperationResult(object):
+    """The outcome of one operation.
+
+    It is true if the operation succeeded, so it can be tested like the
+    boolean the operations used to return.
+
+    operation:     'compress', 'extract', 'rsync', 'contents' or 'test'
+    mode:          the definition mode run
+    success:       boolean
+    returncode:    the utility's exit code, None if not run as a process
+    wall_time:     elapsed seconds
+    user_time, sys_time: child cpu seconds
+    max_rss:       child peak resident set size in KiB
+    input_bytes, output_bytes: data sizes read and produced
+    extra:         dictionary for any additional operation details
+    """
+
+    __slots__ = RESULT_FIELDS + ["extra"]
+
+    def __init__(self, operation, mode, success, stats=None, **kwargs):
+        """Class init
+
+        :param operation: the operation name
+        :type operation: string
+        :param mode: the definition mode run
+        :type mode: string
+        :param success: the operation succeeded
+        :type success: boolean
+        :param stats: optional child process resource usage
+        :type stats: ProcessStats
+        :param kwargs: optional values of the other RESULT_FIELDS,
+                       overriding the stats ones
+        """
+        if stats is None:
+            stats = ProcessStats(None, None, None, None, None)
+        self.operation = operation
+        self.mode = mode
+        self.success = bool(success)
+        self.returncode = kwargs.pop('returncode', stats.returncode)
+        self.wall_time = kwargs.pop('wall_time', stats.wall_time)
+        self.user_time = kwargs.pop('user_time', stats.user_time)
+        self.sys_time = kwargs.pop('sys_time', stats.sys_time)
+        self.max_rss = kwargs.pop('max_rss', stats.max_rss)
+        self.input_bytes = kwargs.pop('input_bytes', None)
+        self.output_bytes = kwargs.pop('output_bytes', None)
+        if kwargs:
+            raise TypeError("OperationResult: unknown fields %s"
+                            % sorted(kwargs))
+        self.extra = {}
+
+    def __bool__(self):
+        return self.success
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return "<OperationResult %s %s: success=%s, wall_time=%s, ratio=%s>" % (
+            self.operation, self.mode, self.success, self.wall_time, self.ratio)
+
+    @property
+    def cpu_time(self):
+        """The child's total user + sys cpu seconds or None"""
+        if self.user_time is None or self.sys_time is None:
+            return None
+        return self.user_time + self.sys_time
+
+    @property
+    def ratio(self):
+        """The compressed to uncompressed size ratio or None.
+        It is always <= 1.0 for an effective compression or extraction."""
+        if not self.input_bytes or not self.output_bytes:
+            return None
+        if self.operation == 'compress':
+            return float(self.output_bytes) / self.input_bytes
+        if self.operation == 'extract':
+            return float(self.input_bytes) / self.output_bytes
+        return None
+
+    @property
+    def throughput(self):
+        """The input bytes processed per wall second or None"""
+        if not self.input_bytes or not self.wall_time:
+            return None
+        return self.input_bytes / float(self.wall_time)
+
+    def as_dict(self):
+        """Returns the result fields as a dictionary, for metrics systems"""
+        data = dict((field, getattr(self, field)) for field in RESULT_FIELDS)
+        data['cpu_time'] = self.cpu_time
+        data['ratio'] = self.ratio
+        data['throughput'] = self.throughput
+        data.update(self.extra)
+        return data
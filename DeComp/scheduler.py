@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+"""
+scheduler.py
+
+Bounded parallel job scheduler used to run many (de)compression jobs.
+
+Each job has a thread weight, the number of cores its utility keeps busy.
+Jobs are started in order only once enough of the thread slots are free,
+so running several multi-threaded compressors at once does not
+oversubscribe the cores.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from DeComp import log
+
+
+def cpu_count():
+    """Returns the number of cores usable by this process"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class ThreadSlots(object):
+    """Counting semaphore handing out a number of thread slots at a time"""
+
+    def __init__(self, capacity=None):
+        """Class init
+
+        :param capacity: the total number of thread slots,
+                         defaults to the number of usable cores
+        :type capacity: integer
+        """
+        self.capacity = capacity or cpu_count()
+        self.free = self.capacity
+        self._cond = threading.Condition()
+
+    def clamp(self, count):
+        """Returns the count limited to the 1..capacity range"""
+        return max(1, min(count, self.capacity))
+
+    def acquire(self, count):
+        """Blocks until the count of slots are free, then takes them
+
+        :param count: the number of slots, clamped to the capacity
+        :type count: integer
+        :returns: integer, the number of slots taken
+        """
+        count = self.clamp(count)
+        with self._cond:
+            while self.free < count:
+                self._cond.wait()
+            self.free -= count
+        return count
+
+    def release(self, count):
+        """Returns the slots taken by acquire()
+
+        :param count: the number of slots acquire() returned
+        :type count: integer
+        """
+        with self._cond:
+            self.free += count
+            self._cond.notify_all()
+
+
+def run_jobs(func, jobs, weight, max_workers=None, max_threads=None,
+             logger=None):
+    """Runs func(job) for each job on a bounded worker pool
+
+    :param func: the function to run for each job
+    :type func: function
+    :param jobs: the jobs to run
+    :type jobs: iterable
+    :param weight: function returning the number of threads a job uses
+    :type weight: function
+    :param max_workers: the maximum number of jobs running at once,
+                        defaults to the number of usable cores
+    :type max_workers: integer
+    :param max_threads: the maximum number of threads in use by the running
+                        jobs, defaults to the number of usable cores
+    :type max_threads: integer
+    :param logger: optional logging module instance
+    :type logger: logging
+    :returns: list of (job, result) tuples in completion order,
+              the result is False if the job raised an exception
+    """
+    logger = logger or log
+    max_workers = max_workers or cpu_count()
+    slots = ThreadSlots(max_threads)
+    # only dispatch jobs a worker is free to start right away
+    workers = threading.BoundedSemaphore(max_workers)
+    results = []
+    lock = threading.Lock()
+
+    def _run(job, count):
+        try:
+            result = func(job)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error("scheduler: run_jobs(); job %s failed: %s",
+                         job, str(error))
+            result = False
+        finally:
+            slots.release(count)
+            workers.release()
+        with lock:
+            results.append((job, result))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for job in jobs:
+            # weigh the job first, a failing weight() holds no worker
+            threads = weight(job)
+            workers.acquire()
+            count = slots.acquire(threads)
+            logger.debug("scheduler: run_jobs(); starting %s, threads: %d",
+                         job, count)
+            pool.submit(_run, job, count)
+    return results
@@ -0,0 +1,658 @@
+# -*- coding: utf-8 -*-
+
+"""
+seekable.py
+
+Seekable multi-frame zstd and xz archives.
+
+The tar stream is cut into fixed size frames, each compressed on its own
+in parallel, so they can also be decompressed in parallel or read at
+random offsets.  The output is a valid archive for the regular
+decompressors, which simply decode the frames one after the other.
+
+zstd: the frames are standard zstd frames, followed by a seek table in a
+    skippable frame, in the zstd seekable format (contrib/seekable_format
+    of the zstd sources).  The frames are (de)compressed by the
+    compression.zstd (python 3.14) or zstandard module when one is
+    installed.  Otherwise each frame is compressed by the zstd utility and
+    the whole archive is decompressed by a single zstd process.
+xz: each frame is an xz block, written by a single multi-threaded xz
+    process, or a complete xz stream compressed by the lzma module when
+    the xz utility is not installed.  The stream indexes already hold the
+    sizes needed to locate the frames, no extra table is written.  The
+    frames are decompressed by the lzma module, which releases the GIL
+    while working.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import io
+import lzma
+import os
+import struct
+import subprocess
+import threading
+import zlib
+from bisect import bisect_right
+from collections import deque, namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from DeComp.scheduler import cpu_count
+from DeComp.utils import command_args, find_binary
+
+try:
+    # python 3.14+
+    from compression import zstd as _zstd_module
+except ImportError:
+    try:
+        import zstandard as _zstd_module
+    except ImportError:
+        _zstd_module = None
+
+# True if the zstd frames are (de)compressed in process
+ZSTD_IN_PROCESS = _zstd_module is not None
+_ZSTD_ERRORS = (getattr(_zstd_module, 'ZstdError', ValueError),)
+
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A5E
+ZSTD_SEEKABLE_MAGIC = 0x8F92EAB1
+ZSTD_SEEK_FOOTER = struct.Struct('<IBI')
+ZSTD_SKIPPABLE_HEADER = struct.Struct('<II')
+ZSTD_MAX_FRAME_SIZE = 0xFFFFFFFF
+
+XZ_HEADER_MAGIC = b"\xfd7zXZ\0"
+XZ_FOOTER_MAGIC = b"YZ"
+XZ_HEADER_SIZE = 12
+XZ_FOOTER_SIZE = 12
+
+# The number of decoded frames kept by SeekableFile
+FRAME_CACHE = 4
+
+# The size of the chunks copied through the codec processes
+CHUNK_SIZE = 65536
+
+# One frame: its compressed offset and size, its uncompressed
+# offset and size, and for an xz block the (check id, unpadded size)
+# needed to decode it on its own, or None
+Frame = namedtuple("Frame", ["offset", "size", "data_offset", "data_size",
+                             "block"])
+
+
+class SeekableError(IOError):
+    """Raised for invalid or truncated seekable archives"""
+
+
+def _frames(sizes):
+    """Returns the Frame list of the (compressed, uncompressed) sizes"""
+    frames = []
+    offset = data_offset = 0
+    for size, data_size in sizes:
+        frames.append(Frame(offset, size, data_offset, data_size, None))
+        offset += size
+        data_offset += data_size
+    return frames
+
+
+def _zstd_seek_table(archive, end):
+    """Reads the zstd seek table, returns the frame sizes or None"""
+    if end < ZSTD_SEEK_FOOTER.size + ZSTD_SKIPPABLE_HEADER.size:
+        return None
+    archive.seek(end - ZSTD_SEEK_FOOTER.size)
+    count, descriptor, magic = ZSTD_SEEK_FOOTER.unpack(
+        archive.read(ZSTD_SEEK_FOOTER.size))
+    if magic != ZSTD_SEEKABLE_MAGIC:
+        return None
+    entry = 12 if descriptor & 0x80 else 8
+    table = count * entry + ZSTD_SEEK_FOOTER.size
+    start = end - table - ZSTD_SKIPPABLE_HEADER.size
+    if start < 0:
+        raise SeekableError("truncated zstd seek table")
+    archive.seek(start)
+    magic, size = ZSTD_SKIPPABLE_HEADER.unpack(
+        archive.read(ZSTD_SKIPPABLE_HEADER.size))
+    if magic != ZSTD_SKIPPABLE_MAGIC or size != table:
+        raise SeekableError("invalid zstd seek table frame")
+    data = archive.read(count * entry)
+    sizes = [struct.unpack_from('<II', data, pos)
+             for pos in range(0, len(data), entry)]
+    if sum(x[0] for x in sizes) != start:
+        raise SeekableError("the zstd seek table does not match the frames")
+    return sizes
+
+
+def _varint(data, pos):
+    """Decodes an xz multibyte integer, returns (value, next position)"""
+    value = shift = 0
+    while True:
+        if pos >= len(data) or shift > 56:
+            raise SeekableError("invalid xz index")
+        byte = data[pos]
+        value |= (byte & 0x7F) << shift
+        pos += 1
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _xz_blocks(archive, end):
+    """Reads the xz stream indexes backwards from the end,
+    returns the Frame list of their blocks or None if it is not an xz file"""
+    streams = []
+    while end > 0:
+        archive.seek(end - 4)
+        if archive.read(4) == b"\0\0\0\0":
+            # stream padding
+            end -= 4
+            continue
+        if end < XZ_HEADER_SIZE + XZ_FOOTER_SIZE:
+            return None
+        archive.seek(end - XZ_FOOTER_SIZE)
+        footer = archive.read(XZ_FOOTER_SIZE)
+        if footer[10:] != XZ_FOOTER_MAGIC:
+            return None
+        index_size = (struct.unpack_from('<I', footer, 4)[0] + 1) * 4
+        archive.seek(end - XZ_FOOTER_SIZE - index_size)
+        index = archive.read(index_size)
+        if not index or index[0] != 0:
+            raise SeekableError("invalid xz index")
+        count, pos = _varint(index, 1)
+        blocks = []
+        for _record in range(count):
+            unpadded, pos = _varint(index, pos)
+            uncompressed, pos = _varint(index, pos)
+            blocks.append((unpadded, uncompressed))
+        start = end - XZ_FOOTER_SIZE - index_size - \
+            sum((x[0] + 3) & ~3 for x in blocks) - XZ_HEADER_SIZE
+        if start < 0:
+            raise SeekableError("truncated xz stream")
+        streams.append((start, footer[9] & 0x0F, blocks))
+        end = start
+    frames = []
+    data_offset = 0
+    for start, check, blocks in reversed(streams):
+        offset = start + XZ_HEADER_SIZE
+        for unpadded, data_size in blocks:
+            size = (unpadded + 3) & ~3
+            frames.append(Frame(offset, size, data_offset, data_size,
+                                (check, unpadded)))
+            offset += size
+            data_offset += data_size
+    return frames
+
+
+def _xz_varint(value):
+    """Encodes an xz multibyte integer"""
+    data = bytearray()
+    while value >= 0x80:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def _xz_block_stream(data, frame):
+    """Wraps an xz block into a single block xz stream,
+    so it can be decompressed on its own"""
+    check, unpadded = frame.block
+    flags = bytes([0, check])
+    index = b"\0\1" + _xz_varint(unpadded) + _xz_varint(frame.data_size)
+    index += b"\0" * (-len(index) % 4)
+    index += struct.pack('<I', zlib.crc32(index))
+    backward = struct.pack('<I', len(index) // 4 - 1) + flags
+    return b''.join([
+        XZ_HEADER_MAGIC, flags, struct.pack('<I', zlib.crc32(flags)),
+        data, index, struct.pack('<I', zlib.crc32(backward)), backward,
+        XZ_FOOTER_MAGIC])
+
+
+def read_frames(path, codec):
+    """Returns the frames of a seekable archive
+
+    :param path: path to the archive
+    :type path: string
+    :param codec: 'zstd' or 'xz'
+    :type codec: string
+    :returns: list of Frame or None if the archive has no seek table
+    :raises SeekableError: if the seek table is invalid
+    """
+    with open(path, 'rb') as archive:
+        end = archive.seek(0, os.SEEK_END)
+        if codec == "zstd":
+            sizes = _zstd_seek_table(archive, end)
+            return _frames(sizes) if sizes else None
+        frames = _xz_blocks(archive, end)
+    if not frames or len(frames) < 2:
+        # a regular single block xz file
+        return None
+    return frames
+
+
+def is_seekable(path, codec):
+    """Returns True if the archive has a seek table,
+    for the format sniffing
+
+    :param path: path to the archive
+    :type path: string
+    :param codec: 'zstd' or 'xz'
+    :type codec: string
+    :returns: boolean
+    """
+    try:
+        return bool(read_frames(path, codec))
+    except (IOError, OSError):
+        return False
+
+
+def _zstd(args, data, env):
+    """Runs the zstd utility over the data, returns its output"""
+    proc = subprocess.run(command_args(["zstd", "-q"] + args, env), input=data,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          env=env, check=False)
+    if proc.returncode != 0:
+        raise SeekableError("zstd failed: %s"
+                            % proc.stderr.decode('UTF-8', 'replace').strip())
+    return proc.stdout
+
+
+def _zstd_level(env):
+    """Returns the level of the ZSTD_CLEVEL environment variable or 3"""
+    value = (env or {}).get("ZSTD_CLEVEL", "").strip()
+    if value.lstrip('-').isdigit():
+        return int(value)
+    return 3
+
+
+def _process(args, chunks, env):
+    """Generator running a codec utility as a filter, feeding it the chunks
+    from a thread and yielding its output
+
+    :param args: the utility's argv list
+    :type args: list of strings
+    :param chunks: the utility's input
+    :type chunks: iterable of bytes
+    :param env: the environment to run the utility in
+    :type env: dictionary
+    :returns: generator of bytes
+    :raises SeekableError: if the utility fails
+    """
+    env = env or {}
+    proc = subprocess.Popen(command_args(args, env), stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            env=env)
+    failure = []
+
+    def _feed():
+        try:
+            for chunk in chunks:
+                proc.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        except (IOError, OSError, SeekableError) as error:
+            failure.append(error)
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=_feed, daemon=True)
+    feeder.start()
+    finished = False
+    try:
+        for chunk in iter(lambda: proc.stdout.read(CHUNK_SIZE), b''):
+            yield chunk
+        finished = True
+    finally:
+        if not finished:
+            # the consumer stopped early
+            proc.kill()
+        proc.stdout.close()
+        feeder.join()
+        error = proc.stderr.read().decode('UTF-8', 'replace').strip()
+        proc.stderr.close()
+        returncode = proc.wait()
+    if failure:
+        raise SeekableError(str(failure[0]))
+    if returncode != 0:
+        raise SeekableError("%s failed: %s" % (args[0], error))
+
+
+def _xz_preset(env):
+    """Returns the preset of a "-N" XZ_OPT environment variable or 6"""
+    value = (env or {}).get("XZ_OPT", "").strip().lstrip('-')
+    if value[:1].isdigit():
+        return int(value[0]) | (lzma.PRESET_EXTREME if value.endswith('e')
+                                else 0)
+    return 6
+
+
+def compress_frame(codec, data, env=None):
+    """Compresses one frame
+
+    :param codec: 'zstd' or 'xz'
+    :type codec: string
+    :param data: the frame's uncompressed data
+    :type data: bytes
+    :param env: the environment for the zstd utility, also holding
+                the XZ_OPT or ZSTD_CLEVEL level variables
+    :type env: dictionary
+    :returns: bytes
+    """
+    if codec != "zstd":
+        return lzma.compress(data, format=lzma.FORMAT_XZ,
+                             preset=_xz_preset(env))
+    if _zstd_module is None:
+        return _zstd(["-c"], data, env or {})
+    if _zstd_module.__name__ == "zstandard":
+        return _zstd_module.ZstdCompressor(
+            level=_zstd_level(env)).compress(data)
+    return _zstd_module.compress(data, level=_zstd_level(env))
+
+
+def decompress_frame(codec, data, env=None):
+    """Decompresses one frame
+
+    :param codec: 'zstd' or 'xz'
+    :type codec: string
+    :param data: the frame's compressed data
+    :type data: bytes
+    :param env: the environment for the zstd utility
+    :type env: dictionary
+    :returns: bytes
+    """
+    if codec != "zstd":
+        try:
+            return lzma.decompress(data, format=lzma.FORMAT_XZ)
+        except lzma.LZMAError as error:
+            raise SeekableError("xz frame: %s" % str(error)) from error
+    if _zstd_module is None:
+        return _zstd(["-d", "-c"], data, env or {})
+    try:
+        if _zstd_module.__name__ == "zstandard":
+            return _zstd_module.ZstdDecompressor().decompressobj().decompress(
+                data)
+        return _zstd_module.decompress(data)
+    except _ZSTD_ERRORS as error:
+        raise SeekableError("zstd frame: %s" % str(error)) from error
+
+
+def _decode(codec, frame, data, env):
+    """Decompresses the data of one of the read_frames()"""
+    if frame.block is not None:
+        data = _xz_block_stream(data, frame)
+    return decompress_frame(codec, data, env)
+
+
+def _ordered(pool, jobs, window):
+    """Generator of the results of the submitted (function, args) jobs in
+    order, with at most window of them pending"""
+    pending = deque()
+    for func, args in jobs:
+        pending.append(pool.submit(func, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _read_exactly(stream, size):
+    """Reads size bytes from the stream, less only at its end"""
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def compress_stream(stream, output, codec, frame_size, threads=None,
+                    env=None):
+    """Compresses the stream into the output as independent frames,
+    compressing up to threads frames at once
+
+    :param stream: the uncompressed data
+    :type stream: binary file object
+    :param output: the archive being written
+    :type output: binary file object
+    :param codec: 'zstd' or 'xz'
+    :type codec: string
+    :param frame_size: the uncompressed size of each frame
+    :type frame_size: integer
+    :param threads: number of frames compressed at once,
+                    default: the number of usable cores
+    :type threads: integer
+    :param env: the environment for the zstd utility and level variables
+    :type env: dictionary
+    :returns: integer, the number of frames written
+    :raises SeekableError: if a frame fails to compress
+    """
+    if codec == "zstd" and frame_size > ZSTD_MAX_FRAME_SIZE:
+        raise SeekableError("zstd seekable frames are limited to 4 GiB")
+    threads = threads or cpu_count()
+    if codec == "xz" and find_binary("xz"):
+        return _xz_compress_stream(stream, output, frame_size, threads, env)
+
+    def _jobs():
+        while True:
+            data = _read_exactly(stream, frame_size)
+            if not data:
+                return
+            yield (lambda x: (len(x), compress_frame(codec, x, env))), (data,)
+
+    sizes = []
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for data_size, frame in _ordered(pool, _jobs(), threads * 2):
+            output.write(frame)
+            sizes.append((len(frame), data_size))
+    if codec == "zstd":
+        table = b''.join(struct.pack('<II', *x) for x in sizes)
+        table += ZSTD_SEEK_FOOTER.pack(len(sizes), 0, ZSTD_SEEKABLE_MAGIC)
+        output.write(ZSTD_SKIPPABLE_HEADER.pack(ZSTD_SKIPPABLE_MAGIC,
+                                                len(table)))
+        output.write(table)
+    return len(sizes)
+
+
+def _xz_compress_stream(stream, output, frame_size, threads, env):
+    """Compresses the stream into the output with a single xz process,
+    writing a block per frame_size bytes with its threads.
+    See compress_stream() for the parameters.
+    """
+    data_size = [0]
+
+    def _chunks():
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            data_size[0] += len(chunk)
+            yield chunk
+
+    args = ["xz", "-q", "-c", "-T%d" % threads,
+            "--block-size=%d" % frame_size]
+    for chunk in _process(args, _chunks(), env):
+        output.write(chunk)
+    return -(-data_size[0] // frame_size)
+
+
+def _zstd_decompress_stream(path, env, digests):
+    """Generator decompressing the whole zstd archive with a single zstd
+    process, which skips the seek table's skippable frame.
+    See decompress_stream() for the parameters.
+    """
+    with open(path, 'rb') as archive:
+
+        def _chunks():
+            for chunk in iter(lambda: archive.read(CHUNK_SIZE), b''):
+                if digests is not None:
+                    digests.update(chunk)
+                yield chunk
+
+        for chunk in _process(["zstd", "-q", "-d", "-c"], _chunks(), env):
+            yield chunk
+
+
+def decompress_stream(path, frames, codec, threads=None, env=None,
+                      digests=None):
+    """Generator decompressing the frames in parallel,
+    yielding their data in order
+
+    :param path: path to the archive
+    :type path: string
+    :param frames: the archive's read_frames()
+    :type frames: list of Frame
+    :param codec: 'zstd' or 'xz'
+    :type codec: string
+    :param threads: number of frames decompressed at once,
+                    default: the number of usable cores
+    :type threads: integer
+    :param env: the environment for the zstd utility
+    :type env: dictionary
+    :param digests: optional digests to update with the whole archive,
+                    read in order along with the frames
+    :type digests: digests.Digests
+    :returns: generator of bytes
+    :raises SeekableError: if a frame fails to decompress
+    """
+    if codec == "zstd" and _zstd_module is None:
+        for data in _zstd_decompress_stream(path, env, digests):
+            yield data
+        return
+    threads = threads or cpu_count()
+    with open(path, 'rb') as archive:
+
+        def _jobs():
+            end = 0
+            for frame in frames:
+                if digests is None:
+                    archive.seek(frame.offset)
+                    data = archive.read(frame.size)
+                else:
+                    # include any bytes between the frames
+                    archive.seek(end)
+                    data = archive.read(frame.offset + frame.size - end)
+                    digests.update(data)
+                    data = data[-frame.size:]
+                end = frame.offset + frame.size
+                yield _decode, (codec, frame, data, env)
+            if digests is not None:
+                # the seek table or the last stream's padding
+                archive.seek(end)
+                digests.update(archive.read())
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for data in _ordered(pool, _jobs(), threads * 2):
+                yield data
+
+
+class StreamReader(io.RawIOBase):
+    """Read only file object over the decompress_stream() data,
+    for the tarfile stream modes"""
+
+    def __init__(self, chunks):
+        super(StreamReader, self).__init__()
+        self._chunks = chunks
+        # the current chunk and the offset of its unread data
+        self._buffer = memoryview(b'')
+        self._offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._offset >= len(self._buffer):
+            chunk = next(self._chunks, b'')
+            if not chunk:
+                return 0
+            self._buffer = memoryview(chunk)
+            self._offset = 0
+        size = min(len(buffer), len(self._buffer) - self._offset)
+        buffer[:size] = self._buffer[self._offset:self._offset + size]
+        self._offset += size
+        return size
+
+    def close(self):
+        self._chunks.close()
+        super(StreamReader, self).close()
+
+
+class SeekableFile(io.RawIOBase):
+    """Random access read only file object over the uncompressed data
+    of a seekable archive.  Only the frames read from are decompressed."""
+
+    def __init__(self, path, frames, codec, env=None):
+        """Class init
+
+        :param path: path to the archive
+        :type path: string
+        :param frames: the archive's read_frames()
+        :type frames: list of Frame
+        :param codec: 'zstd' or 'xz'
+        :type codec: string
+        :param env: the environment for the zstd utility
+        :type env: dictionary
+        """
+        super(SeekableFile, self).__init__()
+        self._archive = open(path, 'rb')
+        self._frames = frames
+        self._starts = [x.data_offset for x in frames]
+        self._codec = codec
+        self._env = env
+        self._cache = OrderedDict()
+        self._pos = 0
+        self.size = frames[-1].data_offset + frames[-1].data_size
+        # the number of frames decompressed, for the callers' statistics
+        self.decoded = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position %d" % offset)
+        self._pos = offset
+        return self._pos
+
+    def _frame_data(self, index):
+        """Returns the decompressed data of the frame, cached"""
+        if index in self._cache:
+            self._cache.move_to_end(index)
+            return self._cache[index]
+        frame = self._frames[index]
+        self._archive.seek(frame.offset)
+        data = _decode(self._codec, frame, self._archive.read(frame.size),
+                       self._env)
+        self.decoded += 1
+        self._cache[index] = data
+        if len(self._cache) > FRAME_CACHE:
+            self._cache.popitem(last=False)
+        return data
+
+    def readinto(self, buffer):
+        # fills the whole buffer across the frames, tarfile takes the
+        # short reads for a truncated archive
+        buffer = memoryview(buffer).cast('B')
+        filled = 0
+        while filled < len(buffer) and self._pos < self.size:
+            index = bisect_right(self._starts, self._pos) - 1
+            data = self._frame_data(index)
+            start = self._pos - self._frames[index].data_offset
+            size = min(len(buffer) - filled, len(data) - start)
+            buffer[filled:filled + size] = data[start:start + size]
+            filled += size
+            self._pos += size
+        return filled
+
+    def close(self):
+        self._archive.close()
+        super(SeekableFile, self).close()
@@ -0,0 +1,499 @@
+# -*- coding: utf-8 -*-
+
+"""
+squashfs.py
+
+In process squashfs 4.0 image reader used by the ContentsMap py_squashfs
+mode, instead of running `unsquashfs -ll` or mounting the image.
+
+The superblock, the id table, the inode table and the directory table
+are parsed straight from the image file.  Only the metadata blocks are
+read for a contents listing, the data blocks and fragments are only
+read to return a file's content with read().
+
+The gzip, lzma and xz compressed images are decompressed with the zlib
+and lzma modules.  The zstd ones need the compression.zstd (python 3.14)
+or zstandard module, running the zstd utility for each of the small
+blocks would be slower than unsquashfs.  The lzo and lz4 compressed
+images, and the zstd ones without a zstd module, raise UnsupportedImage
+so the callers can fall back to unsquashfs.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import grp
+import lzma
+import os
+import pwd
+import stat
+import struct
+import zlib
+from collections import namedtuple, OrderedDict
+
+from DeComp.entries import ContentsEntry
+from DeComp.seekable import decompress_frame, SeekableError, ZSTD_IN_PROCESS
+
+
+SQUASHFS_MAGIC = 0x73717368
+
+SUPERBLOCK = struct.Struct('<IIIIIHHHHHHQQQQQQQQ')
+INODE_HEADER = struct.Struct('<HHHHII')
+DIRECTORY_HEADER = struct.Struct('<III')
+DIRECTORY_ENTRY = struct.Struct('<HhHH')
+FRAGMENT_ENTRY = struct.Struct('<QII')
+DIRECTORY_INODE = struct.Struct('<IIHHI')
+EXTENDED_DIRECTORY_INODE = struct.Struct('<IIIIHHI')
+FILE_INODE = struct.Struct('<IIII')
+EXTENDED_FILE_INODE = struct.Struct('<QQQIIII')
+SYMLINK_INODE = struct.Struct('<II')
+
+# The uncompressed size of a metadata block
+METADATA_SIZE = 8192
+
+# The number of decompressed metadata blocks kept by SquashfsImage
+METADATA_CACHE = 256
+
+# The squashfs compressor ids
+COMPRESSORS = {
+    1: "gzip",
+    2: "lzma",
+    3: "lzo",
+    4: "xz",
+    5: "lz4",
+    6: "zstd",
+}
+
+_METADATA_UNCOMPRESSED = 0x8000
+_DATA_UNCOMPRESSED = 1 << 24
+_NO_FRAGMENT = 0xFFFFFFFF
+_IDS_PER_BLOCK = METADATA_SIZE // 4
+_FRAGMENTS_PER_BLOCK = METADATA_SIZE // FRAGMENT_ENTRY.size
+
+# basic inode type: stat file type bits, the extended types are 7 above
+_FILE_TYPES = {
+    1: stat.S_IFDIR,
+    2: stat.S_IFREG,
+    3: stat.S_IFLNK,
+    4: stat.S_IFBLK,
+    5: stat.S_IFCHR,
+    6: stat.S_IFIFO,
+    7: stat.S_IFSOCK,
+}
+
+
+Superblock = namedtuple("Superblock", [
+    "magic", "inode_count", "mod_time", "block_size", "fragment_count",
+    "compressor", "block_log", "flags", "id_count", "version_major",
+    "version_minor", "root_inode", "bytes_used", "id_table", "xattr_table",
+    "inode_table", "directory_table", "fragment_table", "export_table"])
+
+# One inode, the fields not used by its type are empty.
+# size: the file size, the directory listing size or the symlink target size
+# directory: the (block, offset) of a directory's listing
+# blocks: the data (start, block sizes) of a regular file
+Inode = namedtuple("Inode", [
+    "type", "mode", "uid", "gid", "mtime", "number", "size", "target",
+    "directory", "fragment", "fragment_offset", "blocks"])
+
+
+class SquashfsError(IOError):
+    """Raised for invalid or truncated squashfs images"""
+
+
+class UnsupportedImage(SquashfsError):
+    """Raised for the valid images this reader can not decompress"""
+
+
+def _decompressor(compressor):
+    """Returns the decompress(data) function of the compressor
+
+    :param compressor: the superblock compressor id
+    :type compressor: integer
+    :returns: function
+    :raises UnsupportedImage: for the lzo, lz4 and unknown compressors,
+                              and zstd without a zstd module
+    """
+    name = COMPRESSORS.get(compressor, str(compressor))
+    if name == "gzip":
+        return zlib.decompress
+    if name == "lzma":
+        return lambda data: lzma.decompress(data, lzma.FORMAT_ALONE)
+    if name == "xz":
+        return lambda data: lzma.decompress(data, lzma.FORMAT_XZ)
+    if name == "zstd" and ZSTD_IN_PROCESS:
+        return lambda data: decompress_frame("zstd", data)
+    if name == "zstd":
+        raise UnsupportedImage("the zstd compressor needs the "
+                               "compression.zstd or zstandard module")
+    raise UnsupportedImage("the %s compressor is not supported" % name)
+
+
+class _MetadataCursor(object):
+    """Reads consecutive bytes of a metadata table, across its blocks"""
+
+    def __init__(self, image, position, offset):
+        """Class init
+
+        :param image: the image to read from
+        :type image: SquashfsImage
+        :param position: the image offset of the metadata block
+        :type position: integer
+        :param offset: the offset in the uncompressed block
+        :type offset: integer
+        """
+        self._image = image
+        self.position = position
+        self.offset = offset
+
+
+    def read(self, size):
+        """Reads the next bytes, continuing into the following blocks
+
+        :param size: the number of bytes to read
+        :type size: integer
+        :returns: bytes
+        :raises SquashfsError: if the table ends before size bytes
+        """
+        chunks = []
+        while size > 0:
+            data, following = self._image.metadata_block(self.position)
+            chunk = data[self.offset:self.offset + size]
+            if not chunk:
+                raise SquashfsError("truncated metadata at %d"
+                                    % self.position)
+            chunks.append(chunk)
+            size -= len(chunk)
+            self.offset += len(chunk)
+            if self.offset >= len(data):
+                self.position, self.offset = following, 0
+        return b''.join(chunks)
+
+
+    def unpack(self, layout):
+        """Reads and unpacks the next structure
+
+        :param layout: the structure's layout
+        :type layout: struct.Struct
+        :returns: tuple of the unpacked fields
+        """
+        return layout.unpack(self.read(layout.size))
+
+
+def _names(table, lookup):
+    """Returns the user or group name of each id, '' if unknown"""
+    names = {}
+    for number in set(table):
+        try:
+            names[number] = lookup(number)[0]
+        except KeyError:
+            names[number] = ''
+    return names
+
+
+class SquashfsImage(object):
+    """Read only access to a squashfs 4.0 image"""
+
+    def __init__(self, path):
+        """Class init, reads the superblock and the id table
+
+        :param path: path to the image
+        :type path: string
+        :raises SquashfsError: if it is not a valid squashfs 4.0 image
+        :raises UnsupportedImage: if its compressor is not supported
+        :raises OSError: if the image can not be read
+        """
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY)
+        self._cache = OrderedDict()
+        try:
+            self.superblock = Superblock(*SUPERBLOCK.unpack(
+                self._read(0, SUPERBLOCK.size)))
+            if self.superblock.magic != SQUASHFS_MAGIC:
+                raise SquashfsError("%s is not a squashfs image" % path)
+            if self.superblock.version_major != 4:
+                raise UnsupportedImage(
+                    "squashfs version %d.%d is not supported"
+                    % (self.superblock.version_major,
+                       self.superblock.version_minor))
+            self._decompress = _decompressor(self.superblock.compressor)
+            self.ids = self._id_table()
+        except Exception:
+            os.close(self._fd)
+            raise
+        self._unames = None
+        self._gnames = None
+
+
+    def close(self):
+        """Closes the image file"""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._cache.clear()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *_exc):
+        self.close()
+
+
+    def _read(self, offset, size):
+        """Reads exactly size bytes at the image offset"""
+        data = os.pread(self._fd, size, offset)
+        if len(data) != size:
+            raise SquashfsError("%s is truncated at %d" % (self.path, offset))
+        return data
+
+
+    def metadata_block(self, position):
+        """Returns a decompressed metadata block and the position of the
+        next one
+
+        :param position: the image offset of the block
+        :type position: integer
+        :returns: (bytes, integer) tuple
+        """
+        cached = self._cache.get(position)
+        if cached is not None:
+            self._cache.move_to_end(position)
+            return cached
+        header, = struct.unpack('<H', self._read(position, 2))
+        size = header & ~_METADATA_UNCOMPRESSED
+        data = self._read(position + 2, size)
+        if not header & _METADATA_UNCOMPRESSED:
+            data = self._inflate(data)
+        cached = (data, position + 2 + size)
+        self._cache[position] = cached
+        if len(self._cache) > METADATA_CACHE:
+            self._cache.popitem(last=False)
+        return cached
+
+
+    def _inflate(self, data):
+        """Decompresses a metadata or data block"""
+        try:
+            return self._decompress(data)
+        except (zlib.error, lzma.LZMAError, ValueError, SeekableError) \
+                as error:
+            raise SquashfsError("%s: corrupt block: %s"
+                                % (self.path, str(error))) from error
+
+
+    def _table_cursor(self, table, index, per_block, entry_size):
+        """Returns the cursor to an entry of an indexed table,
+        the id and fragment tables"""
+        location, = struct.unpack(
+            '<Q', self._read(table + 8 * (index // per_block), 8))
+        return _MetadataCursor(self, location,
+                               (index % per_block) * entry_size)
+
+
+    def _id_table(self):
+        """Reads the uid/gid table"""
+        count = self.superblock.id_count
+        if not count:
+            return []
+        cursor = self._table_cursor(self.superblock.id_table, 0,
+                                    _IDS_PER_BLOCK, 4)
+        return list(struct.unpack('<%dI' % count, cursor.read(4 * count)))
+
+
+    def inode(self, reference, blocks=False):
+        """Reads an inode
+
+        :param reference: the inode reference, the metadata block
+                          offset in the table << 16 | the offset in it
+        :type reference: integer
+        :param blocks: read a regular file's block sizes too
+        :type blocks: boolean
+        :returns: Inode
+        """
+        cursor = _MetadataCursor(self, self.superblock.inode_table +
+                                 (reference >> 16), reference & 0xFFFF)
+        itype, perms, uid, gid, mtime, number = cursor.unpack(INODE_HEADER)
+        if itype < 1 or itype > 14:
+            raise SquashfsError("%s: unknown inode type %d"
+                                % (self.path, itype))
+        basic = (itype - 1) % 7 + 1
+        try:
+            uid, gid = self.ids[uid], self.ids[gid]
+        except IndexError as error:
+            raise SquashfsError("%s: invalid inode id index"
+                                % self.path) from error
+        fields = {
+            "type": basic, "mode": _FILE_TYPES[basic] | perms, "uid": uid,
+            "gid": gid, "mtime": mtime, "number": number, "size": 0,
+            "target": '', "directory": None, "fragment": _NO_FRAGMENT,
+            "fragment_offset": 0, "blocks": None,
+        }
+        if itype == 1:
+            block, _nlink, size, offset, _parent = cursor.unpack(
+                DIRECTORY_INODE)
+            fields.update(size=size, directory=(block, offset))
+        elif itype == 8:
+            _nlink, size, block, _parent, _count, offset, _xattr = \
+                cursor.unpack(EXTENDED_DIRECTORY_INODE)
+            fields.update(size=size, directory=(block, offset))
+        elif basic == 2:
+            if itype == 2:
+                start, fragment, offset, size = cursor.unpack(FILE_INODE)
+            else:
+                start, size, _sparse, _nlink, fragment, offset, _xattr = \
+                    cursor.unpack(EXTENDED_FILE_INODE)
+            fields.update(size=size, fragment=fragment,
+                          fragment_offset=offset)
+            if blocks:
+                count = size // self.superblock.block_size
+                if fragment == _NO_FRAGMENT and \
+                        size % self.superblock.block_size:
+                    count += 1
+                fields['blocks'] = (start, struct.unpack(
+                    '<%dI' % count, cursor.read(4 * count)))
+        elif basic == 3:
+            _nlink, size = cursor.unpack(SYMLINK_INODE)
+            target = cursor.read(size).decode('UTF-8', 'surrogateescape')
+            fields.update(size=size, target=target)
+        return Inode(**fields)
+
+
+    def listdir(self, inode):
+        """Returns the entries of a directory
+
+        :param inode: the directory's inode
+        :type inode: Inode
+        :returns: list of (name, inode reference) tuples, in name order
+        """
+        # the listing size counts the '.' and '..' entries, 3 bytes
+        remaining = inode.size - 3
+        if remaining <= 0:
+            return []
+        block, offset = inode.directory
+        cursor = _MetadataCursor(self, self.superblock.directory_table + block,
+                                 offset)
+        entries = []
+        while remaining > 0:
+            count, start, _number = cursor.unpack(DIRECTORY_HEADER)
+            remaining -= DIRECTORY_HEADER.size
+            for _index in range(count + 1):
+                offset, _delta, _itype, size = cursor.unpack(DIRECTORY_ENTRY)
+                name = cursor.read(size + 1).decode('UTF-8', 'surrogateescape')
+                remaining -= DIRECTORY_ENTRY.size + size + 1
+                entries.append((name, (start << 16) | offset))
+        return entries
+
+
+    def walk(self):
+        """Generator of the image's inodes below the root, depth first in
+        the order `unsquashfs -ll` lists them
+
+        :returns: generator of (path, Inode) tuples
+        """
+        root = self.inode(self.superblock.root_inode)
+        pending = [iter([(name, reference, '')
+                         for name, reference in self.listdir(root)])]
+        while pending:
+            for name, reference, parent in pending[-1]:
+                path = parent + name
+                inode = self.inode(reference)
+                yield path, inode
+                if inode.type == 1:
+                    pending.append(iter([(x, y, path + '/') for x, y in
+                                         self.listdir(inode)]))
+                    break
+            else:
+                pending.pop()
+
+
+    def entries(self):
+        """Generator of the image's ContentsEntry records, the owner names
+        are looked up on this system as `unsquashfs -ll` does
+
+        :returns: generator of ContentsEntry
+        """
+        if self._unames is None:
+            self._unames = _names(self.ids, pwd.getpwuid)
+            self._gnames = _names(self.ids, grp.getgrgid)
+        for path, inode in self.walk():
+            yield ContentsEntry(path, inode.size, inode.mode, inode.uid,
+                                inode.gid, self._unames[inode.uid],
+                                self._gnames[inode.gid], inode.mtime,
+                                inode.target, None)
+
+
+    def lookup(self, path):
+        """Returns the inode reference of a path, symlinks are not followed
+
+        :param path: the path in the image
+        :type path: string
+        :returns: integer
+        :raises SquashfsError: if it is not found
+        """
+        reference = self.superblock.root_inode
+        for name in [x for x in path.split('/') if x and x != '.']:
+            inode = self.inode(reference)
+            if inode.type != 1:
+                raise SquashfsError("%s: not a directory in: %s"
+                                    % (self.path, path))
+            for entry, entry_reference in self.listdir(inode):
+                if entry == name:
+                    reference = entry_reference
+                    break
+            else:
+                raise SquashfsError("%s: not found: %s" % (self.path, path))
+        return reference
+
+
+    def read(self, path):
+        """Returns the content of a regular file
+
+        :param path: the path in the image
+        :type path: string
+        :returns: bytes
+        :raises SquashfsError: if it is not found or not a regular file
+        """
+        inode = self.inode(self.lookup(path), blocks=True)
+        if inode.type != 2:
+            raise SquashfsError("%s: not a regular file: %s"
+                                % (self.path, path))
+        block_size = self.superblock.block_size
+        position, sizes = inode.blocks
+        remaining = inode.size
+        chunks = []
+        for size in sizes:
+            length = size & (_DATA_UNCOMPRESSED - 1)
+            if not length:
+                # a sparse block
+                chunk = bytes(min(block_size, remaining))
+            else:
+                chunk = self._read(position, length)
+                position += length
+                if not size & _DATA_UNCOMPRESSED:
+                    chunk = self._inflate(chunk)
+            chunks.append(chunk[:remaining])
+            remaining -= len(chunks[-1])
+        if remaining > 0 and inode.fragment != _NO_FRAGMENT:
+            data = self._fragment(inode.fragment)
+            chunks.append(data[inode.fragment_offset:
+                               inode.fragment_offset + remaining])
+        data = b''.join(chunks)
+        if len(data) != inode.size:
+            raise SquashfsError("%s: truncated file: %s" % (self.path, path))
+        return data
+
+
+    def _fragment(self, index):
+        """Returns a decompressed fragment block"""
+        if index >= self.superblock.fragment_count:
+            raise SquashfsError("%s: invalid fragment %d" % (self.path, index))
+        cursor = self._table_cursor(self.superblock.fragment_table, index,
+                                    _FRAGMENTS_PER_BLOCK, FRAGMENT_ENTRY.size)
+        start, size, _unused = cursor.unpack(FRAGMENT_ENTRY)
+        data = self._read(start, size & (_DATA_UNCOMPRESSED - 1))
+        if size & _DATA_UNCOMPRESSED:
+            return data
+        return self._inflate(data)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""
+streams.py
+
+Pipe helpers connecting the (de)compression utilities to the caller's
+file objects, used by CompressMap.compress_to() and extract_from().
+
+File descriptors, and file objects backed by one, are handed to the
+utility directly.  Other file objects are fed through an OS pipe,
+enlarged to PIPE_BUFFER_SIZE where the kernel allows it, by a relay
+thread, so the archive never goes through a temporary file.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import fcntl
+import io
+import os
+import threading
+
+
+# The requested pipe buffer size, limited by /proc/sys/fs/pipe-max-size
+PIPE_BUFFER_SIZE = 1 << 20
+
+# Read size of the relay threads
+RELAY_CHUNK = 1 << 20
+
+
+def open_pipe(size=PIPE_BUFFER_SIZE):
+    """Creates a pipe with an enlarged buffer
+
+    :param size: the requested buffer size
+    :type size: integer
+    :returns: (read fd, write fd) tuple
+    """
+    read, write = os.pipe()
+    setsize = getattr(fcntl, 'F_SETPIPE_SZ', None)
+    if setsize is not None:
+        try:
+            fcntl.fcntl(write, setsize, size)
+        except OSError:
+            # above the unprivileged limit, keep the default size
+            pass
+    return read, write
+
+
+def stream_fileno(stream):
+    """Returns the file descriptor of the stream
+
+    :param stream: file descriptor or file object
+    :type stream: integer or file object
+    :returns: integer or None if it has no usable file descriptor
+    """
+    if isinstance(stream, int):
+        return stream
+    try:
+        return stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
+def stream_reader(stream):
+    """Returns the read(size) function of the stream
+
+    :param stream: file descriptor or file object
+    :type stream: integer or file object
+    :returns: function
+    """
+    if isinstance(stream, int):
+        return lambda size: os.read(stream, size)
+    return stream.read
+
+
+def stream_writer(stream):
+    """Returns a write(data) function writing all of the data to the stream
+
+    :param stream: file descriptor or file object
+    :type stream: integer or file object
+    :returns: function
+    """
+    write = stream.write if not isinstance(stream, int) else \
+        (lambda data: os.write(stream, data))
+
+    def _write_all(data):
+        view = memoryview(data)
+        while view:
+            written = write(view)
+            if written is None:
+                # file objects not reporting the size write all of it
+                break
+            view = view[written:]
+    return _write_all
+
+
+def read_header(read, size):
+    """Reads up to size bytes, less only at the end of the stream
+
+    :param read: the stream's read(size) function
+    :type read: function
+    :param size: the number of bytes to read
+    :type size: integer
+    :returns: bytes
+    """
+    chunks = []
+    while size > 0:
+        chunk = read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+class Relay(threading.Thread):
+    """Thread copying a stream into another until the end of the source,
+    then closing the pipe end it owns"""
+
+    def __init__(self, read, write, owned, prefix=b'', digests=None):
+        """Class init
+
+        :param read: the source's read(size) function
+        :type read: function
+        :param write: the target's write(data) function, writing all
+        :type write: function
+        :param owned: the pipe end to close once done, so the other
+                      side sees the end of the stream
+        :type owned: integer
+        :param prefix: optional data to send ahead of the source's
+        :type prefix: bytes
+        :param digests: optional digests to update with the data copied
+        :type digests: digests.Digests
+        """
+        super(Relay, self).__init__(name="DeComp relay")
+        self.daemon = True
+        self._read = read
+        self._write = write
+        self._owned = owned
+        self._prefix = prefix
+        self._digests = digests
+        # the number of bytes copied
+        self.bytes = 0
+        # the exception stopping the copy, if any
+        self.error = None
+
+
+    def run(self):
+        try:
+            data = self._prefix or self._read(RELAY_CHUNK)
+            while data:
+                if self._digests is not None:
+                    self._digests.update(data)
+                self._write(data)
+                self.bytes += len(data)
+                data = self._read(RELAY_CHUNK)
+        except (IOError, OSError, ValueError) as error:
+            self.error = error
+        finally:
+            os.close(self._owned)
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+
+"""
+treecopy.py
+
+Native tree copier used by CompressMap.rsync() for local transfers
+within one filesystem, in place of an `rsync -a --delete` process.
+
+The result matches `rsync -a --delete`: the files, symlinks, devices
+and special files are copied with their permissions, times, group and,
+when running as root, owner.  Files whose size and mtime already match
+are not copied again, only their metadata is updated, and the
+destination entries missing from the source are deleted.  Devices are
+only copied when running as root.  As with `rsync -a`, the hardlinks,
+extended attributes and ACLs are not preserved.
+
+The file data is cloned with the FICLONE ioctl where the filesystem
+supports reflinks (btrfs, xfs, ...), making the copy near instant,
+otherwise it is copied in kernel with os.copy_file_range().  The files
+are copied on a thread pool, each to a temporary name then renamed.
+
+Maintained in full by:
+    Brian Dolbec <dolsen@gentoo.org>
+
+"""
+
+import errno
+import fcntl
+import os
+import shutil
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from DeComp import log
+from DeComp.scheduler import cpu_count
+
+
+# The FICLONE ioctl request number, _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# Bytes requested per os.copy_file_range() call
+COPY_CHUNK = 1 << 30
+
+_NOT_SUPPORTED = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL,
+                  errno.ENOSYS, errno.EBADF)
+
+
+def is_remote(path):
+    """Returns True if the rsync path names a remote host,
+    'host:path' or 'rsync://host/path'
+
+    :param path: the rsync source or destination
+    :type path: string
+    :returns: boolean
+    """
+    head = path.split('/', 1)[0]
+    return ':' in head or path.startswith("rsync://")
+
+
+def rsync_target(source, destination):
+    """Returns the directory the source's contents are copied to, following
+    rsync's trailing slash rule: 'src/' copies the contents of src into
+    destination, 'src' copies src itself into destination.  A file is
+    copied into the destination when it is a directory.
+
+    :param source: the source path
+    :type source: string
+    :param destination: the destination path
+    :type destination: string
+    :returns: string
+    """
+    if source.endswith('/'):
+        return destination
+    if not os.path.isdir(source) and not os.path.isdir(destination) and \
+            not destination.endswith('/'):
+        return destination
+    return os.path.join(destination, os.path.basename(source.rstrip('/')))
+
+
+def same_filesystem(source, destination):
+    """Returns True if a local source and destination are on the same
+    filesystem, the destination or its nearest existing parent is checked
+
+    :param source: the source path
+    :type source: string
+    :param destination: the destination path
+    :type destination: string
+    :returns: boolean
+    """
+    if is_remote(source) or is_remote(destination):
+        return False
+    try:
+        device = os.lstat(source).st_dev
+    except OSError:
+        return False
+    path = os.path.abspath(destination)
+    while True:
+        try:
+            return os.lstat(path).st_dev == device
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+
+
+def _clone(src, dst, size):
+    """Copies the file data, returns the method used"""
+    try:
+        fcntl.ioctl(dst, FICLONE, src)
+        return 'reflink'
+    except OSError as error:
+        if error.errno not in _NOT_SUPPORTED:
+            raise
+    copy_range = getattr(os, 'copy_file_range', None)
+    if copy_range is not None:
+        try:
+            copied = 0
+            while copied < size:
+                count = copy_range(src, dst, min(COPY_CHUNK, size - copied))
+                if not count:
+                    break
+                copied += count
+            return 'copy_file_range'
+        except OSError as error:
+            if error.errno not in _NOT_SUPPORTED:
+                raise
+            os.lseek(src, 0, os.SEEK_SET)
+            os.lseek(dst, 0, os.SEEK_SET)
+            os.ftruncate(dst, 0)
+    with os.fdopen(os.dup(src), 'rb') as source, \
+            os.fdopen(os.dup(dst), 'wb') as target:
+        shutil.copyfileobj(source, target, 1 << 20)
+    return 'copy'
+
+
+def _set_owner(path, info, follow=True):
+    """Copies the owner as root and the group where permitted"""
+    uid = info.st_uid if os.geteuid() == 0 else -1
+    try:
+        if follow:
+            os.chown(path, uid, info.st_gid)
+        else:
+            os.lchown(path, uid, info.st_gid)
+    except PermissionError:
+        pass
+
+
+def _remove(path):
+    """Removes a file, symlink or directory tree"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+class TreeCopy(object):
+    """One `rsync -a --delete` like tree copy"""
+
+    def __init__(self, max_workers=None, logger=None):
+        """Class init
+
+        :param max_workers: the number of files copied at once,
+                            default: the number of usable cores
+        :type max_workers: integer
+        :param logger: optional logging module instance
+        :type logger: logging
+        """
+        self.max_workers = max_workers or cpu_count()
+        self.logger = logger or log
+        self._lock = threading.Lock()
+        # the copy statistics, see copy()
+        self.stats = {}
+
+
+    def _count(self, key, amount=1):
+        """Adds the amount to one of the copy statistics, thread safe
+
+        :param key: the statistic's name, see copy()
+        :type key: string
+        :param amount: the amount to add
+        :type amount: integer
+        """
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+
+    def _error(self, path, error):
+        """Logs and counts an entry failing to copy
+
+        :param path: the entry's path
+        :type path: string
+        :param error: the error raised
+        :type error: Exception
+        """
+        self.logger.error("TreeCopy: %s: %s", path, str(error))
+        self._count('errors')
+
+
+    def copy(self, source, target):
+        """Copies the source tree to the target directory
+
+        :param source: the source file or directory
+        :type source: string
+        :param target: the path the source is copied to
+        :type target: string
+        :returns: boolean, False if any entry failed to copy
+        """
+        self.stats = {'files': 0, 'skipped': 0, 'deleted': 0, 'bytes': 0,
+                      'errors': 0}
+        try:
+            info = os.lstat(source)
+        except OSError as error:
+            self._error(source, error)
+            return False
+        parent = os.path.dirname(os.path.abspath(target))
+        try:
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+        except OSError as error:
+            self._error(parent, error)
+            return False
+        if not stat.S_ISDIR(info.st_mode):
+            self._entry(source, target, info)
+            return not self.stats['errors']
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            directories, futures = self._tree(source, target, info, pool)
+            for path, future in futures:
+                try:
+                    future.result()
+                except Exception as error:  # pylint: disable=broad-except
+                    self._error(path, error)
+        # directory metadata last, the copies inside change the mtimes
+        for dst, dirinfo in reversed(directories):
+            try:
+                self._metadata(dst, dirinfo)
+            except OSError as error:
+                self._error(dst, error)
+        return not self.stats['errors']
+
+
+    def _tree(self, source, target, info, pool):
+        """Copies the directories, submitting their files to the pool.
+        Returns the directories created, as (target, stat result), and the
+        submitted copies, as (source, future)."""
+        directories = []
+        futures = []
+        pending = [(source, target, info)]
+        while pending:
+            src, dst, dirinfo = pending.pop()
+            try:
+                if os.path.lexists(dst) and not (os.path.isdir(dst) and
+                                                 not os.path.islink(dst)):
+                    _remove(dst)
+                    self._count('deleted')
+                if not os.path.isdir(dst):
+                    os.mkdir(dst, 0o700)
+                with os.scandir(src) as entries:
+                    entries = list(entries)
+            except OSError as error:
+                self._error(src, error)
+                continue
+            directories.append((dst, dirinfo))
+            self._delete_extraneous(dst, set(x.name for x in entries))
+            for entry in entries:
+                try:
+                    entry_info = entry.stat(follow_symlinks=False)
+                except OSError as error:
+                    self._error(entry.path, error)
+                    continue
+                if stat.S_ISDIR(entry_info.st_mode):
+                    pending.append((entry.path, os.path.join(dst, entry.name),
+                                    entry_info))
+                else:
+                    futures.append((entry.path, pool.submit(
+                        self._entry, entry.path,
+                        os.path.join(dst, entry.name), entry_info)))
+        return directories, futures
+
+
+    def _delete_extraneous(self, target, names):
+        """Deletes the target directory's entries missing from the source"""
+        try:
+            existing = os.listdir(target)
+        except OSError as error:
+            self._error(target, error)
+            return
+        for name in existing:
+            if name in names:
+                continue
+            try:
+                _remove(os.path.join(target, name))
+                self._count('deleted')
+            except OSError as error:
+                self._error(os.path.join(target, name), error)
+
+
+    def _entry(self, source, target, info):
+        """Copies one non directory entry"""
+        try:
+            if stat.S_ISREG(info.st_mode):
+                self._file(source, target, info)
+            elif stat.S_ISLNK(info.st_mode):
+                self._symlink(source, target, info)
+            else:
+                self._special(source, target, info)
+        except OSError as error:
+            self._error(source, error)
+
+
+    def _file(self, source, target, info):
+        """Copies a regular file unless its size and mtime match,
+        then only its metadata is updated"""
+        try:
+            current = os.lstat(target)
+        except OSError:
+            current = None
+        if current is not None and stat.S_ISREG(current.st_mode) and \
+                current.st_size == info.st_size and \
+                int(current.st_mtime) == int(info.st_mtime):
+            self._metadata(target, info)
+            self._count('skipped')
+            return
+        if current is not None and stat.S_ISDIR(current.st_mode):
+            shutil.rmtree(target)
+        temp = os.path.join(os.path.dirname(target),
+                            ".%s.decomp%d" % (os.path.basename(target),
+                                              threading.get_ident()))
+        src = os.open(source, os.O_RDONLY)
+        try:
+            dst = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                method = _clone(src, dst, info.st_size)
+            finally:
+                os.close(dst)
+            self._metadata(temp, info)
+            os.rename(temp, target)
+        except Exception:
+            if os.path.lexists(temp):
+                os.unlink(temp)
+            raise
+        finally:
+            os.close(src)
+        self._count('files')
+        self._count('bytes', info.st_size)
+        self._count(method)
+
+
+    def _symlink(self, source, target, info):
+        """Recreates a symlink unless it already points to the same path"""
+        link = os.readlink(source)
+        if os.path.islink(target) and os.readlink(target) == link:
+            self._count('skipped')
+            return
+        if os.path.lexists(target):
+            _remove(target)
+        os.symlink(link, target)
+        _set_owner(target, info, follow=False)
+        if os.utime in os.supports_follow_symlinks:
+            os.utime(target, ns=(info.st_atime_ns, info.st_mtime_ns),
+                     follow_symlinks=False)
+        self._count('files')
+
+
+    def _special(self, source, target, info):
+        """Recreates a device, fifo or socket node unless it matches,
+        then only its metadata is updated.  Devices need root."""
+        if (stat.S_ISBLK(info.st_mode) or stat.S_ISCHR(info.st_mode)) and \
+                os.geteuid() != 0:
+            self.logger.warning("TreeCopy: %s: skipping the device, "
+                                "not running as root", source)
+            self._count('skipped')
+            return
+        try:
+            current = os.lstat(target)
+        except OSError:
+            current = None
+        if current is not None and current.st_mode == info.st_mode and \
+                current.st_rdev == info.st_rdev:
+            self._metadata(target, info)
+            self._count('skipped')
+            return
+        if current is not None:
+            _remove(target)
+        os.mknod(target, info.st_mode, info.st_rdev)
+        self._metadata(target, info)
+        self._count('files')
+
+
+    @staticmethod
+    def _metadata(path, info):
+        """Copies the owner, permissions and times"""
+        _set_owner(path, info)
+        os.chmod(path, stat.S_IMODE(info.st_mode))
+        os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns))
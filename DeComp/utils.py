@@ -5,26 +5,44 @@ Utility functions
 
 from __future__ import print_function
 
+import os
+import resource
+import shlex
+import stat
 import sys
+import time
 from collections import namedtuple
 from subprocess import Popen, PIPE
 
 from DeComp import log
+from DeComp.results import ProcessStats
 
 BASH_CMD = "/bin/bash"
 
+# process wide binary availability cache, see check_available()
+_AVAILABLE = {'path': None, 'mtimes': None, 'paths': {}}
+
+# argv template slot types, see compile_args()
+LITERAL = 0
+FIELD = 1
+SPLICE = 2
+OTHER_OPTIONS = "other_options"
+
+# compiled argv templates by args tuple
+_TEMPLATES = {}
+
 
 def _is_available(self, available_binaries):
     """Private function for the named tuple classes
 
     :param available_binaries: the confirmed installed binaries
-    :type: available_binaries: set
+    :type: available_binaries: set or LazyAvailable
     :returns: boolean
     """
-    return self.binaries.issubset(available_binaries)
+    return all(x in available_binaries for x in self.binaries)
 
 
-def create_classes(definitions, fields):
+def create_classes(definitions, fields, defaults=None):
     """This function dynamically creates the namedtuple classes which are
     used for the information they contain in a consistent manner.
 
@@ -33,8 +51,12 @@ def create_classes(definitions, fields):
     :type definitions: dictionary
     :param fields: list of the field names to create
     :type fields: list
+    :param defaults: optional values of the trailing fields
+        a definition may leave out
+    :type defaults: dictionary
     :returns: class_map: dictionary of key: namedtuple class instance
     """
+    defaults = defaults or {}
     class_map = {}
     for name in list(definitions):
         # create the namedtuple class instance
@@ -42,17 +64,78 @@ def create_classes(definitions, fields):
         # reduce memory used by limiting it to the predefined fields variables
         obj.__slots__ = ()
         obj.enabled = _is_available
+        values = list(definitions[name])
+        for field in fields[len(values):]:
+            values.append(defaults.get(field))
         # now add the instance to our map
-        class_map[name] = obj._make(definitions[name])
+        class_map[name] = obj._make(values)
     del obj
     return class_map
 
 
+def compile_args(args):
+    """Compiles the definition args list into an argv template.
+    The templates are cached, so each args list is only compiled once.
+
+    Each template slot is a (type, value) tuple:
+        (LITERAL, word)     word passed as is
+        (FIELD, format)     word with %(name)s substitution(s)
+        (SPLICE, name)      the other_options placeholder
+
+    :param args: definition command arguments
+    :type args: list
+    :returns: tuple of the template slots
+    """
+    key = tuple(args)
+    if key not in _TEMPLATES:
+        template = []
+        for arg in args:
+            if arg == OTHER_OPTIONS:
+                template.append((SPLICE, arg))
+                continue
+            # remove any shell quoting the definition may contain
+            for word in shlex.split(arg):
+                if '%(' in word:
+                    template.append((FIELD, word))
+                elif word:
+                    template.append((LITERAL, word))
+        _TEMPLATES[key] = tuple(template)
+    return _TEMPLATES[key]
+
+
+def render_args(template, values):
+    """Fills the argv template slots with the values
+
+    :param template: as returned by compile_args()
+    :type template: tuple
+    :param values: the substitution values, create_infodict() like
+    :type values: dictionary
+    :returns: list of the argv words
+    """
+    argv = []
+    for kind, value in template:
+        if kind == LITERAL:
+            argv.append(value)
+        elif kind == FIELD:
+            word = value % values
+            if word:
+                argv.append(word)
+        else:
+            options = values.get(value)
+            if not options:
+                continue
+            if not isinstance(options, str):
+                options = ' '.join(options)
+            argv.extend(shlex.split(options))
+    return argv
+
+
 def subcmd(command, exc="", env=None, debug=False):
     """General purpose function to run a command in a subprocess
 
-    :param command: command string to run
-    :type command: string
+    :param command: argv list to run directly or
+                    a command string to run with bash
+    :type command: list or string
     :param exc: command name being run (used for the log)
     :type exc: string
     :param env: the environment to run the command in
@@ -61,22 +144,288 @@ def subcmd(command, exc="", env=None, debug=False):
     :type debug: boolean
     :returns: boolean
     """
+    return run_command(command, exc, env, debug).returncode == 0
+
+
+def run_command(command, exc="", env=None, debug=False, wrapper=None,
+                **kwargs):
+    """Runs a command in a subprocess, measuring its resource usage
+
+    :param command: argv list to run directly or
+                    a command string to run with bash
+    :type command: list or string
+    :param exc: command name being run (used for the log)
+    :type exc: string
+    :param env: the environment to run the command in
+    :type env: dictionary
+    :param debug: optional default: False
+    :type debug: boolean
+    :param wrapper: optional argv words to run the command through,
+                    see governor.ResourceGovernor.wrapper()
+    :type wrapper: list of strings
+    :param kwargs: optional extra Popen parameters
+    :returns: ProcessStats
+    """
     env = env or {}
     sys.stdout.flush()
-    args = [BASH_CMD]
-    if debug:
-        args.append("-x")
-    args.append("-c")
-    args.append(command)
+    args = (wrapper or []) + command_args(command, env, debug)
     log.debug("subcmd(); args = %s", args)
+    start = time.time()
     try:
-        proc = Popen(args, env=env)
+        proc = Popen(args, env=env, **kwargs)
     except:
         raise
-    if proc.wait() != 0:
+    stats = wait_process(proc, start)
+    if stats.returncode != 0:
         log.debug("subcmd() NON-zero return value from: %s", exc)
-        return False
-    return True
+    return stats
+
+
+def run_pipeline(commands, exc="", env=None, debug=False, wrapper=None,
+                 **kwargs):
+    """Runs the commands with each one's stdout piped into the next one's
+    stdin, measuring their combined resource usage
+
+    :param commands: the argv lists or command strings to run
+    :type commands: list
+    :param exc: pipeline name being run (used for the log)
+    :type exc: string
+    :param env: the environment to run the commands in
+    :type env: dictionary
+    :param debug: optional default: False
+    :type debug: boolean
+    :param wrapper: optional argv words to run every command through,
+                    see governor.ResourceGovernor.wrapper()
+    :type wrapper: list of strings
+    :param kwargs: optional extra Popen parameters of every command
+    :returns: ProcessStats, the returncode is the first non-zero one,
+              the cpu times are summed and max_rss is the largest
+    """
+    env = env or {}
+    sys.stdout.flush()
+    start = time.time()
+    procs = []
+    stdin = None
+    try:
+        for index, command in enumerate(commands):
+            args = (wrapper or []) + command_args(command, env, debug)
+            log.debug("run_pipeline(); args = %s", args)
+            last = index == len(commands) - 1
+            proc = Popen(args, env=env, stdin=stdin,
+                         stdout=None if last else PIPE, **kwargs)
+            if stdin is not None:
+                # only the next process holds the pipe open
+                stdin.close()
+            stdin = proc.stdout
+            procs.append(proc)
+    except OSError:
+        for proc in procs:
+            proc.kill()
+            proc.wait()
+        raise
+    results = [wait_process(proc, start) for proc in procs]
+    returncode = 0
+    for result in results:
+        if result.returncode != 0:
+            returncode = result.returncode
+            break
+    if returncode != 0:
+        log.debug("run_pipeline() NON-zero return value from: %s", exc)
+    measured = [x for x in results if x.user_time is not None]
+    if len(measured) != len(results):
+        return ProcessStats(returncode, time.time() - start, None, None, None)
+    return ProcessStats(returncode, time.time() - start,
+                        sum(x.user_time for x in measured),
+                        sum(x.sys_time for x in measured),
+                        max(x.max_rss for x in measured))
+
+
+def cpu_times():
+    """Returns the cpu time used so far by this process and its
+    waited for children
+
+    :returns: (user, sys) tuple of seconds
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (own.ru_utime + children.ru_utime,
+            own.ru_stime + children.ru_stime)
+
+
+def wait_process(proc, start):
+    """Waits for a Popen process to finish using os.wait4(),
+    so its resource usage is known
+
+    :param proc: the started process
+    :type proc: subprocess.Popen
+    :param start: the time.time() the process was started at
+    :type start: float
+    :returns: ProcessStats
+    """
+    if proc.returncode is not None or not hasattr(os, 'wait4'):
+        return ProcessStats(proc.wait(), time.time() - start, None, None, None)
+    _pid, status, usage = os.wait4(proc.pid, 0)
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+    return ProcessStats(proc.returncode, time.time() - start, usage.ru_utime,
+                        usage.ru_stime, usage.ru_maxrss)
+
+
+def tree_size(path):
+    """Returns the total size of the files in a directory tree,
+    counting hardlinked files once.  Symlinks are not followed.
+
+    :param path: the directory or file path
+    :type path: string
+    :returns: integer bytes, or None if the path does not exist
+    """
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(info.st_mode):
+        return info.st_size
+    total = 0
+    seen = set()
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                info = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if info.st_nlink > 1:
+                if (info.st_dev, info.st_ino) in seen:
+                    continue
+                seen.add((info.st_dev, info.st_ino))
+            if stat.S_ISREG(info.st_mode):
+                total += info.st_size
+    return total
+
+
+def notify_hooks(hooks, result, logger=None):
+    """Calls each hook with the operation result.
+    A failing hook is logged, it does not fail the operation.
+
+    :param hooks: the callables accepting an OperationResult
+    :type hooks: list
+    :param result: the finished operation's result
+    :type result: OperationResult
+    :param logger: optional logging module instance
+    :type logger: logging
+    """
+    for hook in hooks:
+        try:
+            hook(result)
+        except Exception as error:  # pylint: disable=broad-except
+            (logger or log).error("utils: notify_hooks(); hook %s failed: %s",
+                                  hook, str(error))
+
+
+def command_args(command, env, debug=False):
+    """Returns the argv to execute for the command
+
+    :param command: argv list to run directly or
+                    a command string to run with bash
+    :type command: list or string
+    :param env: the environment the command will run in
+    :type env: dictionary
+    :param debug: run bash with -x
+    :type debug: boolean
+    :returns: list
+    """
+    if isinstance(command, str):
+        args = [BASH_CMD]
+        if debug:
+            args.append("-x")
+        args.append("-c")
+        args.append(command)
+        return args
+    args = list(command)
+    if 'PATH' not in env and os.sep not in args[0]:
+        # run the same binary check_available() found
+        args[0] = find_binary(args[0]) or args[0]
+    return args
+
+
+def _dir_mtimes(path):
+    """Returns the mtimes of the PATH directories, which change when
+    a binary is installed or removed in one of them.
+
+    :param path: the PATH value
+    :type path: string
+    :returns: tuple
+    """
+    mtimes = []
+    for directory in path.split(os.pathsep):
+        try:
+            mtimes.append(os.stat(directory or os.curdir).st_mtime)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def _cached_paths(check_dirs=False):
+    """Returns the availability cache dictionary for the current PATH,
+    resetting it first if the PATH has changed.  The mtimes of the PATH
+    directories are only compared with check_dirs, which
+    check_available() and LazyAvailable() do once, not every lookup.
+
+    :param check_dirs: also reset the cache if a binary was installed
+                       or removed in one of the PATH directories
+    :type check_dirs: boolean
+    :returns: dictionary of binary: full path or None
+    """
+    path = os.environ.get('PATH', os.defpath)
+    if check_dirs or _AVAILABLE['path'] != path:
+        mtimes = _dir_mtimes(path)
+        if _AVAILABLE['path'] != path or _AVAILABLE['mtimes'] != mtimes:
+            _AVAILABLE['path'] = path
+            _AVAILABLE['mtimes'] = mtimes
+            _AVAILABLE['paths'] = {}
+    return _AVAILABLE['paths']
+
+
+def _probe(command, path):
+    """Searches the PATH directories for an executable command
+
+    :param command: the binary name to look for
+    :type command: string
+    :param path: the PATH value to search
+    :type path: string
+    :returns: string: the full path to the binary or None
+    """
+    for directory in path.split(os.pathsep):
+        filepath = os.path.join(directory or os.curdir, command)
+        if os.path.isfile(filepath) and os.access(filepath, os.X_OK):
+            return filepath
+    return None
+
+
+def find_binary(command):
+    """Returns the full path of an installed binary.
+    The results are cached until the PATH or, checked by the next
+    check_available(), one of its directories changes,
+    see clear_available_cache().
+
+    :param command: the binary name to look for
+    :type command: string
+    :returns: string: the full path to the binary or None
+    """
+    paths = _cached_paths()
+    if command not in paths:
+        paths[command] = _probe(command, _AVAILABLE['path'])
+        log.debug("utils: find_binary(); %s = %s", command, paths[command])
+    return paths[command]
+
+
+def clear_available_cache():
+    """Invalidates the process wide binary availability cache"""
+    _AVAILABLE['path'] = None
+    _AVAILABLE['mtimes'] = None
+    _AVAILABLE['paths'] = {}
+
 
 def check_available(commands):
     """Checks for the available binaries
@@ -85,21 +434,26 @@ def check_available(commands):
     :type commands: list
     :returns: set of the installed binaries available
     """
-    cmd = ["which"]
-    cmd.extend(commands)
-    proc = None
-    try:
-        proc = Popen(cmd, stdout=PIPE, stderr=PIPE)
-        results = proc.communicate()
-        stdout = results[0].decode('UTF-8')
-    except OSError as error:
-        stdout = u''
-        log.error("utils: check_available(); OSError: %s, %s",
-                  str(error), ' '.join(cmd))
-    finally:
-        if proc:
-            for pipe in [proc.stdout, proc.stderr]:
-                if pipe:
-                    pipe.close()
-    available = set([x.rsplit('/', 1)[1] for x in stdout.split('\n') if x])
-    return available
+    _cached_paths(check_dirs=True)
+    return set([x for x in commands if find_binary(x)])
+
+
+class LazyAvailable(object):
+    """Set like view of the process wide binary availability cache which
+    only probes for a binary the first time its membership is tested.
+    """
+
+    def __init__(self):
+        _cached_paths(check_dirs=True)
+
+    def __contains__(self, command):
+        return find_binary(command) is not None
+
+    def __repr__(self):
+        paths = _cached_paths()
+        return "LazyAvailable(%s)" % sorted(x for x in paths if paths[x])
+
+    @staticmethod
+    def clear():
+        """Forgets the probe results, so they will be re-checked"""
+        clear_available_cache()
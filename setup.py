@@ -6,7 +6,7 @@ setup.py
 
 import sys
 
-from distutils.core import setup
+from setuptools import setup
 from DeComp import __version__, __license__
 # this affects the names of all the directories we do stuff with
 sys.path.insert(0, './')
@@ -23,6 +23,7 @@ setup(
     url="https://github.com/dol-sen/pyDeComp",
     packages=['DeComp'],
     license=__license__,
+    python_requires='>=3.7',
     long_description=open('README').read(),
     keywords='archive',
     classifiers=[
@@ -31,10 +32,14 @@ setup(
         'License :: OSI Approved :: BSD License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
         'Topic :: Compression',
     ],
 )
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+make_isos.py
+
+Regenerates the gzipped ISO9660 fixtures of test_iso9660.py with pycdlib,
+an independent ISO writer:
+
+    python tests/data/make_isos.py
+
+plain.iso.gz      ISO9660 names only
+joliet.iso.gz     ISO9660 and Joliet names
+rockridge.iso.gz  Rock Ridge and Joliet, a symlink, a 0600 file and a
+                  directory tree deep enough to be relocated
+
+"""
+
+import gzip
+import io
+import os
+
+import pycdlib
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# The fixture files' contents, by their Rock Ridge and Joliet names
+FILES = {
+    "hello.txt": b"hello world\n",
+    "dir_one/sub/big.bin": bytes(range(256)) * 40,
+}
+
+# The directories of the relocated tree, the Rock Ridge fixture only
+DEEP = ["d%d" % x for x in range(10)]
+
+
+def _iso_name(path, directory=False):
+    """Returns the ISO9660 level 1 path of a fixture path"""
+    names = {"dir_one": "DIR1", "sub": "SUB", "hello.txt": "HELLO.TXT",
+             "big.bin": "BIG.BIN"}
+    parts = [names.get(x, x.upper()) for x in path.split('/')]
+    return '/' + '/'.join(parts) + ('' if directory else ';1')
+
+
+def _names(path, rock_ridge, joliet, directory=False):
+    """Returns the add_*() name arguments of a fixture path"""
+    names = {}
+    if rock_ridge:
+        names['rr_name'] = path.rsplit('/', 1)[-1]
+    if joliet:
+        names['joliet_path'] = '/' + path
+    return _iso_name(path, directory), names
+
+
+def make(name, rock_ridge, joliet):
+    """Writes one gzipped fixture"""
+    iso = pycdlib.PyCdlib()
+    iso.new(interchange_level=3, vol_ident="DECOMP",
+            rock_ridge="1.09" if rock_ridge else None,
+            joliet=3 if joliet else None)
+    for directory in ("dir_one", "dir_one/sub"):
+        path, names = _names(directory, rock_ridge, joliet, True)
+        iso.add_directory(path, **names)
+    for path, data in FILES.items():
+        path, names = _names(path, rock_ridge, joliet)
+        if rock_ridge and path == "/HELLO.TXT;1":
+            names['file_mode'] = 0o100600
+        iso.add_fp(io.BytesIO(data), len(data), path, **names)
+    if rock_ridge:
+        iso.add_symlink("/LINK.;1", "link", "dir_one/sub/big.bin",
+                        joliet_path="/link")
+        deep = ''
+        for directory in DEEP:
+            deep += '/' + directory
+            iso.add_directory(deep.upper(), rr_name=directory,
+                              joliet_path=deep)
+        data = b"deep\n"
+        iso.add_fp(io.BytesIO(data), len(data), deep.upper() + "/DEEP.TXT;1",
+                   rr_name="deep.txt", joliet_path=deep + "/deep.txt")
+    output = io.BytesIO()
+    iso.write_fp(output)
+    iso.close()
+    with gzip.GzipFile(os.path.join(HERE, name + ".iso.gz"), 'wb',
+                       mtime=0) as fixture:
+        fixture.write(output.getvalue())
+
+
+if __name__ == '__main__':
+    make("plain", False, False)
+    make("joliet", False, True)
+    make("rockridge", True, True)
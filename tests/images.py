@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+"""
+images.py
+
+Builds the small archives and images the reader tests check, from a
+directory tree made in the test's temporary directory.
+
+make_squashfs() is a minimal squashfs 4.0 writer, squashfs-tools is
+rarely installed where the tests run.  It writes the regular or the
+extended inodes, a fragment block for the file tails, sparse blocks and
+the id table, all of the metadata in a single inode and directory table.
+
+"""
+
+import lzma
+import os
+import shutil
+import stat
+import struct
+import subprocess
+import zlib
+
+from DeComp.seekable import compress_frame, ZSTD_IN_PROCESS
+
+
+# The squashfs superblock compressor ids
+SQUASHFS_COMPRESSORS = {"gzip": 1, "xz": 4, "zstd": 6}
+
+# The mtime given to every member of the test trees
+MTIME = 1700000000
+
+_METADATA_SIZE = 8192
+_METADATA_UNCOMPRESSED = 0x8000
+_DATA_UNCOMPRESSED = 1 << 24
+_NO_FRAGMENT = 0xFFFFFFFF
+_NO_TABLE = 0xFFFFFFFFFFFFFFFF
+_SUPERBLOCK = struct.Struct('<IIIIIHHHHHHQQQQQQQQ')
+
+
+def can_compress(compressor):
+    """Returns True if the squashfs compressor can be written here"""
+    if compressor == "zstd":
+        return ZSTD_IN_PROCESS or shutil.which("zstd") is not None
+    return compressor in SQUASHFS_COMPRESSORS
+
+
+def make_tree(path):
+    """Creates the test tree, returns the expected file contents
+
+    :param path: the directory to create
+    :type path: string
+    :returns: dictionary of the regular file paths to their contents
+    """
+    files = {
+        "hello.txt": b"hello world\n",
+        "empty": b"",
+        "dir/sub/data.bin": bytes(range(256)) * 40 + b"tail",
+        "dir/sparse.bin": b"a" * 100 + bytes(8192) + b"b" * 100,
+        "dir/random.bin": os.urandom(5000),
+    }
+    for name, data in files.items():
+        target = os.path.join(path, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as output:
+            output.write(data)
+    os.chmod(os.path.join(path, "hello.txt"), 0o600)
+    os.symlink("sub/data.bin", os.path.join(path, "dir", "link"))
+    os.mkfifo(os.path.join(path, "dir", "fifo"))
+    for root, dirs, names in os.walk(path, topdown=False):
+        for name in dirs + names:
+            os.utime(os.path.join(root, name), (MTIME, MTIME),
+                     follow_symlinks=False)
+    return files
+
+
+def _compress(compressor, data):
+    """Compresses one metadata or data block"""
+    if compressor == "gzip":
+        return zlib.compress(data, 9)
+    if compressor == "xz":
+        return lzma.compress(data, lzma.FORMAT_XZ, check=lzma.CHECK_CRC32)
+    if ZSTD_IN_PROCESS:
+        return compress_frame("zstd", data)
+    return subprocess.run(["zstd", "-q", "-c"], input=data, check=True,
+                          stdout=subprocess.PIPE).stdout
+
+
+class _Metadata(object):
+    """A metadata table being written in 8 KiB blocks"""
+
+    def __init__(self, compressor):
+        self.compressor = compressor
+        self.output = bytearray()
+        self.pending = bytearray()
+
+    def tell(self):
+        """Returns the (block position, offset) of the next byte"""
+        return len(self.output), len(self.pending)
+
+    def write(self, data):
+        """Adds the data, flushing the full blocks"""
+        self.pending += data
+        while len(self.pending) >= _METADATA_SIZE:
+            self._flush(bytes(self.pending[:_METADATA_SIZE]))
+            del self.pending[:_METADATA_SIZE]
+
+    def _flush(self, block):
+        """Writes one block, stored if it does not compress"""
+        compressed = _compress(self.compressor, block)
+        if len(compressed) < len(block):
+            self.output += struct.pack('<H', len(compressed)) + compressed
+        else:
+            self.output += struct.pack('<H', len(block) |
+                                       _METADATA_UNCOMPRESSED) + block
+
+    def finish(self):
+        """Returns the table, its last block flushed"""
+        if self.pending:
+            self._flush(bytes(self.pending))
+            self.pending = bytearray()
+        return bytes(self.output)
+
+
+class _SquashfsWriter(object):
+    """Lays out the image in memory, see make_squashfs()"""
+
+    def __init__(self, compressor, block_log, extended):
+        self.compressor = compressor
+        self.block_size = 1 << block_log
+        self.block_log = block_log
+        self.extended = extended
+        # the superblock is written last
+        self.data = bytearray(_SUPERBLOCK.size)
+        self.fragments = []
+        self.fragment = bytearray()
+        self.ids = []
+        self.inodes = _Metadata(compressor)
+        self.directories = _Metadata(compressor)
+        self.count = 0
+
+    def _id(self, value):
+        """Returns the id table index of the uid or gid"""
+        if value not in self.ids:
+            self.ids.append(value)
+        return self.ids.index(value)
+
+    def _block(self, block):
+        """Appends a data block, returns its size field"""
+        compressed = _compress(self.compressor, block)
+        if len(compressed) < len(block):
+            self.data += compressed
+            return len(compressed)
+        self.data += block
+        return len(block) | _DATA_UNCOMPRESSED
+
+    def _flush_fragment(self):
+        """Appends the pending fragment block"""
+        if self.fragment:
+            start = len(self.data)
+            self.fragments.append((start, self._block(bytes(self.fragment))))
+            self.fragment = bytearray()
+
+    def _file_data(self, path, size):
+        """Appends the file's blocks, returns (start, block sizes,
+        fragment index, fragment offset)"""
+        with open(path, 'rb') as source:
+            content = source.read()
+        start = len(self.data)
+        sizes = []
+        full = size // self.block_size
+        for index in range(full):
+            block = content[index * self.block_size:
+                            (index + 1) * self.block_size]
+            if block == bytes(self.block_size):
+                sizes.append(0)
+            else:
+                sizes.append(self._block(block))
+        tail = content[full * self.block_size:]
+        fragment, offset = _NO_FRAGMENT, 0
+        if tail:
+            if len(self.fragment) + len(tail) > self.block_size:
+                self._flush_fragment()
+            fragment, offset = len(self.fragments), len(self.fragment)
+            self.fragment += tail
+        return start, sizes, fragment, offset
+
+    def _header(self, kind, info):
+        """Returns the inode number and the packed common inode header"""
+        self.count += 1
+        kind += 7 if self.extended else 0
+        return self.count, struct.pack(
+            '<HHHHII', kind, stat.S_IMODE(info.st_mode),
+            self._id(info.st_uid), self._id(info.st_gid), int(info.st_mtime),
+            self.count)
+
+    def _inode(self, body):
+        """Writes the inode, returns its reference"""
+        block, offset = self.inodes.tell()
+        self.inodes.write(body)
+        return (block << 16) | offset
+
+    def _listing(self, children):
+        """Writes a directory's listing, returns its (block, offset, size)"""
+        block, offset = self.directories.tell()
+        listing = bytearray()
+        index = 0
+        while index < len(children):
+            start = children[index][1] >> 16
+            base = children[index][2]
+            group = []
+            while index < len(children) and len(group) < 256 and \
+                    children[index][1] >> 16 == start:
+                group.append(children[index])
+                index += 1
+            listing += struct.pack('<III', len(group) - 1, start, base)
+            for name, reference, number, kind in group:
+                listing += struct.pack('<HhHH', reference & 0xFFFF,
+                                       number - base, kind,
+                                       len(name) - 1) + name
+        self.directories.write(bytes(listing))
+        return block, offset, len(listing) + 3
+
+    def add(self, path):
+        """Writes the path's inode, and the inodes below a directory,
+        returns (inode reference, inode number, basic inode type)"""
+        info = os.lstat(path)
+        if stat.S_ISDIR(info.st_mode):
+            children = []
+            for name in sorted(os.listdir(path)):
+                children.append((name.encode(),) +
+                                self.add(os.path.join(path, name)))
+            block, offset, size = self._listing(children)
+            number, header = self._header(1, info)
+            links = 2 + sum(1 for x in children if x[3] == 1)
+            if self.extended:
+                body = struct.pack('<IIIIHHI', links, size, block, 0, 0,
+                                   offset, _NO_FRAGMENT)
+            else:
+                body = struct.pack('<IIHHI', block, links, size, offset, 0)
+            return self._inode(header + body), number, 1
+        if stat.S_ISREG(info.st_mode):
+            start, sizes, fragment, offset = self._file_data(path,
+                                                             info.st_size)
+            number, header = self._header(2, info)
+            if self.extended:
+                body = struct.pack('<QQQIIII', start, info.st_size, 0, 1,
+                                   fragment, offset, _NO_FRAGMENT)
+            else:
+                body = struct.pack('<IIII', start, fragment, offset,
+                                   info.st_size)
+            body += struct.pack('<%dI' % len(sizes), *sizes)
+            return self._inode(header + body), number, 2
+        if stat.S_ISLNK(info.st_mode):
+            target = os.readlink(path).encode()
+            number, header = self._header(3, info)
+            body = struct.pack('<II', 1, len(target)) + target
+            if self.extended:
+                body += struct.pack('<I', _NO_FRAGMENT)
+            return self._inode(header + body), number, 3
+        kind = 4 if stat.S_ISBLK(info.st_mode) else \
+            5 if stat.S_ISCHR(info.st_mode) else \
+            6 if stat.S_ISFIFO(info.st_mode) else 7
+        number, header = self._header(kind, info)
+        body = struct.pack('<I', 1)
+        if kind in (4, 5):
+            body += struct.pack('<I', info.st_rdev)
+        if self.extended:
+            body += struct.pack('<I', _NO_FRAGMENT)
+        return self._inode(header + body), number, kind
+
+    def _table(self, raw):
+        """Writes a lookup table's metadata blocks and their index,
+        returns the index position"""
+        blocks = []
+        for start in range(0, len(raw), _METADATA_SIZE):
+            blocks.append(len(self.data))
+            table = _Metadata(self.compressor)
+            table.write(raw[start:start + _METADATA_SIZE])
+            self.data += table.finish()
+        position = len(self.data)
+        self.data += struct.pack('<%dQ' % len(blocks), *blocks)
+        return position
+
+    def finish(self, root):
+        """Writes the tables and the superblock, returns the image"""
+        self._flush_fragment()
+        inode_table = len(self.data)
+        self.data += self.inodes.finish()
+        directory_table = len(self.data)
+        self.data += self.directories.finish()
+        fragment_table = self._table(b''.join(
+            struct.pack('<QII', start, size, 0)
+            for start, size in self.fragments))
+        id_table = self._table(struct.pack('<%dI' % len(self.ids),
+                                           *self.ids))
+        self.data[:_SUPERBLOCK.size] = _SUPERBLOCK.pack(
+            0x73717368, self.count, MTIME, self.block_size,
+            len(self.fragments), SQUASHFS_COMPRESSORS[self.compressor],
+            self.block_log, 0, len(self.ids), 4, 0, root, len(self.data),
+            id_table, _NO_TABLE, inode_table, directory_table,
+            fragment_table, _NO_TABLE)
+        self.data += bytes(-len(self.data) % 4096)
+        return bytes(self.data)
+
+
+def make_squashfs(source, image, compressor="gzip", block_log=12,
+                  extended=False):
+    """Writes the source tree into a squashfs 4.0 image
+
+    :param source: the directory to store
+    :type source: string
+    :param image: path to the image to write
+    :type image: string
+    :param compressor: 'gzip', 'xz' or 'zstd'
+    :type compressor: string
+    :param block_log: log2 of the data block size
+    :type block_log: integer
+    :param extended: write the extended inodes instead of the basic ones
+    :type extended: boolean
+    """
+    writer = _SquashfsWriter(compressor, block_log, extended)
+    root = writer.add(source)[0]
+    with open(image, 'wb') as output:
+        output.write(writer.finish(root))
+
+
+def listing_key(entry):
+    """Returns the fields of a ContentsEntry the listings must agree on"""
+    size = entry.size if stat.S_ISREG(entry.mode) else 0
+    return (entry.name, stat.S_IFMT(entry.mode), stat.S_IMODE(entry.mode),
+            size, entry.linkname)
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_detect.py
+
+Checks the archive format detection: the content sniffing of misnamed
+and extensionless archives with its (path, inode, mtime) cache, and the
+SuffixIndex extension matching against the search_order loop it
+replaced.
+
+"""
+
+import lzma
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from copy import deepcopy
+from unittest import mock
+
+from DeComp.compress import CompressMap
+from DeComp.contents import ContentsMap
+from DeComp.definitions import (CONTENTS_DEFINITIONS,
+                                CONTENTS_NATIVE_SEARCH_ORDER,
+                                CONTENTS_SEARCH_ORDER, DECOMPRESS_DEFINITIONS,
+                                DECOMPRESSOR_SEARCH_ORDER,
+                                DECOMPRESSOR_XATTR_SEARCH_ORDER,
+                                DEFINITION_DEFAULTS, DEFINITION_FIELDS)
+from DeComp.detect import clear_sniff_cache, sniff_format, SuffixIndex
+from DeComp.seekable import compress_stream
+from DeComp.utils import create_classes
+
+from tests.images import MTIME, make_tree
+
+
+# Overlapping extensions: pigz also handles tpz, raw any gz
+MODES = {
+    "gzip": ["_common", "tar", [], "GZIP", ["tar.gz", "gz"], {"tar"}],
+    "pigz": ["_common", "tar", [], "PIGZ", ["tar.gz", "tpz", "gz"],
+             {"tar", "pigz"}],
+    "raw": ["_common", "gzip", [], "RAW", ["gz"], {"gzip"}],
+    "tar": ["_common", "tar", [], "TAR", ["tar"], {"tar"}],
+}
+
+
+def linear_lookup(source, search_order, modes, available):
+    """The search_order loop determine_mode() ran before the index"""
+    for mode in search_order:
+        if mode in modes and modes[mode].enabled(available) and \
+                any(source.endswith(x) for x in modes[mode].extensions):
+            return mode
+    return None
+
+
+@unittest.skipUnless(shutil.which("tar"), "tar is missing")
+class TestSniffing(unittest.TestCase):
+    """determine_mode() and determine_modes() with and without sniffing"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        source = os.path.join(cls.tmp, "source")
+        make_tree(source)
+        cls.paths = {}
+        for name, mode in (("plain.tar", 'w'), ("misnamed.tar.xz", 'w:gz'),
+                           ("extensionless", 'w:gz')):
+            path = os.path.join(cls.tmp, name)
+            with tarfile.open(path, mode, format=tarfile.GNU_FORMAT) as tar:
+                tar.add(source, "source")
+            cls.paths[name] = path
+        cls.env = dict(os.environ)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def setUp(self):
+        clear_sniff_cache()
+
+    def decompress_map(self, sniff):
+        return CompressMap(deepcopy(DECOMPRESS_DEFINITIONS),
+                           search_order=DECOMPRESSOR_SEARCH_ORDER,
+                           env=self.env, sniff=sniff)
+
+    def test_suffix_only(self):
+        decompressor = self.decompress_map(False)
+        self.assertEqual(decompressor.determine_mode(self.paths["plain.tar"]),
+                         "tar")
+        self.assertEqual(
+            decompressor.determine_mode(self.paths["misnamed.tar.xz"]), "xz")
+        self.assertIsNone(
+            decompressor.determine_mode(self.paths["extensionless"]))
+
+    def test_sniffed(self):
+        decompressor = self.decompress_map(True)
+        self.assertEqual(decompressor.determine_mode(self.paths["plain.tar"]),
+                         "tar")
+        self.assertEqual(
+            decompressor.determine_mode(self.paths["misnamed.tar.xz"]),
+            "gzip")
+        self.assertEqual(
+            decompressor.determine_mode(self.paths["extensionless"]), "gzip")
+        # a missing file falls back to its extension
+        self.assertEqual(decompressor.determine_mode(
+            os.path.join(self.tmp, "missing.tar.xz")), "xz")
+
+    def test_contents_sniffed(self):
+        contents = ContentsMap(deepcopy(CONTENTS_DEFINITIONS), env=self.env,
+                               sniff=True)
+        self.assertEqual(contents.determine_mode(self.paths["extensionless"]),
+                         "gzip")
+        contents = ContentsMap(deepcopy(CONTENTS_DEFINITIONS), env=self.env)
+        self.assertIsNone(contents.determine_mode(self.paths["extensionless"]))
+
+    def test_determine_modes(self):
+        paths = sorted(self.paths.values())
+        decompressor = self.decompress_map(True)
+        # the extensions only by default, without reading the files
+        with mock.patch("DeComp.detect._read_format") as read_format:
+            modes = decompressor.determine_modes(paths)
+        self.assertFalse(read_format.called)
+        self.assertEqual(modes, {self.paths["plain.tar"]: "tar",
+                                 self.paths["misnamed.tar.xz"]: "xz",
+                                 self.paths["extensionless"]: None})
+        self.assertEqual(decompressor.determine_modes(paths, sniff=True),
+                         {self.paths["plain.tar"]: "tar",
+                          self.paths["misnamed.tar.xz"]: "gzip",
+                          self.paths["extensionless"]: "gzip"})
+
+    def test_seekable(self):
+        path = os.path.join(self.tmp, "seekable.tar.xz")
+        with open(self.paths["plain.tar"], 'rb') as stream, \
+                open(path, 'wb') as output:
+            with mock.patch("DeComp.seekable.find_binary", return_value=None):
+                compress_stream(stream, output, "xz", 4096)
+        self.assertEqual(sniff_format(path), "xz_seekable")
+        self.assertEqual(self.decompress_map(True).determine_mode(path),
+                         "xz_seekable")
+        self.assertEqual(self.decompress_map(False).determine_mode(path),
+                         "xz")
+
+
+class TestSniffCache(unittest.TestCase):
+    """The sniff results cached per (path, inode, mtime)"""
+
+    def setUp(self):
+        clear_sniff_cache()
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "archive")
+        self.write(b"\x1f\x8b" + bytes(100), MTIME)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        clear_sniff_cache()
+
+    def write(self, data, mtime):
+        with open(self.path, 'wb') as output:
+            output.write(data)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_cached(self):
+        self.assertEqual(sniff_format(self.path), "gzip")
+        with mock.patch("DeComp.detect._read_format") as read_format:
+            self.assertEqual(sniff_format(self.path), "gzip")
+        self.assertFalse(read_format.called)
+
+    def test_mtime_change(self):
+        self.assertEqual(sniff_format(self.path), "gzip")
+        self.write(lzma.compress(b"data"), MTIME + 1)
+        self.assertEqual(sniff_format(self.path), "xz")
+
+    def test_unchanged_mtime(self):
+        # the same inode and mtime is not read again
+        self.assertEqual(sniff_format(self.path), "gzip")
+        self.write(lzma.compress(b"data"), MTIME)
+        self.assertEqual(sniff_format(self.path), "gzip")
+        clear_sniff_cache()
+        self.assertEqual(sniff_format(self.path), "xz")
+
+    def test_not_a_file(self):
+        self.assertIsNone(sniff_format(self.tmp))
+        self.assertIsNone(sniff_format(os.path.join(self.tmp, "missing")))
+        self.write(b"neither", MTIME)
+        self.assertIsNone(sniff_format(self.path))
+
+
+class TestSuffixIndex(unittest.TestCase):
+    """SuffixIndex priorities and availability"""
+
+    def setUp(self):
+        self.modes = create_classes(deepcopy(MODES), list(DEFINITION_FIELDS),
+                                    DEFINITION_DEFAULTS)
+
+    def index(self, search_order, available, lazy=False):
+        return SuffixIndex(search_order, self.modes, available, lazy=lazy)
+
+    def test_priority(self):
+        available = {"tar", "pigz", "gzip"}
+        index = self.index(["pigz", "gzip", "tar"], available)
+        self.assertEqual(index.lookup("a.tar.gz"), "pigz")
+        index = self.index(["gzip", "pigz", "tar"], available)
+        self.assertEqual(index.lookup("a.tar.gz"), "gzip")
+        self.assertEqual(index.lookup("a.tpz"), "pigz")
+        self.assertEqual(index.lookup("a.tar"), "tar")
+
+    def test_priority_over_length(self):
+        # the search_order decides, not the longest extension matched
+        index = self.index(["raw", "gzip"], {"tar", "gzip"})
+        self.assertEqual(index.lookup("a.tar.gz"), "raw")
+        index = self.index(["gzip", "raw"], {"tar", "gzip"})
+        self.assertEqual(index.lookup("a.tar.gz"), "gzip")
+
+    def test_no_match(self):
+        index = self.index(["gzip", "tar"], {"tar"})
+        for source in ("a.zip", "z", "", "a.tar.gz.part"):
+            self.assertIsNone(index.lookup(source))
+        # the modes missing from the definitions are ignored
+        index = self.index(["missing", "tar"], {"tar"})
+        self.assertEqual(index.lookup("a.tar"), "tar")
+
+    def test_unavailable(self):
+        available = {"tar"}
+        index = self.index(["pigz", "raw", "gzip", "tar"], available)
+        self.assertEqual(index.lookup("a.tar.gz"), "gzip")
+        self.assertIsNone(index.lookup("a.tpz"))
+        # the availability is only checked once, when indexing
+        available.add("pigz")
+        self.assertIsNone(index.lookup("a.tpz"))
+
+    def test_lazy(self):
+        available = {"tar"}
+        index = self.index(["pigz", "raw", "gzip", "tar"], available,
+                           lazy=True)
+        self.assertEqual(index.lookup("a.tar.gz"), "gzip")
+        self.assertIsNone(index.lookup("a.tpz"))
+        available.add("pigz")
+        self.assertEqual(index.lookup("a.tpz"), "pigz")
+        self.assertEqual(index.lookup("a.tar.gz"), "pigz")
+
+    def test_search_order_loop(self):
+        for definitions, search_order in (
+                (DECOMPRESS_DEFINITIONS, DECOMPRESSOR_SEARCH_ORDER),
+                (DECOMPRESS_DEFINITIONS, DECOMPRESSOR_XATTR_SEARCH_ORDER),
+                (CONTENTS_DEFINITIONS, CONTENTS_SEARCH_ORDER),
+                (CONTENTS_DEFINITIONS, CONTENTS_NATIVE_SEARCH_ORDER)):
+            definitions = deepcopy(definitions)
+            definitions.pop("Type", None)
+            modes = create_classes(definitions, list(DEFINITION_FIELDS),
+                                   DEFINITION_DEFAULTS)
+            extensions = set()
+            for mode in modes.values():
+                extensions.update(mode.extensions or [])
+            # all but one of the needed binaries, so the availability
+            # filtering is exercised as well
+            binaries = set()
+            for mode in search_order:
+                binaries.update(modes[mode].binaries if mode in modes
+                                else [])
+            available = set(sorted(binaries)[1:])
+            index = SuffixIndex(search_order, modes, available)
+            for ext in sorted(extensions):
+                for source in ("a." + ext, "a" + ext, ext[1:]):
+                    self.assertEqual(
+                        index.lookup(source),
+                        linear_lookup(source, search_order, modes, available),
+                        source)
+
+
+if __name__ == '__main__':
+    unittest.main()
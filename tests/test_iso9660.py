@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_iso9660.py
+
+Checks the in process ISO9660 reader against the images of tests/data,
+written by pycdlib (see tests/data/make_isos.py), and against
+`isoinfo -l` when it is installed.
+
+"""
+
+import gzip
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import unittest
+from copy import deepcopy
+
+from DeComp.contents import ContentsMap
+from DeComp.definitions import (CONTENTS_DEFINITIONS,
+                                CONTENTS_NATIVE_SEARCH_ORDER)
+from DeComp.iso9660 import IsoError, IsoImage
+from DeComp.parsers import parse_isoinfo_l
+
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+BIG = bytes(range(256)) * 40
+HELLO = b"hello world\n"
+DEEP = '/'.join("d%d" % x for x in range(10))
+
+PLAIN = [
+    ("DIR1", stat.S_IFDIR, 0),
+    ("DIR1/SUB", stat.S_IFDIR, 0),
+    ("DIR1/SUB/BIG.BIN", stat.S_IFREG, len(BIG)),
+    ("HELLO.TXT", stat.S_IFREG, len(HELLO)),
+]
+
+JOLIET = [
+    ("dir_one", stat.S_IFDIR, 0),
+    ("dir_one/sub", stat.S_IFDIR, 0),
+    ("dir_one/sub/big.bin", stat.S_IFREG, len(BIG)),
+    ("hello.txt", stat.S_IFREG, len(HELLO)),
+]
+
+ROCK_RIDGE = [
+    (DEEP[:2 + x * 3], stat.S_IFDIR, 0) for x in range(10)] + [
+    (DEEP + "/deep.txt", stat.S_IFREG, 5),
+    ("dir_one", stat.S_IFDIR, 0),
+    ("dir_one/sub", stat.S_IFDIR, 0),
+    ("dir_one/sub/big.bin", stat.S_IFREG, len(BIG)),
+    ("hello.txt", stat.S_IFREG, len(HELLO)),
+    ("link", stat.S_IFLNK, 0),
+    ("rr_moved", stat.S_IFDIR, 0),
+]
+
+
+def _key(entry):
+    """Returns the (name, type, size) of a ContentsEntry,
+    the size of regular files only"""
+    size = entry.size if stat.S_ISREG(entry.mode) else 0
+    return entry.name, stat.S_IFMT(entry.mode), size
+
+
+def _plain(name):
+    """Strips the ISO9660 file versions and empty extensions off a path"""
+    return '/'.join(x.split(';', 1)[0].rstrip('.') for x in name.split('/'))
+
+
+class IsoTestCase(unittest.TestCase):
+    """Unpacks the gzipped fixtures into a temporary directory"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.images = {}
+        for name in ("plain", "joliet", "rockridge"):
+            path = os.path.join(cls.tmp, name + ".iso")
+            with gzip.open(os.path.join(DATA, name + ".iso.gz")) as fixture:
+                with open(path, 'wb') as output:
+                    shutil.copyfileobj(fixture, output)
+            cls.images[name] = path
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+
+class TestIsoImage(IsoTestCase):
+    """IsoImage listings and reads"""
+
+    def listing(self, name, **kwargs):
+        with IsoImage(self.images[name], **kwargs) as image:
+            return image.extension, [_key(x) for x in image.entries()]
+
+    def test_plain(self):
+        self.assertEqual(self.listing("plain"), (None, PLAIN))
+        with IsoImage(self.images["plain"]) as image:
+            self.assertEqual(image.volume_id, "DECOMP")
+            self.assertEqual(image.read("DIR1/SUB/BIG.BIN"), BIG)
+
+    def test_joliet(self):
+        self.assertEqual(self.listing("joliet"), ("joliet", JOLIET))
+        self.assertEqual(self.listing("joliet", joliet=False), (None, PLAIN))
+
+    def test_rock_ridge(self):
+        self.assertEqual(self.listing("rockridge"), ("rockridge", ROCK_RIDGE))
+        with IsoImage(self.images["rockridge"]) as image:
+            entries = {x.name: x for x in image.entries()}
+            self.assertEqual(stat.S_IMODE(entries["hello.txt"].mode), 0o600)
+            self.assertEqual(entries["link"].linkname, "dir_one/sub/big.bin")
+            self.assertEqual(entries["link"].size, len("dir_one/sub/big.bin"))
+            self.assertTrue(all(x.mtime > 0 for x in entries.values()))
+            self.assertEqual(image.read("hello.txt"), HELLO)
+            self.assertEqual(image.read(DEEP + "/deep.txt"), b"deep\n")
+
+    def test_rock_ridge_disabled(self):
+        extension, listing = self.listing("rockridge", rock_ridge=False)
+        self.assertEqual(extension, "joliet")
+        self.assertIn(("hello.txt", stat.S_IFREG, len(HELLO)), listing)
+        self.assertIn(("link", stat.S_IFREG, 0), listing)
+
+    def test_extents(self):
+        with IsoImage(self.images["joliet"]) as image:
+            views = image.extents("dir_one/sub/big.bin")
+            self.assertTrue(all(isinstance(x, memoryview) for x in views))
+            self.assertEqual(b''.join(views), BIG)
+            for view in views:
+                view.release()
+
+    def test_read_errors(self):
+        with IsoImage(self.images["rockridge"]) as image:
+            self.assertRaises(IsoError, image.read, "dir_one")
+            self.assertRaises(IsoError, image.read, "link")
+            self.assertRaises(IsoError, image.read, "missing")
+            self.assertRaises(IsoError, image.read, "hello.txt/x")
+
+    def test_not_an_image(self):
+        path = os.path.join(self.tmp, "zeros.iso")
+        with open(path, 'wb') as output:
+            output.write(bytes(64 * 1024))
+        self.assertRaises(IsoError, IsoImage, path)
+
+
+class TestIsoContents(IsoTestCase):
+    """The py_iso9660 contents mode"""
+
+    def contents_map(self, search_order=None):
+        return ContentsMap(deepcopy(CONTENTS_DEFINITIONS),
+                           search_order=search_order, env=dict(os.environ))
+
+    def test_native_search_order(self):
+        contents = self.contents_map(CONTENTS_NATIVE_SEARCH_ORDER)
+        path = self.images["rockridge"]
+        self.assertEqual(contents.determine_mode(path), "py_iso9660")
+        table = contents.entries(path, "py_iso9660")
+        self.assertEqual([_key(x) for x in table], ROCK_RIDGE)
+        self.assertEqual(contents.read_member(path, "dir_one/sub/big.bin"),
+                         BIG)
+
+    def test_default_search_order(self):
+        contents = self.contents_map()
+        self.assertNotEqual(contents.determine_mode(self.images["plain"]),
+                            "py_iso9660")
+
+    @unittest.skipUnless(shutil.which("isoinfo"), "isoinfo is missing")
+    def test_isoinfo_l(self):
+        for name, args, joliet in (("plain", [], False),
+                                   ("joliet", ["-J"], True)):
+            path = self.images[name]
+            output = subprocess.run(["isoinfo", "-l", "-i", path] + args,
+                                    stdout=subprocess.PIPE, check=True,
+                                    universal_newlines=True).stdout
+            listed = sorted((_plain(x.name), stat.S_IFMT(x.mode), x.size if
+                             stat.S_ISREG(x.mode) else 0)
+                            for x in parse_isoinfo_l(output.splitlines()))
+            with IsoImage(path, joliet=joliet) as image:
+                native = sorted(_key(x) for x in image.entries())
+            self.assertEqual(native, listed)
+
+
+if __name__ == '__main__':
+    unittest.main()
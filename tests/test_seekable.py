@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_seekable.py
+
+Checks the seekable multi-frame zstd and xz archives: the frames written,
+the seek tables read back, the parallel and random access reads, the
+regular decompressors and the contents listing against `tar -tv`.
+
+"""
+
+import lzma
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import unittest
+from copy import deepcopy
+from unittest import mock
+
+from DeComp.compress import CompressMap
+from DeComp.contents import ContentsMap
+from DeComp.definitions import (CONTENTS_DEFINITIONS,
+                                DECOMPRESS_DEFINITIONS,
+                                DECOMPRESSOR_SEARCH_ORDER)
+from DeComp.parsers import parse_tar_tv
+from DeComp.seekable import (compress_stream, decompress_stream, is_seekable,
+                             read_frames, SeekableFile, ZSTD_IN_PROCESS)
+
+from tests.images import listing_key, make_tree
+
+
+FRAME_SIZE = 4096
+
+# The test tree's member spanning the most frames
+MEMBER = "dir/sub/data.bin"
+
+HAVE_ZSTD = ZSTD_IN_PROCESS or shutil.which("zstd") is not None
+
+
+class SeekableTestCase(unittest.TestCase):
+    """Builds the test tree's tar once"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        source = os.path.join(cls.tmp, "source")
+        cls.files = make_tree(source)
+        cls.tar = os.path.join(cls.tmp, "tree.tar")
+        with tarfile.open(cls.tar, 'w', format=tarfile.GNU_FORMAT) as tar:
+            for name in sorted(os.listdir(source)):
+                tar.add(os.path.join(source, name), name)
+        with open(cls.tar, 'rb') as data:
+            cls.data = data.read()
+        cls.env = dict(os.environ)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def archive(self, codec, name=None):
+        """Compresses the tar into a seekable archive, returns its path"""
+        path = os.path.join(self.tmp, name or "tree.tar." + codec)
+        with open(self.tar, 'rb') as stream, open(path, 'wb') as output:
+            count = compress_stream(stream, output, codec, FRAME_SIZE,
+                                    threads=2, env=self.env)
+        self.assertEqual(count, -(-len(self.data) // FRAME_SIZE))
+        return path
+
+    def check_archive(self, path, codec):
+        frames = read_frames(path, codec)
+        self.assertEqual(len(frames), -(-len(self.data) // FRAME_SIZE))
+        self.assertEqual([x.data_size for x in frames[:-1]],
+                         [FRAME_SIZE] * (len(frames) - 1))
+        self.assertEqual(sum(x.data_size for x in frames), len(self.data))
+        self.assertTrue(is_seekable(path, codec))
+        self.assertEqual(b''.join(decompress_stream(path, frames, codec,
+                                                    threads=2, env=self.env)),
+                         self.data)
+        with SeekableFile(path, frames, codec, env=self.env) as reader:
+            self.assertEqual(reader.size, len(self.data))
+            for offset in (FRAME_SIZE * 2 - 10, 0, len(self.data) - 3):
+                reader.seek(offset)
+                self.assertEqual(reader.read(100),
+                                 self.data[offset:offset + 100])
+            # only the frames read from were decompressed
+            self.assertEqual(reader.decoded, 4)
+            reader.seek(0)
+            self.assertEqual(reader.read(), self.data)
+        with SeekableFile(path, frames, codec, env=self.env) as reader:
+            with tarfile.open(fileobj=reader, mode='r:') as tar:
+                self.assertEqual(tar.extractfile(MEMBER).read(),
+                                 self.files[MEMBER])
+
+
+class TestSeekableXz(SeekableTestCase):
+    """The xz blocks, written by the xz utility or the lzma module"""
+
+    @unittest.skipUnless(shutil.which("xz"), "xz is missing")
+    def test_xz_utility(self):
+        path = self.archive("xz")
+        self.check_archive(path, "xz")
+        with lzma.open(path) as archive:
+            self.assertEqual(archive.read(), self.data)
+
+    def test_lzma_module(self):
+        with mock.patch("DeComp.seekable.find_binary", return_value=None):
+            path = self.archive("xz", "lzma.tar.xz")
+        self.check_archive(path, "xz")
+        with lzma.open(path) as archive:
+            self.assertEqual(archive.read(), self.data)
+
+    def test_extract_members(self):
+        with mock.patch("DeComp.seekable.find_binary", return_value=None):
+            path = self.archive("xz", "members.tar.xz")
+        destination = os.path.join(self.tmp, "members")
+        os.makedirs(destination)
+        decompressor = CompressMap(deepcopy(DECOMPRESS_DEFINITIONS),
+                                   search_order=DECOMPRESSOR_SEARCH_ORDER,
+                                   env=self.env)
+        self.assertTrue(decompressor.extract_members(
+            path, [MEMBER], destination, mode="xz_seekable"))
+        with open(os.path.join(destination, MEMBER), 'rb') as member:
+            self.assertEqual(member.read(), self.files[MEMBER])
+        self.assertEqual(os.listdir(destination), ["dir"])
+
+    def test_regular_xz(self):
+        path = os.path.join(self.tmp, "regular.tar.xz")
+        with open(path, 'wb') as output:
+            output.write(lzma.compress(self.data))
+        self.assertIsNone(read_frames(path, "xz"))
+        self.assertFalse(is_seekable(path, "xz"))
+
+
+@unittest.skipUnless(HAVE_ZSTD, "no zstd module or utility")
+class TestSeekableZstd(SeekableTestCase):
+    """The zstd frames and seek table"""
+
+    def test_zstd(self):
+        path = self.archive("zstd")
+        self.check_archive(path, "zstd")
+
+    @unittest.skipUnless(shutil.which("zstd"), "zstd is missing")
+    def test_zstd_utility(self):
+        path = self.archive("zstd")
+        output = subprocess.run(["zstd", "-q", "-d", "-c", path],
+                                stdout=subprocess.PIPE, check=True).stdout
+        self.assertEqual(output, self.data)
+
+    @unittest.skipUnless(shutil.which("zstd"), "zstd is missing")
+    def test_regular_zstd(self):
+        path = os.path.join(self.tmp, "regular.tar.zst")
+        subprocess.run(["zstd", "-q", "-f", self.tar, "-o", path], check=True)
+        self.assertIsNone(read_frames(path, "zstd"))
+        self.assertFalse(is_seekable(path, "zstd"))
+
+
+@unittest.skipUnless(shutil.which("tar"), "tar is missing")
+class TestSeekableContents(SeekableTestCase):
+    """The seekable contents modes against `tar -tv`"""
+
+    def tar_tv(self):
+        output = subprocess.run(["tar", "-tvf", self.tar],
+                                stdout=subprocess.PIPE, check=True,
+                                universal_newlines=True).stdout
+        return [listing_key(x) for x in parse_tar_tv(output.splitlines())]
+
+    def check_listing(self, path, mode):
+        contents = ContentsMap(deepcopy(CONTENTS_DEFINITIONS), env=self.env)
+        table = contents.list_entries(path, mode)
+        self.assertIsNotNone(table)
+        self.assertEqual([listing_key(x) for x in table], self.tar_tv())
+        lines = list(contents.contents_iter(path, mode))
+        self.assertEqual([listing_key(x) for x in parse_tar_tv(lines)],
+                         self.tar_tv())
+
+    def test_xz_seekable(self):
+        with mock.patch("DeComp.seekable.find_binary", return_value=None):
+            path = self.archive("xz", "contents.tar.xz")
+        self.check_listing(path, "xz_seekable")
+
+    @unittest.skipUnless(HAVE_ZSTD, "no zstd module or utility")
+    def test_zstd_seekable(self):
+        self.check_listing(self.archive("zstd", "contents.tar.zst"),
+                           "zstd_seekable")
+
+
+if __name__ == '__main__':
+    unittest.main()
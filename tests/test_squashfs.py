@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_squashfs.py
+
+Checks the in process squashfs reader against images written from a
+test tree, and against `unsquashfs -ll` when it is installed.
+
+"""
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from copy import deepcopy
+
+from DeComp.contents import ContentsMap
+from DeComp.definitions import (CONTENTS_DEFINITIONS,
+                                CONTENTS_NATIVE_SEARCH_ORDER)
+from DeComp.seekable import ZSTD_IN_PROCESS
+from DeComp.squashfs import SquashfsError, SquashfsImage, UnsupportedImage
+
+from tests.images import (MTIME, can_compress, listing_key, make_squashfs,
+                          make_tree)
+
+
+EXPECTED = [
+    ("dir", stat.S_IFDIR),
+    ("dir/fifo", stat.S_IFIFO),
+    ("dir/link", stat.S_IFLNK),
+    ("dir/random.bin", stat.S_IFREG),
+    ("dir/sparse.bin", stat.S_IFREG),
+    ("dir/sub", stat.S_IFDIR),
+    ("dir/sub/data.bin", stat.S_IFREG),
+    ("empty", stat.S_IFREG),
+    ("hello.txt", stat.S_IFREG),
+]
+
+
+class SquashfsTestCase(unittest.TestCase):
+    """Builds the test tree once for the image tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.source = os.path.join(cls.tmp, "source")
+        cls.files = make_tree(cls.source)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def image(self, compressor, extended=False):
+        """Writes the test tree's image, returns its path"""
+        if not can_compress(compressor):
+            self.skipTest("can not write %s images" % compressor)
+        path = os.path.join(self.tmp, "%s%s.squashfs"
+                            % (compressor, "_ext" if extended else ""))
+        if not os.path.exists(path):
+            make_squashfs(self.source, path, compressor, extended=extended)
+        return path
+
+    def contents_map(self, search_order=None):
+        """Returns a ContentsMap using the test's environment"""
+        return ContentsMap(deepcopy(CONTENTS_DEFINITIONS),
+                           search_order=search_order, env=dict(os.environ))
+
+
+class TestSquashfsImage(SquashfsTestCase):
+    """SquashfsImage listings and reads"""
+
+    def check_image(self, path):
+        with SquashfsImage(path) as image:
+            entries = list(image.entries())
+            self.assertEqual([(x.name, stat.S_IFMT(x.mode)) for x in entries],
+                             EXPECTED)
+            by_name = {x.name: x for x in entries}
+            for name, data in self.files.items():
+                self.assertEqual(by_name[name].size, len(data))
+                self.assertEqual(image.read(name), data)
+            self.assertEqual(stat.S_IMODE(by_name["hello.txt"].mode), 0o600)
+            self.assertEqual(by_name["dir/link"].linkname, "sub/data.bin")
+            self.assertEqual(by_name["dir/link"].size, len("sub/data.bin"))
+            self.assertTrue(all(x.mtime == MTIME for x in entries))
+            self.assertTrue(all(x.uid == os.getuid() for x in entries))
+
+    def test_gzip(self):
+        self.check_image(self.image("gzip"))
+
+    def test_xz(self):
+        self.check_image(self.image("xz"))
+
+    def test_extended_inodes(self):
+        self.check_image(self.image("gzip", extended=True))
+
+    @unittest.skipUnless(ZSTD_IN_PROCESS, "no zstd module")
+    def test_zstd(self):
+        self.check_image(self.image("zstd"))
+
+    @unittest.skipIf(ZSTD_IN_PROCESS, "the zstd module is installed")
+    def test_zstd_without_module(self):
+        path = self.image("zstd")
+        with self.assertRaises(UnsupportedImage):
+            SquashfsImage(path)
+
+    def test_metadata_across_blocks(self):
+        # the inode and directory tables span several metadata blocks
+        source = os.path.join(self.tmp, "many")
+        names = ["file_%04d_%s" % (x, "n" * 40) for x in range(600)]
+        os.makedirs(source)
+        for name in names:
+            with open(os.path.join(source, name), 'wb') as output:
+                output.write(name.encode())
+        path = os.path.join(self.tmp, "many.squashfs")
+        make_squashfs(source, path, "gzip")
+        with SquashfsImage(path) as image:
+            self.assertEqual([x.name for x in image.entries()], names)
+            self.assertEqual(image.read(names[-1]), names[-1].encode())
+
+    def test_read_errors(self):
+        with SquashfsImage(self.image("gzip")) as image:
+            self.assertRaises(SquashfsError, image.read, "dir")
+            self.assertRaises(SquashfsError, image.read, "dir/missing")
+            self.assertRaises(SquashfsError, image.read, "hello.txt/x")
+
+    def test_not_an_image(self):
+        path = os.path.join(self.tmp, "hello.txt.img")
+        shutil.copy(os.path.join(self.source, "hello.txt"), path)
+        self.assertRaises(SquashfsError, SquashfsImage, path)
+
+
+class TestSquashfsContents(SquashfsTestCase):
+    """The py_squashfs contents mode"""
+
+    def test_native_search_order(self):
+        contents = self.contents_map(CONTENTS_NATIVE_SEARCH_ORDER)
+        path = self.image("gzip")
+        self.assertEqual(contents.determine_mode(path), "py_squashfs")
+        table = contents.entries(path, "py_squashfs")
+        self.assertEqual([(x.name, stat.S_IFMT(x.mode)) for x in table],
+                         EXPECTED)
+        self.assertEqual(contents.read_member(path, "dir/sub/data.bin"),
+                         self.files["dir/sub/data.bin"])
+
+    def test_default_search_order(self):
+        contents = self.contents_map()
+        self.assertNotEqual(contents.determine_mode(self.image("gzip")),
+                            "py_squashfs")
+
+    @unittest.skipUnless(shutil.which("unsquashfs"), "unsquashfs is missing")
+    def test_unsquashfs_ll(self):
+        contents = self.contents_map(CONTENTS_NATIVE_SEARCH_ORDER)
+        for compressor in ("gzip", "xz"):
+            path = self.image(compressor)
+            native = contents.list_entries(path, "py_squashfs")
+            listed = contents.list_entries(path, "squashfs")
+            self.assertIsNotNone(listed)
+            self.assertEqual([listing_key(x) for x in native],
+                             [listing_key(x) for x in listed])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_treecopy.py
+
+Checks the native tree copy used by CompressMap.rsync() for the local
+transfers, and the sharded rsync split, against a real
+`rsync -a --delete` run when rsync is installed.
+
+"""
+
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from copy import deepcopy
+from unittest import mock
+
+from DeComp.compress import CompressMap
+from DeComp.definitions import COMPRESS_DEFINITIONS
+from DeComp.treecopy import TreeCopy
+from DeComp.utils import run_command
+
+from tests.images import MTIME, make_tree
+
+
+def snapshot(root):
+    """Returns the comparable state of a tree: per relative path, its
+    type, permissions, owner, mtime and content hash or link target"""
+    state = {}
+    for directory, dirs, names in os.walk(root):
+        for name in dirs + names:
+            path = os.path.join(directory, name)
+            info = os.lstat(path)
+            if stat.S_ISREG(info.st_mode):
+                with open(path, 'rb') as data:
+                    content = hashlib.sha256(data.read()).hexdigest()
+            elif stat.S_ISLNK(info.st_mode):
+                content = os.readlink(path)
+            else:
+                content = None
+            # the symlink times are not compared, rsync may not set them
+            mtime = None if stat.S_ISLNK(info.st_mode) else int(info.st_mtime)
+            state[os.path.relpath(path, root)] = (
+                stat.S_IFMT(info.st_mode), stat.S_IMODE(info.st_mode),
+                info.st_uid, info.st_gid, mtime, content)
+    return state
+
+
+def stale_target(path):
+    """Fills a destination with what the copy has to replace or delete"""
+    os.makedirs(os.path.join(path, "dir", "sub", "gone"))
+    os.makedirs(os.path.join(path, "hello.txt"))
+    with open(os.path.join(path, "extra.txt"), 'wb') as output:
+        output.write(b"extraneous\n")
+    with open(os.path.join(path, "dir", "sub", "gone", "file"), 'wb') as output:
+        output.write(b"extraneous\n")
+    os.symlink("elsewhere", os.path.join(path, "dir", "random.bin"))
+    os.symlink("elsewhere", os.path.join(path, "dir", "link"))
+    # same size and mtime, only its metadata is updated, as rsync does
+    quick = os.path.join(path, "dir", "sparse.bin")
+    with open(quick, 'wb') as output:
+        output.write(b"x" * (100 + 8192 + 100))
+    os.utime(quick, (MTIME, MTIME))
+
+
+class TreeCopyTestCase(unittest.TestCase):
+    """A fresh source tree for each test"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp, "source")
+        make_tree(self.source)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def target(self, name, stale=False):
+        """Returns a destination path, filled for the copy to update"""
+        path = os.path.join(self.tmp, name)
+        if stale:
+            stale_target(path)
+        return path
+
+    def compress_map(self):
+        return CompressMap(deepcopy(COMPRESS_DEFINITIONS),
+                           env=dict(os.environ))
+
+
+class TestTreeCopy(TreeCopyTestCase):
+    """TreeCopy on its own"""
+
+    def test_copy(self):
+        target = self.target("copy")
+        copier = TreeCopy(max_workers=2)
+        self.assertTrue(copier.copy(self.source, target))
+        self.assertEqual(snapshot(target), snapshot(self.source))
+        self.assertEqual(os.stat(target).st_mtime_ns,
+                         os.stat(self.source).st_mtime_ns)
+        self.assertEqual(copier.stats['errors'], 0)
+        self.assertEqual(copier.stats['deleted'], 0)
+
+    def test_update(self):
+        target = self.target("update", stale=True)
+        copier = TreeCopy(max_workers=2)
+        self.assertTrue(copier.copy(self.source, target))
+        expected = snapshot(self.source)
+        result = snapshot(target)
+        # the size and mtime quick check keeps the stale content
+        self.assertNotEqual(result.pop("dir/sparse.bin")[5],
+                            expected.pop("dir/sparse.bin")[5])
+        self.assertEqual(result, expected)
+        self.assertEqual(copier.stats['skipped'], 1)
+        # extra.txt and dir/sub/gone, the entries of another type are
+        # replaced in place
+        self.assertEqual(copier.stats['deleted'], 2)
+
+    def test_unchanged(self):
+        target = self.target("unchanged")
+        self.assertTrue(TreeCopy().copy(self.source, target))
+        copier = TreeCopy()
+        self.assertTrue(copier.copy(self.source, target))
+        self.assertEqual(copier.stats['files'], 0)
+        self.assertEqual(copier.stats['skipped'], 7)
+        self.assertEqual(snapshot(target), snapshot(self.source))
+
+    def test_worker_failure(self):
+        target = self.target("failure")
+        copier = TreeCopy(max_workers=2)
+        with mock.patch("DeComp.treecopy._clone",
+                        side_effect=ValueError("clone failed")):
+            self.assertFalse(copier.copy(self.source, target))
+        # the five regular files failed, the others were copied
+        self.assertEqual(copier.stats['errors'], 5)
+        self.assertTrue(os.path.islink(os.path.join(target, "dir", "link")))
+        # and their temporary files were removed
+        self.assertEqual(os.listdir(target), ["dir"])
+        self.assertEqual(sorted(os.listdir(os.path.join(target, "dir"))),
+                         ["fifo", "link", "sub"])
+
+    def test_native_rsync(self):
+        target = self.target("native", stale=True)
+        result = self.compress_map().rsync(source=self.source + '/',
+                                           destination=target)
+        self.assertTrue(result)
+        self.assertEqual(result.extra['transfer']['method'], 'native')
+        self.assertNotIn("extra.txt", os.listdir(target))
+
+
+@unittest.skipUnless(shutil.which("rsync"), "rsync is missing")
+class TestTreeCopyRsync(TreeCopyTestCase):
+    """TreeCopy and the sharded rsync against `rsync -a --delete`"""
+
+    def rsync(self, name, stale):
+        """Runs `rsync -a --delete`, returns the destination's snapshot"""
+        target = self.target(name, stale)
+        stats = run_command(["rsync", "-a", "--delete", self.source + '/',
+                             target], "RSYNC", env=dict(os.environ))
+        self.assertEqual(stats.returncode, 0)
+        return snapshot(target)
+
+    def test_copy(self):
+        target = self.target("native")
+        self.assertTrue(TreeCopy().copy(self.source, target))
+        self.assertEqual(snapshot(target), self.rsync("rsync", False))
+
+    def test_update(self):
+        target = self.target("native", stale=True)
+        self.assertTrue(TreeCopy().copy(self.source, target))
+        self.assertEqual(snapshot(target), self.rsync("rsync", True))
+
+    def test_trailing_slash(self):
+        target = self.target("native")
+        os.makedirs(target)
+        result = self.compress_map().rsync(source=self.source,
+                                           destination=target)
+        self.assertEqual(result.extra['transfer']['method'], 'native')
+        expected = self.target("rsync")
+        os.makedirs(expected)
+        stats = run_command(["rsync", "-a", "--delete", self.source,
+                             expected], "RSYNC", env=dict(os.environ))
+        self.assertEqual(stats.returncode, 0)
+        self.assertEqual(snapshot(target), snapshot(expected))
+
+    def test_sharded(self):
+        for stale in (False, True):
+            target = self.target("sharded%d" % stale, stale)
+            result = self.compress_map().rsync(
+                source=self.source + '/', destination=target, native=False,
+                shards=2)
+            self.assertTrue(result)
+            self.assertEqual(result.extra['transfer']['method'], 'sharded')
+            self.assertEqual(snapshot(target),
+                             self.rsync("rsync%d" % stale, stale))
+
+
+if __name__ == '__main__':
+    unittest.main()